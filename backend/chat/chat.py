@@ -1,20 +1,26 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Query, WebSocket, WebSocketDisconnect, WebSocketException
+from sqlalchemy import case
 from sqlalchemy.orm import Session
 from datetime import datetime
-from typing import List, Tuple
-import os, json, random
+from typing import List, Optional, Tuple
+import os, json, random, asyncio, logging
 import numpy as np
 
 from . import models, schemas
-from ..login.models import AnonymousIdentity, User
-from ..login.auth import get_current_active_user
+from ..login.models import AnonymousIdentity
+from ..login.auth import get_current_active_user, TokenUser
+from ..login.identity_cache import identity_cache
 from ..login.database import engine, SessionLocal, get_db, Base
-from ..topic.model import APost
+from .hub import get_chat_hub
+from .recommend import RecommendCandidates
+from .privacy import PrivacyLedger
+from ..topic.model import APost, PostLike
 from pydantic import BaseModel
 
 Base.metadata.create_all(bind=engine)
 
 app = FastAPI()
+logger = logging.getLogger(__name__)
 
 py_dir = os.path.dirname(__file__)
 
@@ -24,14 +30,26 @@ with open(f"{py_dir}/config.json", "r") as file:
 noise_scale = config_dic['sensitivity']/config_dic["epsilion"]
 
 def add_noise(query_result):
-    noise = np.random.laplace(0, noise_scale)
+    # 对标量或数组逐元素加噪声，整个得分向量只需一次调用
+    noise = np.random.laplace(0, noise_scale, size=np.shape(query_result))
     return query_result + noise
 
+# 推荐候选由后台定期重算（应用启动时启动，多个worker中只有持有锁文件的一个重算），请求时只读取
+recommend_candidates = RecommendCandidates(
+    get_db, config_dic["same_friend_val"], config_dic["same_like_val"], top_k=5*config_dic["max_recommend"],
+    lock_path="./recommend_refresh.lock"
+)
+# 每个身份的加噪声推荐结果在有效期内复用，预算记在数据库中，用完后不再重新加噪声
+privacy_ledger = PrivacyLedger(
+    get_db, config_dic["epsilion"], config_dic["privacy_budget"],
+    period=config_dic["privacy_budget_period"], ttl=config_dic["recommend_cache_ttl"]
+)
+
 # 辅助函数：获取身份ID
-def get_identity_id(db: Session, nickname: str):
-    identity = db.query(models.AnonymousIdentity).filter_by(nickname=nickname).first()
+# 写操作传入refresh=True，昵称被删除后重新分配时不会写到已删除身份的ID上
+def get_identity_id(db: Session, nickname: str, refresh: bool = False):
+    identity = identity_cache.resolve(db, nickname, refresh)
     if not identity:
-        breakpoint()
         raise HTTPException(status_code=404, detail="Identity not found")
     return identity.id
 
@@ -42,10 +60,22 @@ def get_publickey(db: Session, nickname: str):
         raise HTTPException(status_code=404, detail="Identity not found")
     return identity.publickey
 
+# 辅助函数：读取预先计算的候选，排除后加噪声排序
+def noisy_ranking(db: Session, identity_id: int, exclude_id: set) -> List[Tuple[int, str]]:
+    rows = [row for row in db.query(
+        models.RecommendCandidate.candidate_id, models.RecommendCandidate.score, AnonymousIdentity.nickname
+    ).join(
+        AnonymousIdentity, AnonymousIdentity.id == models.RecommendCandidate.candidate_id
+    ).filter(
+        models.RecommendCandidate.identity_id == identity_id
+    ).all() if row.candidate_id not in exclude_id]
+    noisy_scores = add_noise(np.array([row.score for row in rows], dtype=np.float64))
+    return [(rows[i].candidate_id, rows[i].nickname) for i in np.argsort(-noisy_scores)]
+
 @app.get("/recommend")
 def recommend_people(
     nickname: str = Query(...),
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     if nickname not in user[1]:
@@ -62,43 +92,13 @@ def recommend_people(
         tar_indentityi = chat_invitation.src_identity_id if chat_invitation.dst_identity_id == identity_id else chat_invitation.dst_identity_id
         exclude_id.add(tar_indentityi)
 
-    recommend_dic:dict[str, int] = {}
-    # add chat values
-    chats = db.query(models.Chat).filter(
-        (models.Chat.src_identity_id == identity_id) | (models.Chat.dst_identity_id == identity_id)
-    ).order_by(models.Chat.last_update.desc()).limit(20).all()
-    for chati in chats:
-        tar_indentityi = chati.src_identity_id if chati.dst_identity_id == identity_id else chati.dst_identity_id
-        all_chati = db.query(models.Chat).filter(
-            (models.Chat.src_identity_id == identity_id) | (models.Chat.dst_identity_id == identity_id)
-        ).order_by(models.Chat.last_update.desc()).limit(20).all()
-        for chatj in all_chati:
-            tar_indentityj = chatj.src_identity_id if chatj.dst_identity_id == identity_id else chatj.dst_identity_id
-            if tar_indentityj in exclude_id:
-                continue
-            if tar_indentityj not in recommend_dic:
-                recommend_dic[tar_indentityj] = config_dic["same_friend_val"]
-            else:
-                recommend_dic[tar_indentityj] += config_dic["same_friend_val"]
-    # TODO: add posts values
-    posts = db.query(APost).filter(APost.like_set.like(f'%{nickname}%')).all()
-    for posti in posts:
-        for likei in posti.like_set:
-            likei_id = db.query(AnonymousIdentity).filter(AnonymousIdentity.nickname == likei).first().id
-            if likei_id in exclude_id:
-                continue
-            if likei_id not in recommend_dic:
-                recommend_dic[likei_id ] = config_dic["same_like_val"]
-            else:
-                recommend_dic[likei_id ] += config_dic["same_like_val"]
-    
-
-    recommend_dic = {k: add_noise(v) for k,v in recommend_dic.items()}
-
-    recommend_lst = sorted(recommend_dic.items(), key=lambda x: x[1], reverse=True)
-    res_set = {db.query(AnonymousIdentity).filter(AnonymousIdentity.id == i[0]).first().nickname for i in recommend_lst}
+    # 加噪声后的候选排名，缓存命中时不读取候选表
+    ranking = privacy_ledger.get_or_release(identity_id, lambda: noisy_ranking(db, identity_id, exclude_id)) or []
+    # 排名发布后新邀请的身份在这里排除，不消耗预算
+    ranking = [name for candidate_id, name in ranking if candidate_id not in exclude_id]
+    res_set = set(ranking[:config_dic["max_recommend"]])
     if len(res_set) < config_dic["max_recommend"]:
-        all_identity = list(db.query(AnonymousIdentity).all()[: 4*config_dic["max_recommend"]])
+        all_identity = db.query(AnonymousIdentity.id, AnonymousIdentity.nickname).limit(4*config_dic["max_recommend"]).all()
         random.shuffle(all_identity)
         for identityi in all_identity:
             if identityi.id not in exclude_id:
@@ -112,18 +112,23 @@ def recommend_people(
 @app.post("/invite", response_model=schemas.InviteResponse)
 def create_chat_invite(
     invite_data: schemas.InviteRequest,
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     if invite_data.src_nickname not in user[1]:
         raise HTTPException(status_code=401, detail="Unauthorized")
     src_nickname = invite_data.src_nickname
     dst_nickname = invite_data.dst_nickname
+    identities = identity_cache.resolve_many(db, [src_nickname, dst_nickname], refresh=True)
+    if src_nickname not in identities or dst_nickname not in identities:
+        raise HTTPException(status_code=404, detail="Identity not found")
+    src_identity_id = identities[src_nickname].id
+    dst_identity_id = identities[dst_nickname].id
     
     # 检查是否已经存在未处理的邀请
     existing_invite = db.query(models.ChatInvitation).filter(
-        models.ChatInvitation.src_identity_id == get_identity_id(db, src_nickname),
-        models.ChatInvitation.dst_identity_id == get_identity_id(db, dst_nickname),
+        models.ChatInvitation.src_identity_id == src_identity_id,
+        models.ChatInvitation.dst_identity_id == dst_identity_id,
         models.ChatInvitation.status == "pending"
     ).first()
     
@@ -132,8 +137,8 @@ def create_chat_invite(
     
     # 创建新的邀请
     new_invite = models.ChatInvitation(
-        src_identity_id=get_identity_id(db, src_nickname),
-        dst_identity_id=get_identity_id(db, dst_nickname),
+        src_identity_id=src_identity_id,
+        dst_identity_id=dst_identity_id,
         message=invite_data.message,
         publickey=invite_data.publickey
     )
@@ -142,13 +147,20 @@ def create_chat_invite(
     db.commit()
     db.refresh(new_invite)
 
+    get_chat_hub().publish(dst_nickname, {
+        "type": "invite",
+        "src_nickname": src_nickname,
+        "timestamp": new_invite.created_at.timestamp(),
+        "message": new_invite.message,
+        "publickey": new_invite.publickey
+    })
     return {"error_code": 0, "message": "Invite sent successfully"}
 
 # 2. 获取申请消息
 @app.get("/get-invite", response_model=schemas.GetInviteResponse)
 def get_chat_invites(
     nickname: str = Query(...),
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     if nickname not in user[1]:
@@ -161,11 +173,11 @@ def get_chat_invites(
         models.ChatInvitation.status == "pending"
     ).order_by(models.ChatInvitation.created_at.desc()).limit(20).all()
     
+    src_nicknames = identity_cache.nicknames_by_id(db, {invite.src_identity_id for invite in invites})
     invite_list = []
     for invite in invites:
-        src_identity = db.query(models.AnonymousIdentity).filter(models.AnonymousIdentity.id == invite.src_identity_id).first()
         invite_list.append({
-            "src_nickname": src_identity.nickname,
+            "src_nickname": src_nicknames.get(invite.src_identity_id),
             "timestamp": invite.created_at.timestamp(),
             "message": invite.message,
             "publickey": invite.publickey
@@ -177,7 +189,7 @@ def get_chat_invites(
 @app.get("/invite-state", response_model=schemas.InviteStateResponse)
 def get_invite_state(
     nickname: str = Query(...),
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     if nickname not in user[1]:
@@ -191,7 +203,6 @@ def get_invite_state(
     
     state_list = []
     for invite in invites:
-        dst_identity = db.get(models.AnonymousIdentity, invite.dst_identity_id)
         state_code = 0  # 默认未响应
         publickey = None
         
@@ -212,7 +223,7 @@ def get_invite_state(
 @app.post("/choose", response_model=schemas.ChooseResponse)
 def choose_chat_invite(
     choice_data: schemas.ChooseRequest,
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     if choice_data.dst_nickname not in user[1]:
@@ -221,8 +232,8 @@ def choose_chat_invite(
     dst_nickname = choice_data.dst_nickname
     choice = choice_data.choice
     
-    src_identity_id = get_identity_id(db, src_nickname)
-    dst_identity_id = get_identity_id(db, dst_nickname)
+    src_identity_id = get_identity_id(db, src_nickname, refresh=True)
+    dst_identity_id = get_identity_id(db, dst_nickname, refresh=True)
     
     # 查找对应的邀请
     invite = db.query(models.ChatInvitation).filter(
@@ -250,13 +261,20 @@ def choose_chat_invite(
     
     db.commit()
     
+    # 通知邀请方，字段与/invite-state一致
+    get_chat_hub().publish(src_nickname, {
+        "type": "invite_state",
+        "dst_nickname": dst_nickname,
+        "state_code": 1 if choice == 0 else 2,
+        "publickey": choice_data.publickey if choice == 0 else None
+    })
     return {"error_code": 0, "message": "Choice processed successfully"}
 
 # 5. 发送私聊信息
 @app.post("/send", response_model=schemas.SendResponse)
 def send_chat_message(
     message_data: schemas.MessageRequest,
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     if message_data.src_nickname not in user[1]:
@@ -264,8 +282,8 @@ def send_chat_message(
     src_nickname = message_data.src_nickname
     dst_nickname = message_data.dst_nickname
     
-    src_identity_id = get_identity_id(db, src_nickname)
-    dst_identity_id = get_identity_id(db, dst_nickname)
+    src_identity_id = get_identity_id(db, src_nickname, refresh=True)
+    dst_identity_id = get_identity_id(db, dst_nickname, refresh=True)
     
     # 检查是否存在聊天记录
     chat = db.query(models.Chat).filter(
@@ -276,53 +294,70 @@ def send_chat_message(
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     
-    # 创建新消息
+    # 创建新消息，序号在同一事务中原子分配（UPDATE自增后读取）
+    db.query(models.Chat).filter(models.Chat.id == chat.id).update(
+        {models.Chat.message_count: models.Chat.message_count + 1}, synchronize_session=False
+    )
+    seq = db.query(models.Chat.message_count).filter(models.Chat.id == chat.id).scalar()
     new_message = models.Message(
         message=message_data.message,
-        owner_id=src_identity_id
+        owner_id=src_identity_id,
+        chat_id=chat.id,
+        seq=seq
     )
     db.add(new_message)
-    db.commit()
-    db.refresh(new_message)
+    db.flush()
     
-    # 将消息关联到聊天
-    chat.messages.append(new_message)
-    chat.last_update = datetime.now().timestamp()
+    now = datetime.now().timestamp()
+    chat.last_message_id = new_message.id
+    chat.last_update = now
     db.commit()
     
+    # 推送给双方（发送方的其他设备也能同步）
+    event = {
+        "type": "message",
+        "src_nickname": src_nickname,
+        "dst_nickname": dst_nickname,
+        "seq": seq,
+        "message": message_data.message,
+        "timestamp": now
+    }
+    get_chat_hub().publish(dst_nickname, event)
+    get_chat_hub().publish(src_nickname, event)
     return {"error_code": 0, "message": "Message sent successfully"}
 
 # 6. 查收私聊信息
 @app.get("/receive", response_model=schemas.ReceiveResponse)
 def receive_chat_messages(
     nickname: str = Query(...),
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     if nickname not in user[1]:
         raise HTTPException(status_code=401, detail="Unauthorized")
     identity_id = get_identity_id(db, nickname)
     
-    # 获取所有与该用户相关的聊天
-    chats = db.query(models.Chat).filter(
+    # 获取所有与该用户相关的聊天，对方昵称和最后一条消息在同一次查询中联表取出
+    other_identity_id = case(
+        (models.Chat.src_identity_id == identity_id, models.Chat.dst_identity_id),
+        else_=models.Chat.src_identity_id
+    )
+    chats = db.query(
+        models.AnonymousIdentity.nickname, models.Message.message, models.Message.created_at
+    ).select_from(models.Chat).join(
+        models.AnonymousIdentity, models.AnonymousIdentity.id == other_identity_id
+    ).outerjoin(
+        models.Message, models.Message.id == models.Chat.last_message_id
+    ).filter(
         (models.Chat.src_identity_id == identity_id) | (models.Chat.dst_identity_id == identity_id)
     ).order_by(models.Chat.last_update.desc()).limit(20).all()
     
     message_list = []
     for chat in chats:
-        # 获取对方的昵称
-        if chat.src_identity_id == identity_id:
-            other_identity = db.get(models.AnonymousIdentity, chat.dst_identity_id)
-        else:
-            other_identity = db.get(models.AnonymousIdentity, chat.src_identity_id)
-        
-        # 获取最后一条消息
-        last_message = chat.messages[-1] if chat.messages else None
-        
         message_list.append({
-            "src_nickname": other_identity.nickname,
-            "last_message": last_message.message if last_message else "",
-            "timestamp": last_message.created_at.timestamp() if last_message else 0
+            "src_nickname": chat.nickname,
+            "last_message": chat.message or "",
+            "timestamp": chat.created_at.timestamp() if chat.created_at else 0
         })
     
     return {"message_lst": message_list}
@@ -332,7 +367,10 @@ def receive_chat_messages(
 def get_chat_messages_with_target(
     target_nickname: str,
     nickname: str = Query(...),
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    since: Optional[int] = Query(None, ge=0, description="只返回序号大于since的消息（拉取新消息）"),
+    before: Optional[int] = Query(None, ge=1, description="只返回序号小于before的消息（向前翻页）"),
+    limit: int = Query(20, ge=1, le=100),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     if nickname not in user[1]:
@@ -349,13 +387,22 @@ def get_chat_messages_with_target(
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     
-    # 获取最近20条消息
-    messages = chat.messages[-20:]
+    # 在(chat_id, seq)索引上只取请求的一段消息
+    query = db.query(models.Message).filter(models.Message.chat_id == chat.id)
+    if since is not None:
+        # 紧接since之后的limit条
+        messages = query.filter(models.Message.seq > since).order_by(
+            models.Message.seq.asc()
+        ).limit(limit).all()[::-1]
+    else:
+        if before is not None:
+            query = query.filter(models.Message.seq < before)
+        messages = query.order_by(models.Message.seq.desc()).limit(limit).all()
     
     message_list = []
-    for msg in reversed(messages):  # 反转以按时间顺序排列
-        owner = db.query(models.AnonymousIdentity).filter(models.AnonymousIdentity.id == msg.owner_id).first()
+    for msg in messages:  # 序号倒序，最新的在前
         message_list.append({
+            "seq": msg.seq,
             "message": msg.message,
             "timestamp": msg.created_at.timestamp(),
             "owner": 0 if msg.owner_id == src_identity_id else 1
@@ -368,7 +415,7 @@ def get_chat_messages_with_target(
 def get_target_publickey(
     target_nickname: str,
     nickname: str = Query(...),
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     if nickname not in user[1]:
@@ -393,3 +440,53 @@ def get_target_publickey(
         "publickey": target_pk
     }
 
+# 9. 实时推送私聊事件
+async def get_websocket_user(token: str = Query(...)) -> Tuple[TokenUser, List[str]]:
+    """浏览器建立WebSocket时无法携带Authorization头，令牌放在查询参数中；数据库会话只在校验期间占用"""
+    db = SessionLocal()
+    try:
+        return await get_current_active_user(token=token, db=db)
+    except HTTPException:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+    finally:
+        db.close()
+
+@app.websocket("/ws")
+async def chat_events(
+    websocket: WebSocket,
+    nickname: str = Query(...),
+    user: Tuple[TokenUser, List[str]] = Depends(get_websocket_user)
+):
+    if nickname not in user[1]:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+    # 先订阅再完成握手，握手成功后发布的事件不会遗漏
+    subscription = get_chat_hub().subscribe(nickname)
+
+    async def push():
+        while True:
+            await websocket.send_json(await subscription.get())
+
+    async def receive():
+        # 客户端无需发送内容，收到的文本（如心跳）直接忽略，断开时结束
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    tasks = []
+    try:
+        await websocket.accept()
+        tasks = [asyncio.create_task(push()), asyncio.create_task(receive())]
+        # 客户端断开或推送失败时结束，推送失败的连接不再继续读取
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        if tasks[0] in done and not isinstance(tasks[0].exception(), WebSocketDisconnect):
+            logger.warning(f"私聊事件推送失败: {tasks[0].exception()}")
+            try:
+                await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+            except Exception:
+                pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        subscription.close()
@@ -0,0 +1,181 @@
+"""
+私聊事件推送
+
+新消息、邀请和邀请结果以事件的形式发布到接收方昵称对应的频道，
+已建立WebSocket连接的身份立即收到，不必再轮询接口。
+
+发布由Broker转发：默认只在本进程内投递；多worker部署时设置环境变量CHAT_BROKER_URL
+（如redis://localhost:6379/0）改用Redis发布订阅，每个worker把收到的事件投递给自己的连接。
+WEB_CONCURRENCY（gunicorn的默认worker数）大于1而未设置CHAT_BROKER_URL时拒绝启动，
+否则发到其他worker的消息不会推送给本worker上的连接。
+"""
+
+import os
+import json
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[str, dict], None]
+
+
+class Broker:
+    """进程内转发，发布即投递"""
+
+    def start(self, deliver: Deliver) -> None:
+        """开始转发，deliver为本进程的投递函数"""
+        self._deliver = deliver
+
+    def publish(self, channel: str, event: dict) -> None:
+        self._deliver(channel, event)
+
+    def close(self) -> None:
+        pass
+
+
+class RedisBroker(Broker):
+    """经Redis发布订阅转发，所有worker都会收到每个事件（需要安装redis）"""
+
+    PREFIX = "chat:"
+
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._thread = None
+
+    def start(self, deliver: Deliver) -> None:
+        def handler(message):
+            channel = message["channel"].decode("utf-8")[len(self.PREFIX):]
+            deliver(channel, json.loads(message["data"]))
+
+        self._pubsub.psubscribe(**{self.PREFIX + "*": handler})
+        self._thread = self._pubsub.run_in_thread(sleep_time=0.01, daemon=True)
+
+    def publish(self, channel: str, event: dict) -> None:
+        self._client.publish(self.PREFIX + channel, json.dumps(event, ensure_ascii=False))
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+        self._pubsub.close()
+        self._client.close()
+
+
+class Subscription:
+    """一个连接对一个频道的订阅，事件在连接所在的事件循环中排队"""
+
+    def __init__(self, hub: "ChatHub", channel: str, queue_size: int):
+        self.hub = hub
+        self.channel = channel
+        self._loop = asyncio.get_running_loop()
+        self._queue: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=queue_size)
+
+    def offer(self, event: dict) -> None:
+        """可在任意线程调用"""
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: dict) -> None:
+        # 消费过慢时丢弃最旧的事件，客户端可按序号游标补拉
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(event)
+
+    async def get(self) -> dict:
+        return await self._queue.get()
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+
+class ChatHub:
+    """按昵称分频道的发布订阅中心"""
+
+    def __init__(self, broker: Optional[Broker] = None, queue_size: int = 100):
+        """
+        初始化推送中心
+
+        Args:
+            broker: 事件转发方式，默认进程内转发
+            queue_size: 每个连接最多缓存的未发送事件数
+        """
+        self.broker = broker or Broker()
+        self.queue_size = queue_size
+        self._subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self.broker.start(self._deliver)
+
+    def subscribe(self, channel: str) -> Subscription:
+        """在当前事件循环中订阅频道"""
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def subscriber_count(self, channel: str) -> int:
+        with self._lock:
+            return len(self._subscriptions.get(channel, ()))
+
+    def publish(self, channel: str, event: dict) -> None:
+        """
+        发布事件，可在同步接口的工作线程中调用；推送失败不影响调用方
+
+        Args:
+            channel: 接收方昵称
+            event: 可JSON序列化的事件
+        """
+        try:
+            self.broker.publish(channel, event)
+        except Exception as e:
+            logger.warning(f"私聊事件发布失败: {e}")
+
+    def _deliver(self, channel: str, event: dict) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.offer(event)
+            except RuntimeError:
+                # 连接所在的事件循环已关闭
+                self.unsubscribe(subscription)
+
+    def close(self) -> None:
+        self.broker.close()
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+def get_chat_hub() -> ChatHub:
+    """
+    获取推送中心单例实例
+
+    Returns:
+        ChatHub: 设置了CHAT_BROKER_URL时经Redis转发，否则只在进程内投递
+
+    Raises:
+        RuntimeError: 多worker部署但未设置CHAT_BROKER_URL
+    """
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            broker_url = os.environ.get("CHAT_BROKER_URL", "")
+            workers = int(os.environ.get("WEB_CONCURRENCY", "1") or 1)
+            if not broker_url and workers > 1:
+                raise RuntimeError(f"{workers}个worker部署需要设置CHAT_BROKER_URL，进程内转发无法跨worker推送")
+            _hub = ChatHub(RedisBroker(broker_url) if broker_url else None)
+    return _hub
@@ -0,0 +1,66 @@
+from sqlalchemy import create_engine, inspect, text
+from ..login.database import SQLALCHEMY_DATABASE_URL
+
+def migrate_chat_last_message(engine):
+    """chat增加最后一条消息ID列，按关联表回填"""
+    inspector = inspect(engine)
+    if 'chat' not in inspector.get_table_names():
+        return
+    if 'last_message_id' in [c['name'] for c in inspector.get_columns('chat')]:
+        print("chat.last_message_id already exists, no migration needed")
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text('ALTER TABLE chat ADD COLUMN last_message_id INTEGER REFERENCES message(id)'))
+        conn.execute(text(
+            'UPDATE chat SET last_message_id = ('
+            'SELECT MAX(message_id) FROM chat_message_association WHERE chat_message_association.chat_id = chat.id)'
+        ))
+    print("Migration successful: Added chat.last_message_id")
+
+def migrate_chat_message_seq(engine):
+    """message增加所属聊天和序号列（取代chat_message_association多对多表），chat增加消息计数列"""
+    inspector = inspect(engine)
+    if 'message' not in inspector.get_table_names():
+        return
+    if 'seq' in [c['name'] for c in inspector.get_columns('message')]:
+        print("message.seq already exists, no migration needed")
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text('ALTER TABLE message ADD COLUMN chat_id INTEGER REFERENCES chat(id)'))
+        conn.execute(text('ALTER TABLE message ADD COLUMN seq INTEGER'))
+        if 'message_count' not in [c['name'] for c in inspector.get_columns('chat')]:
+            conn.execute(text('ALTER TABLE chat ADD COLUMN message_count INTEGER DEFAULT 0'))
+        if 'chat_message_association' in inspector.get_table_names():
+            conn.execute(text(
+                'UPDATE message SET chat_id = ('
+                'SELECT chat_id FROM chat_message_association WHERE chat_message_association.message_id = message.id)'
+            ))
+        # 需要 SQLite 3.25+ 的窗口函数
+        conn.execute(text(
+            'UPDATE message SET seq = ('
+            'SELECT numbered.rn FROM ('
+            'SELECT id, ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY id) AS rn '
+            'FROM message WHERE chat_id IS NOT NULL) AS numbered '
+            'WHERE numbered.id = message.id)'
+        ))
+        conn.execute(text(
+            'UPDATE chat SET message_count = ('
+            'SELECT COALESCE(MAX(seq), 0) FROM message WHERE message.chat_id = chat.id)'
+        ))
+        conn.execute(text(
+            'CREATE UNIQUE INDEX IF NOT EXISTS ix_message_chat_seq ON message (chat_id, seq)'
+        ))
+    print("Migration successful: Added message.chat_id, message.seq and chat.message_count")
+
+def run_migration():
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    )
+    migrate_chat_last_message(engine)
+    migrate_chat_message_seq(engine)
+
+# This script can be run directly
+if __name__ == "__main__":
+    run_migration()
@@ -3,7 +3,7 @@ from enum import Enum
 from typing import List, Optional
 
 from pydantic import BaseModel
-from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String, Text, Table
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String, Text, Index
 from sqlalchemy.orm import relationship, Mapped, mapped_column, backref
 from sqlalchemy.sql import func
 from ..login.models import AnonymousIdentity, Base 
@@ -33,21 +33,20 @@ class ChatInvitation(Base):
 
 class Message(Base):
     __tablename__ = "message"
+    __table_args__ = (
+        # 按序号取一段聊天记录是索引上的范围查询，与历史长度无关
+        Index("ix_message_chat_seq", "chat_id", "seq", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     message = Column(Text)
     owner_id = mapped_column(Integer, ForeignKey("anonymous_identities.id"))
+    chat_id = mapped_column(Integer, ForeignKey("chat.id"))
+    seq = Column(Integer)  # 在所属聊天中的序号，从1开始，发送时分配
 
     owner = relationship("AnonymousIdentity", foreign_keys=[owner_id], backref=backref("messages"))
-
-# 多对多关联表
-chat_message_association = Table(
-    "chat_message_association",
-    Base.metadata,
-    Column("chat_id", Integer, ForeignKey("chat.id")),
-    Column("message_id", Integer, ForeignKey("message.id"))
-)
+    chat = relationship("Chat", foreign_keys=[chat_id], back_populates="messages")
 
 class Chat(Base):
     __tablename__ = "chat"
@@ -56,10 +55,30 @@ class Chat(Base):
     src_identity_id = mapped_column(Integer, ForeignKey("anonymous_identities.id"))
     dst_identity_id = mapped_column(Integer, ForeignKey("anonymous_identities.id"))
     last_update = Column(Float)
+    message_count = Column(Integer, default=0)  # 已分配的最大消息序号，发送时原子递增
+    # 冗余最后一条消息的ID，会话列表不必加载全部消息
+    last_message_id = mapped_column(Integer, ForeignKey("message.id"), nullable=True)
 
     src_identity = relationship("AnonymousIdentity", foreign_keys=[src_identity_id], backref=backref("src_chats"))
     dst_identity = relationship("AnonymousIdentity", foreign_keys=[dst_identity_id], backref=backref("dst_chats"))
-    messages = relationship("Message", secondary=chat_message_association, backref=backref("chats"))
+    messages = relationship("Message", foreign_keys="Message.chat_id", back_populates="chat", order_by="Message.seq")
+
+# 后台预先计算的推荐候选及未加噪声的得分，定期整体重算
+class RecommendCandidate(Base):
+    __tablename__ = "recommend_candidate"
+
+    # 主键即按身份读取候选的索引
+    identity_id = mapped_column(Integer, ForeignKey("anonymous_identities.id"), primary_key=True)
+    candidate_id = mapped_column(Integer, ForeignKey("anonymous_identities.id"), primary_key=True)
+    score = Column(Float)
+
+# 每个身份当前周期已消耗的差分隐私预算，所有worker共用同一份账目
+class PrivacyBudget(Base):
+    __tablename__ = "privacy_budget"
+
+    identity_id = mapped_column(Integer, ForeignKey("anonymous_identities.id"), primary_key=True)
+    period = Column(Integer, nullable=False)  # 周期序号，即时间戳整除周期长度
+    spent = Column(Float, nullable=False, default=0.0)
 
 # ---------------------------
 # Pydantic 模型定义 (接口层)
@@ -0,0 +1,170 @@
+"""
+差分隐私预算账本
+
+每次对真实得分重新加噪声发布都会消耗epsilon的隐私预算，反复请求取平均就能还原真实得分。
+账本为每个身份缓存上一次加噪声的结果，有效期内的请求直接返回缓存；
+过期后只有本周期内剩余预算足够才重新加噪声，否则继续返回旧结果（对已发布结果的再处理不消耗预算）。
+
+已消耗的预算记在数据库的privacy_budget表中，所有worker共用，重启后仍然有效；
+记账是一条带预算条件的UPDATE，并发请求不会超支。这样每个身份每个周期的隐私损失不超过budget。
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Generic, Iterator, Optional, Tuple, TypeVar
+
+from sqlalchemy import case, delete, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+T = TypeVar("T")
+
+
+class PrivacyLedger(Generic[T]):
+    """按身份记录隐私预算并缓存加噪声结果"""
+
+    def __init__(self, get_session: Callable[[], Iterator[Session]], epsilon: float, budget: float,
+                 period: float = 86400.0, ttl: float = 600.0, max_size: int = 4096):
+        """
+        初始化账本
+
+        Args:
+            get_session: 数据库会话依赖（生成器函数，与get_db相同），记账在独立的会话中立即提交
+            epsilon: 每次加噪声发布消耗的预算
+            budget: 每个身份每个周期的总预算
+            period: 预算周期（秒），按时间戳对齐，周期结束后预算恢复
+            ttl: 加噪声结果的有效期（秒）
+            max_size: 最多缓存的结果数，超出时淘汰最久未用的（已消耗的预算记在数据库中，不随之丢弃）
+        """
+        self.get_session = get_session
+        self.epsilon = epsilon
+        self.budget = budget
+        self.period = period
+        self.ttl = ttl
+        self.max_size = max_size
+
+        # 身份 -> (过期时间, 结果)
+        self._results: "OrderedDict[int, Tuple[float, T]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.hits = 0
+        self.releases = 0
+
+    def get_or_release(self, identity_id: int, release: Callable[[], T]) -> Optional[T]:
+        """
+        返回缓存的结果，必要且预算允许时重新加噪声发布
+
+        Args:
+            identity_id: 身份ID
+            release: 对真实数据加噪声并返回结果的函数
+
+        Returns:
+            加噪声的结果；预算已用完且没有可复用的旧结果时为None，调用方不应再使用真实数据
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._results.get(identity_id)
+            if cached is not None:
+                self._results.move_to_end(identity_id)
+                if cached[0] > now:
+                    self.hits += 1
+                    return cached[1]
+
+        # 先记账再计算，记账失败说明本周期预算已用完
+        period = self._current_period()
+        if not self._charge(identity_id, period):
+            with self._lock:
+                self.hits += 1
+            return cached[1] if cached is not None else None
+
+        try:
+            result = release()
+        except Exception:
+            # 没有发布结果，退回本次记账
+            self._refund(identity_id, period)
+            raise
+        with self._lock:
+            self.releases += 1
+            self._results[identity_id] = (time.monotonic() + self.ttl, result)
+            self._results.move_to_end(identity_id)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+        return result
+
+    def _current_period(self) -> int:
+        """当前周期序号，各进程按同一时钟对齐"""
+        return int(time.time() // self.period)
+
+    def _charge(self, identity_id: int, period: int) -> bool:
+        """原子地扣除一次发布的预算，预算不足时返回False"""
+        if self.epsilon > self.budget:
+            return False
+        budget = models.PrivacyBudget
+        session_gen = self.get_session()
+        db = next(session_gen)
+        try:
+            db.execute(insert(budget).values(
+                identity_id=identity_id, period=period, spent=0.0
+            ).on_conflict_do_nothing(index_elements=["identity_id"]))
+            # 跨周期的账目在同一条语句中重置，条件不满足时不更新任何行
+            result = db.execute(update(budget).where(
+                budget.identity_id == identity_id,
+                (budget.period != period) | (budget.spent + self.epsilon <= self.budget)
+            ).values(
+                spent=case((budget.period == period, budget.spent + self.epsilon), else_=self.epsilon),
+                period=period
+            ))
+            db.commit()
+            return result.rowcount == 1
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            session_gen.close()
+
+    def _refund(self, identity_id: int, period: int) -> None:
+        """退回一次未发布的记账（周期已切换时不需要退回）"""
+        budget = models.PrivacyBudget
+        session_gen = self.get_session()
+        db = next(session_gen)
+        try:
+            db.execute(update(budget).where(
+                budget.identity_id == identity_id, budget.period == period
+            ).values(
+                spent=case((budget.spent > self.epsilon, budget.spent - self.epsilon), else_=0.0)
+            ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            session_gen.close()
+
+    def remaining(self, identity_id: int) -> float:
+        """身份本周期剩余的预算"""
+        budget = models.PrivacyBudget
+        session_gen = self.get_session()
+        db = next(session_gen)
+        try:
+            spent = db.query(budget.spent).filter(
+                budget.identity_id == identity_id, budget.period == self._current_period()
+            ).scalar()
+        finally:
+            session_gen.close()
+        return self.budget - (spent or 0.0)
+
+    def clear(self) -> None:
+        """清空缓存和账目"""
+        with self._lock:
+            self._results.clear()
+        session_gen = self.get_session()
+        db = next(session_gen)
+        try:
+            db.execute(delete(models.PrivacyBudget))
+            db.commit()
+        finally:
+            session_gen.close()
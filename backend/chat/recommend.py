@@ -0,0 +1,231 @@
+"""
+好友推荐候选的预计算
+
+推荐得分只取决于私聊和点赞关系，变化缓慢，不必在每次请求时计算。
+后台线程定期从数据库加载身份交互图，为每个有私聊或点赞的身份计算得分最高的top_k个候选，
+整体替换recommend_candidate表；请求时只需按主键读出候选，再排除邀请过的身份并加噪声。
+
+图中有两类边：私聊（身份—身份）和点赞（身份—帖子）。候选人的得分是一次两跳遍历：
+    好友的好友：每条 身份—好友—候选人 路径计 same_friend_val
+    共同点赞：每个两人都点赞过的帖子计 same_like_val
+路径按NumPy数组拼接后用unique/bincount一次聚合。
+
+重算线程由应用启动事件启动，启动后立即计算一次。多个worker进程共用同一个数据库，
+只需一个进程定期重算：设置lock_path后，取得该文件排他锁（flock）的进程负责重算，
+其余进程每个周期重试取锁，持有者退出后接管。不支持flock的平台（Windows）上每个进程都会重算。
+
+手动重算（仓库根目录）:
+    python -m backend.chat.recommend refresh
+"""
+
+import itertools
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from . import models
+from ..topic.model import PostLike
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class InteractionGraph:
+    """私聊与点赞构成的身份交互图"""
+
+    def __init__(self):
+        self._friends: Dict[int, Set[int]] = defaultdict(set)
+        self._likes: Dict[int, Set[object]] = defaultdict(set)
+        self._likers: Dict[object, Set[int]] = defaultdict(set)
+
+    def load(self, db: Session) -> None:
+        """从数据库重新加载全部私聊和点赞"""
+        chats = db.query(models.Chat.src_identity_id, models.Chat.dst_identity_id).all()
+        likes = db.query(PostLike.identity_id, PostLike.post_uuid).all()
+        self._friends.clear()
+        self._likes.clear()
+        self._likers.clear()
+        for src_id, dst_id in chats:
+            if src_id is None or dst_id is None or src_id == dst_id:
+                continue
+            self._friends[src_id].add(dst_id)
+            self._friends[dst_id].add(src_id)
+        for identity_id, post_uuid in likes:
+            self._likes[identity_id].add(post_uuid)
+            self._likers[post_uuid].add(identity_id)
+
+    def identities(self) -> List[int]:
+        """有私聊或点赞的身份"""
+        return sorted(set(self._friends) | set(self._likes))
+
+    def scores(self, identity_id: int, friend_val: float, like_val: float,
+               exclude: Iterable[int] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        两跳遍历计算候选人得分
+
+        Args:
+            identity_id: 被推荐的身份
+            friend_val: 每条好友的好友路径的得分
+            like_val: 每个共同点赞帖子的得分
+            exclude: 不参与推荐的身份（身份本身总是排除）
+
+        Returns:
+            (candidates, scores): 候选身份ID和对应得分，只包含得分大于0的身份
+        """
+        friends_of_friends = np.fromiter(itertools.chain.from_iterable(
+            self._friends[friend] for friend in self._friends.get(identity_id, ())
+        ), dtype=np.int64)
+        co_likers = np.fromiter(itertools.chain.from_iterable(
+            self._likers[post_uuid] for post_uuid in self._likes.get(identity_id, ())
+        ), dtype=np.int64)
+
+        paths = np.concatenate([friends_of_friends, co_likers])
+        weights = np.concatenate([
+            np.full(len(friends_of_friends), friend_val, dtype=np.float64),
+            np.full(len(co_likers), like_val, dtype=np.float64),
+        ])
+        candidates, inverse = np.unique(paths, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights, minlength=len(candidates))
+
+        keep = np.isin(candidates, np.fromiter(itertools.chain([identity_id], exclude), dtype=np.int64), invert=True)
+        keep &= scores > 0
+        return candidates[keep], scores[keep]
+
+
+class RecommendCandidates:
+    """定期重算的推荐候选表"""
+
+    def __init__(self,
+                 get_session: Callable[[], Iterator[Session]],
+                 friend_val: float,
+                 like_val: float,
+                 top_k: int = 20,
+                 refresh_interval: float = 600.0,
+                 lock_path: Optional[str] = None):
+        """
+        初始化候选表
+
+        Args:
+            get_session: 数据库会话依赖（生成器函数，与get_db相同）
+            friend_val: 每条好友的好友路径的得分
+            like_val: 每个共同点赞帖子的得分
+            top_k: 每个身份保存的候选数，需大于每次推荐的人数，排除邀请过的身份后仍够用
+            refresh_interval: 重算间隔（秒）
+            lock_path: 调度锁文件路径，多个进程中只有持有锁的一个定期重算；None表示不加锁
+        """
+        self.get_session = get_session
+        self.friend_val = friend_val
+        self.like_val = like_val
+        self.top_k = top_k
+        self.refresh_interval = refresh_interval
+        self.lock_path = lock_path
+
+        self._lock_file = None
+        self._refresh_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> int:
+        """
+        重新计算全部身份的候选并整体替换
+
+        Returns:
+            int: 有候选的身份数
+        """
+        with self._refresh_lock:
+            session_gen = self.get_session()
+            db = next(session_gen)
+            try:
+                graph = InteractionGraph()
+                graph.load(db)
+                rows = []
+                identities = 0
+                for identity_id in graph.identities():
+                    candidates, scores = graph.scores(identity_id, self.friend_val, self.like_val)
+                    if len(candidates) == 0:
+                        continue
+                    identities += 1
+                    for index in np.argsort(-scores, kind="stable")[:self.top_k]:
+                        rows.append({
+                            "identity_id": identity_id,
+                            "candidate_id": int(candidates[index]),
+                            "score": float(scores[index]),
+                        })
+
+                # 在一个事务中替换，请求不会读到一半的结果
+                db.execute(delete(models.RecommendCandidate))
+                if rows:
+                    db.execute(insert(models.RecommendCandidate), rows)
+                db.commit()
+                return identities
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                session_gen.close()
+
+    def start(self) -> None:
+        """启动重算线程（已启动时不做任何事）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="recommend-candidates", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """停止重算线程并释放调度锁"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def acquire_scheduler(self) -> bool:
+        """尝试成为负责定期重算的进程，已持有锁或未设置锁时返回True"""
+        if self.lock_path is None or fcntl is None or self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _run(self) -> None:
+        # 启动后立即计算一次，之后每refresh_interval秒一次
+        while True:
+            if self.acquire_scheduler():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"推荐候选重算失败: {e}")
+            if self._stop.wait(self.refresh_interval):
+                break
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from .chat import recommend_candidates
+    from ..login.database import engine, Base
+
+    parser = argparse.ArgumentParser(description="推荐候选维护")
+    parser.add_argument("command", choices=["refresh"], help="refresh: 重新计算全部候选")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    total = recommend_candidates.refresh()
+    print(f"推荐候选计算完成，共 {total} 个身份")
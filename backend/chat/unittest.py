@@ -4,12 +4,22 @@ from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import time
+import tempfile
+import threading
 
-from .chat import app, get_db, config_dic, get_current_active_user
-from ..topic.model import APost
+from .chat import app, get_db, config_dic, get_current_active_user, get_websocket_user, recommend_candidates, privacy_ledger
+from .hub import get_chat_hub
+from .privacy import PrivacyLedger
+from .recommend import RecommendCandidates
+from ..login.identity_cache import identity_cache
+from ..login.auth import create_user_access_token, bump_token_version, token_versions
+from ..login.models import User
+from fastapi import HTTPException, WebSocketDisconnect
+import asyncio
+from ..topic.model import APost, PostLike
 from ..login.models import AnonymousIdentity
-from ..login.database import SessionLocal, Base
-from .models import AnonymousIdentity, ChatInvitation, Chat, Message
+from ..login.database import SessionLocal, Base, count_queries as count_database_queries
+from .models import AnonymousIdentity, ChatInvitation, Chat, Message, RecommendCandidate, PrivacyBudget
 import os
 
 
@@ -33,9 +43,16 @@ def override_get_current_active_user():
 
 app.dependency_overrides[get_db] = override_get_db
 app.dependency_overrides[get_current_active_user] = override_get_current_active_user
+app.dependency_overrides[get_websocket_user] = override_get_current_active_user
+recommend_candidates.get_session = override_get_db
+privacy_ledger.get_session = override_get_db
 
 client = TestClient(app)
 
+def count_queries():
+    """记录期间在测试数据库上执行的SQL语句"""
+    return count_database_queries(engine)
+
 class TestChatAPI(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -66,6 +83,11 @@ class TestChatAPI(unittest.TestCase):
             pass
     
     def tearDown(self):
+        privacy_ledger.clear()
+        identity_cache.clear()
+        self.db.query(RecommendCandidate).delete()
+        self.db.query(PostLike).delete()
+        self.db.query(APost).delete()
         self.db.query(Message).delete()
         self.db.query(Chat).delete()
         self.db.query(ChatInvitation).delete()
@@ -267,6 +289,30 @@ class TestChatAPI(unittest.TestCase):
         self.assertEqual(messages[0]["src_nickname"], "user2")
         self.assertEqual(messages[0]["last_message"], "This is a test message")
     
+    def test_receive_query_count(self):
+        # 会话列表的查询次数与会话数量无关
+        def add_chat(other, text):
+            message = Message(message=text, owner_id=other.id, seq=1)
+            chat = Chat(src_identity_id=other.id, dst_identity_id=self.user1.id,
+                        last_update=time.time(), message_count=1, messages=[message])
+            self.db.add(chat)
+            self.db.flush()
+            chat.last_message_id = message.id
+            self.db.commit()
+
+        add_chat(self.user2, "from user2")
+        with count_queries() as one_chat:
+            self.assertEqual(len(self.client.get("/receive?nickname=user1").json()["message_lst"]), 1)
+
+        add_chat(self.user3, "from user3")
+        add_chat(self.user4, "from user4")
+        identity_cache.clear()
+        with count_queries() as three_chats:
+            messages = self.client.get("/receive?nickname=user1").json()["message_lst"]
+        self.assertEqual([m["last_message"] for m in messages], ["from user4", "from user3", "from user2"])
+        self.assertEqual(len(three_chats), len(one_chat))
+        self.assertLessEqual(len(three_chats), 2)
+
     def test_get_chat_messages_with_target(self):
         # 创建邀请并接受
         self.client.post(
@@ -308,6 +354,70 @@ class TestChatAPI(unittest.TestCase):
         self.assertEqual(messages[0]["message"], "This is a test message")
         self.assertEqual(messages[0]["owner"], 0)
     
+    def test_chat_message_cursor(self):
+        # 按序号游标分段读取聊天记录
+        self.client.post("/invite", json={
+            "src_nickname": "user1", "dst_nickname": "user2", "message": "hi", "publickey": "publickey1"
+        })
+        self.client.post("/choose", json={
+            "choice": 0, "src_nickname": "user1", "publickey": "publickey2", "dst_nickname": "user2"
+        })
+        for i in range(1, 31):
+            sender, receiver = ("user1", "user2") if i % 2 else ("user2", "user1")
+            self.client.post("/send", json={"src_nickname": sender, "dst_nickname": receiver, "message": f"m{i}"})
+
+        def seqs(**params):
+            response = self.client.get("/user2", params={"nickname": "user1", **params})
+            self.assertEqual(response.status_code, 200)
+            return [msg["seq"] for msg in response.json()["message_lst"]]
+
+        self.assertEqual(seqs(), list(range(30, 10, -1)))
+        self.assertEqual(seqs(before=11), list(range(10, 0, -1)))
+        self.assertEqual(seqs(before=11, limit=3), [10, 9, 8])
+        self.assertEqual(seqs(since=25), [30, 29, 28, 27, 26])
+        self.assertEqual(seqs(since=5, limit=2), [7, 6])
+        self.assertEqual(seqs(since=30), [])
+
+        # 窗口大小固定时，查询次数与历史长度无关
+        with count_queries() as statements:
+            seqs(before=11, limit=3)
+        self.assertLessEqual(len(statements), 4)
+
+    def test_websocket_push(self):
+        # 已连接的身份实时收到邀请和新消息
+        with self.client.websocket_connect("/ws?nickname=user2&token=test") as websocket:
+            self.assertEqual(get_chat_hub().subscriber_count("user2"), 1)
+            self.client.post("/invite", json={
+                "src_nickname": "user1", "dst_nickname": "user2", "message": "hi", "publickey": "publickey1"
+            })
+            event = websocket.receive_json()
+            self.assertEqual((event["type"], event["src_nickname"], event["message"]), ("invite", "user1", "hi"))
+
+            # 接受邀请只通知邀请方
+            self.client.post("/choose", json={
+                "choice": 0, "src_nickname": "user1", "publickey": "publickey2", "dst_nickname": "user2"
+            })
+            self.client.post("/send", json={"src_nickname": "user1", "dst_nickname": "user2", "message": "hello"})
+            event = websocket.receive_json()
+            self.assertEqual((event["type"], event["seq"], event["message"]), ("message", 1, "hello"))
+        self.assertEqual(get_chat_hub().subscriber_count("user2"), 0)
+
+    def test_websocket_push_failure(self):
+        # 推送失败时服务端关闭连接，不再继续读取
+        with self.client.websocket_connect("/ws?nickname=user2&token=test") as websocket:
+            get_chat_hub().publish("user2", {"type": "bad", "value": object()})
+            with self.assertRaises(WebSocketDisconnect) as cm:
+                websocket.receive_json()
+            self.assertEqual(cm.exception.code, 1011)
+        self.assertEqual(get_chat_hub().subscriber_count("user2"), 0)
+
+    def test_chat_hub_requires_broker(self):
+        # 多worker部署未设置转发地址时拒绝启动
+        with patch("backend.chat.hub._hub", None), \
+                patch.dict(os.environ, {"WEB_CONCURRENCY": "4", "CHAT_BROKER_URL": ""}):
+            with self.assertRaises(RuntimeError):
+                get_chat_hub()
+
     def test_get_target_publickey(self):
         # 创建邀请并接受
         self.client.post(
@@ -352,8 +462,13 @@ class TestChatAPI(unittest.TestCase):
         self.db.commit()
         
         # 添加测试帖子
-        self.post1 = APost(content="Test post", like_set=["user2", "user3"])
+        self.post1 = APost(content="Test post")
         self.db.add(self.post1)
+        self.db.flush()
+        self.db.add_all([
+            PostLike(post_uuid=self.post1.uuid, identity_id=self.user2.id),
+            PostLike(post_uuid=self.post1.uuid, identity_id=self.user3.id),
+        ])
         self.db.commit()
 
         # 测试推荐逻辑
@@ -373,5 +488,146 @@ class TestChatAPI(unittest.TestCase):
         self.assertIn("user2", data["recommend_lst"])
         self.assertIn("user3", data["recommend_lst"])
 
+    def test_recommend_candidates(self):
+        # 1-2-3 构成好友的好友，1和4点赞了同一帖子
+        self.db.add_all([
+            Chat(src_identity_id=self.user1.id, dst_identity_id=self.user2.id, last_update=time.time()),
+            Chat(src_identity_id=self.user2.id, dst_identity_id=self.user3.id, last_update=time.time()),
+        ])
+        post = APost(content="Graph post")
+        self.db.add(post)
+        self.db.flush()
+        self.db.add_all([
+            PostLike(post_uuid=post.uuid, identity_id=self.user1.id),
+            PostLike(post_uuid=post.uuid, identity_id=self.user4.id),
+        ])
+        self.db.commit()
+
+        recommend_candidates.refresh()
+        rows = self.db.query(RecommendCandidate.candidate_id, RecommendCandidate.score).filter(
+            RecommendCandidate.identity_id == self.user1.id
+        ).all()
+        self.assertEqual(dict(rows), {self.user3.id: 5, self.user4.id: 2})
+
+        # 请求时只读候选表，邀请过的身份被排除
+        self.db.add(ChatInvitation(src_identity_id=self.user1.id, dst_identity_id=self.user4.id))
+        self.db.commit()
+        with count_queries() as statements:
+            response = self.client.get("/recommend?nickname=user1")
+        data = response.json()
+        self.assertIn("user3", data["recommend_lst"])
+        self.assertNotIn("user4", data["recommend_lst"])
+        self.assertEqual(len([s for s in statements if "recommend_candidate" in s]), 1)
+
+        # 有效期内重复请求返回同一份加噪声结果，不再读取候选表
+        with count_queries() as statements:
+            again = self.client.get("/recommend?nickname=user1").json()
+        self.assertEqual(len([s for s in statements if "recommend_candidate" in s]), 0)
+        self.assertIn("user3", again["recommend_lst"])
+
+    def test_recommend_scheduler(self):
+        # 启动后立即重算一次；多个进程共用锁文件时只有一个负责重算
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            lock_path = os.path.join(tmp_dir, "recommend.lock")
+            first = RecommendCandidates(override_get_db, 1, 1, lock_path=lock_path)
+            second = RecommendCandidates(override_get_db, 1, 1, lock_path=lock_path)
+            refreshed = threading.Event()
+            with patch.object(first, "refresh", side_effect=lambda: refreshed.set()):
+                first.start()
+                self.assertTrue(refreshed.wait(5))
+            self.assertFalse(second.acquire_scheduler())
+            first.stop()
+            self.assertTrue(second.acquire_scheduler())
+            second.stop()
+
+    def test_identity_cache(self):
+        # 两个昵称合并为一次查询，之后按ID取昵称直接命中缓存
+        with count_queries() as statements:
+            self.client.post("/invite", json={
+                "src_nickname": "user1", "dst_nickname": "user2", "message": "hi", "publickey": "pk"
+            })
+        self.assertEqual(len([s for s in statements if "FROM anonymous_identities" in s]), 1)
+        with count_queries() as statements:
+            invites = self.client.get("/get-invite?nickname=user2").json()["invite_message_lst"]
+        self.assertEqual(invites[0]["src_nickname"], "user1")
+        self.assertEqual(len([s for s in statements if "FROM anonymous_identities" in s]), 0)
+
+        # 其他进程删除身份并把昵称分配给新身份后，写操作不会用到缓存中的旧ID
+        self.db.query(AnonymousIdentity).filter(AnonymousIdentity.id == self.user2.id).delete()
+        self.db.add(AnonymousIdentity(nickname="user2", user_id=9, id=9))
+        self.db.commit()
+        self.assertEqual(identity_cache.resolve(self.db, "user2").id, self.user2.id)
+        self.client.post("/invite", json={
+            "src_nickname": "user1", "dst_nickname": "user2", "message": "hi again", "publickey": "pk"
+        })
+        invite = self.db.query(ChatInvitation).filter(ChatInvitation.message == "hi again").one()
+        self.assertEqual(invite.dst_identity_id, 9)
+        self.assertEqual(identity_cache.resolve(self.db, "user2").id, 9)
+
+        # 删除身份后不再解析到旧ID
+        identity_cache.forget("user2")
+        self.db.query(AnonymousIdentity).filter(AnonymousIdentity.nickname == "user2").delete()
+        self.db.commit()
+        self.assertIsNone(identity_cache.resolve(self.db, "user2"))
+
+    def test_token_claims(self):
+        # 鉴权只解码token，不查询数据库
+        user = User(id=1, account="alice", hashed_password="", salt="")
+        self.db.add(user)
+        self.db.commit()
+        try:
+            token = create_user_access_token(self.db, user)
+            with count_queries() as statements:
+                token_user, nicknames = asyncio.run(get_current_active_user(token=token, db=self.db))
+            self.assertEqual(statements, [])
+            self.assertEqual((token_user.id, token_user.account, nicknames), (1, "alice", ["user1"]))
+
+            # 身份变更后版本号递增，旧token失效
+            bump_token_version(self.db, user.id)
+            self.db.commit()
+            token_versions.set(user.id, user.token_version)
+            with self.assertRaises(HTTPException):
+                asyncio.run(get_current_active_user(token=token, db=self.db))
+
+            # 新token由其他worker签发，本进程缓存的版本号过期前仍是旧值，需重新读取
+            self.db.refresh(user)
+            new_token = create_user_access_token(self.db, user)
+            token_versions.set(user.id, user.token_version - 1)
+            token_user, _ = asyncio.run(get_current_active_user(token=new_token, db=self.db))
+            self.assertEqual(token_user.id, 1)
+            self.assertEqual(token_versions.get(self.db, user.id), user.token_version)
+        finally:
+            token_versions.clear()
+            self.db.query(User).delete()
+            self.db.commit()
+
+    def test_privacy_ledger_budget(self):
+        ledger = PrivacyLedger(override_get_db, epsilon=1, budget=2, ttl=0)
+        releases = iter(["first", "second", "third"])
+        # 结果立即过期，每次都想重新加噪声，但只有两次预算
+        results = [ledger.get_or_release(1, lambda: next(releases)) for _ in range(4)]
+        self.assertEqual(results, ["first", "second", "second", "second"])
+        self.assertEqual(ledger.remaining(1), 0)
+        # 账目记在数据库中，其他进程（新的账本实例）也不能再发布
+        other = PrivacyLedger(override_get_db, epsilon=1, budget=2, ttl=0)
+        self.assertIsNone(other.get_or_release(1, lambda: "leak"))
+        # 没有旧结果可复用且预算不足时不发布
+        self.assertIsNone(PrivacyLedger(override_get_db, epsilon=3, budget=2).get_or_release(2, lambda: "leak"))
+
+    def test_privacy_ledger_refund_and_period(self):
+        ledger = PrivacyLedger(override_get_db, epsilon=1, budget=1, ttl=0)
+        period = ledger._current_period()
+        # 发布失败时退回预算
+        with self.assertRaises(ValueError):
+            ledger.get_or_release(1, MagicMock(side_effect=ValueError("db error")))
+        self.assertEqual((ledger.remaining(1), ledger.releases), (1, 0))
+
+        # 周期结束后预算恢复
+        self.assertEqual(ledger.get_or_release(1, lambda: "first"), "first")
+        self.assertEqual(ledger.remaining(1), 0)
+        with patch.object(ledger, "_current_period", return_value=period + 1):
+            self.assertEqual(ledger.get_or_release(1, lambda: "second"), "second")
+        self.assertEqual(self.db.query(PrivacyBudget).count(), 1)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
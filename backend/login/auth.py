@@ -1,5 +1,7 @@
+import time
+import threading
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, List, NamedTuple, Optional, Tuple
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
@@ -13,6 +15,8 @@ SECRET_KEY = "apri1_f0o1$"  # In production, use a proper secret key generator a
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
+# How long a cached token version is trusted before it is re-read from the database
+TOKEN_VERSION_TTL_SECONDS = 30
 
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -45,6 +49,82 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+class TokenUser(NamedTuple):
+    """The authenticated user as described by the access token claims"""
+    id: int
+    account: str
+
+class TokenVersionCache:
+    """In-memory cache of each user's current token version"""
+
+    def __init__(self, ttl: float = TOKEN_VERSION_TTL_SECONDS):
+        self.ttl = ttl
+        self._versions: Dict[int, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, user_id: int, refresh: bool = False) -> Optional[int]:
+        """
+        Get the user's token version, reading it from the database only when the cached value expired.
+
+        Args:
+            db (Session): The database session
+            user_id (int): The user id
+            refresh (bool): Always re-read the database, e.g. when a token carries a newer version
+                than the cached one because another worker process bumped it
+
+        Returns:
+            Optional[int]: The current token version, None if the user does not exist
+        """
+        with self._lock:
+            entry = self._versions.get(user_id)
+        if not refresh and entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        version = db.query(models.User.token_version).filter(models.User.id == user_id).scalar()
+        if version is not None:
+            self.set(user_id, version)
+        return version
+
+    def set(self, user_id: int, version: int) -> None:
+        with self._lock:
+            self._versions[user_id] = (time.monotonic() + self.ttl, version)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._versions.clear()
+
+token_versions = TokenVersionCache()
+
+def bump_token_version(db: Session, user_id: int) -> None:
+    """
+    Invalidate the user's access tokens, e.g. after an identity was created or deleted.
+    Runs in the caller's transaction; update token_versions after committing.
+
+    Args:
+        db (Session): The database session
+        user_id (int): The user whose tokens are revoked
+    """
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.token_version: models.User.token_version + 1}, synchronize_session=False
+    )
+
+def create_user_access_token(db: Session, user: models.User, expires_delta: Optional[timedelta] = None) -> str:
+    """Create an access token carrying the user id, owned nicknames and current token version"""
+    nicknames = db.query(models.AnonymousIdentity.nickname).filter(
+        models.AnonymousIdentity.user_id == user.id
+    ).all()
+    version = user.token_version or 0
+    token_versions.set(user.id, version)
+    return create_access_token(
+        data={
+            "sub": user.account,
+            "type": "access",
+            "uid": user.id,
+            "ids": [nickname for (nickname,) in nicknames],
+            "ver": version,
+        },
+        expires_delta=expires_delta,
+    )
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     """Get the current user from the token"""
     credentials_exception = HTTPException(
@@ -65,8 +145,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         raise credentials_exception
     return user
 
-async def get_current_active_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Get the current user from the token"""
+async def get_current_active_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Tuple[TokenUser, List[str]]:
+    """
+    Get the current user and their nicknames from the access token claims.
+    No database query is made unless the cached token version has expired.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -75,16 +158,22 @@ async def get_current_active_user(token: str = Depends(oauth2_scheme), db: Sessi
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        user_id = payload.get("uid")
+        nicknames = payload.get("ids")
+        if username is None or user_id is None or nicknames is None or payload.get("type") != "access":
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(models.User).filter(models.User.account == username).first()
-    if user is None:
+
+    # Identities changed since the token was issued (or the user is gone); the client must refresh
+    # A newer version than the cached one was issued by another worker: re-read before rejecting
+    token_version = payload.get("ver")
+    version = token_versions.get(db, user_id)
+    if isinstance(token_version, int) and version is not None and token_version > version:
+        version = token_versions.get(db, user_id, refresh=True)
+    if version != token_version:
         raise credentials_exception
-    all_nickname = db.query(models.AnonymousIdentity.nickname).filter(models.AnonymousIdentity.user_id == user.id).all()
-    return user, [nickname for (nickname,) in all_nickname]
+    return TokenUser(user_id, username), nicknames
 
 def get_user_by_username(db: Session, username: str):
     """
@@ -3,6 +3,8 @@ import secrets
 import random
 from sqlalchemy.orm import Session
 from . import models
+from .identity_cache import identity_cache
+from .auth import bump_token_version, token_versions
 
 def generate_unique_nickname(db: Session, length=10) -> str:
     """Generate a unique random nickname"""
@@ -61,7 +63,9 @@ def create_identity(db: Session, username: str) -> dict:
     )
     
     db.add(new_identity)
+    bump_token_version(db, user.id)
     db.commit()
+    token_versions.set(user.id, user.token_version)
     
     return {"error_code": 0, "nickname": nickname}
 
@@ -95,7 +99,10 @@ def delete_identity(db: Session, username: str, nickname: str) -> dict:
     
     # Delete the identity
     db.delete(identity)
+    bump_token_version(db, user.id)
     db.commit()
+    identity_cache.forget(nickname)
+    token_versions.set(user.id, user.token_version)
     
     return {"error_code": 0, "msg": "Identity deleted successfully"}
 
@@ -170,7 +177,9 @@ def create_first_identity(db: Session, username: str) -> dict:
     
     # Set this as the user's last used identity
     user.last_used_identity_id = new_identity.id
+    bump_token_version(db, user.id)
     
     db.commit()
+    token_versions.set(user.id, user.token_version)
     
     return {"error_code": 0, "message": "First identity created successfully", "nickname": nickname}
\ No newline at end of file
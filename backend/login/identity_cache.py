@@ -0,0 +1,142 @@
+"""
+In-process cache for resolving anonymous identities.
+
+Nearly every request maps nicknames to identity ids (or back). An identity's
+nickname, id and owner never change after creation, so they are cached here.
+Identities deleted in this process are dropped immediately; deletions made by
+other worker processes are picked up once entries expire (ttl, a few seconds).
+A deleted nickname can be reissued to a new identity, so writes resolve with
+refresh=True and never act on a stale identity id. Unknown nicknames are not
+cached, so a freshly created identity is never reported missing.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .models import AnonymousIdentity
+
+
+class IdentityRef(NamedTuple):
+    id: int
+    nickname: str
+    user_id: int
+
+
+class IdentityCache:
+    """Bounded nickname <-> identity id <-> user id cache"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 5.0):
+        """
+        Args:
+            max_size (int): Maximum cached identities
+            ttl (float): Entry lifetime in seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        # nickname -> (expire time, identity), identity id -> nickname
+        self._by_nickname: "OrderedDict[str, Tuple[float, IdentityRef]]" = OrderedDict()
+        self._by_id: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, db: Session, nickname: str, refresh: bool = False) -> Optional[IdentityRef]:
+        """Look up an identity by nickname, None if it does not exist"""
+        return self.resolve_many(db, [nickname], refresh).get(nickname)
+
+    def resolve_many(self, db: Session, nicknames: Iterable[str], refresh: bool = False) -> Dict[str, IdentityRef]:
+        """
+        Look up several identities by nickname with at most one query for the misses.
+
+        Args:
+            db (Session): The database session
+            nicknames (Iterable[str]): Nicknames to resolve
+            refresh (bool): Skip cached entries and re-read all nicknames (for writes)
+
+        Returns:
+            Dict[str, IdentityRef]: Found identities keyed by nickname; unknown nicknames are absent
+        """
+        result, missing = {}, set()
+        now = time.monotonic()
+        with self._lock:
+            for nickname in nicknames:
+                entry = self._by_nickname.get(nickname)
+                if entry is not None and entry[0] > now and not refresh:
+                    self._by_nickname.move_to_end(nickname)
+                    result[nickname] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.add(nickname)
+                    self.misses += 1
+        if missing:
+            rows = db.query(AnonymousIdentity.id, AnonymousIdentity.nickname, AnonymousIdentity.user_id).filter(
+                AnonymousIdentity.nickname.in_(missing)
+            ).all()
+            for row in rows:
+                result[row.nickname] = self.put(row.id, row.nickname, row.user_id)
+            # Nicknames deleted by another process
+            for nickname in missing - result.keys():
+                self.forget(nickname)
+        return result
+
+    def nicknames_by_id(self, db: Session, identity_ids: Iterable[int]) -> Dict[int, str]:
+        """
+        Look up several nicknames by identity id with at most one query for the misses.
+
+        Returns:
+            Dict[int, str]: Nicknames keyed by identity id; unknown ids are absent
+        """
+        result, missing = {}, set()
+        now = time.monotonic()
+        with self._lock:
+            for identity_id in identity_ids:
+                nickname = self._by_id.get(identity_id)
+                entry = self._by_nickname.get(nickname) if nickname is not None else None
+                if entry is not None and entry[0] > now and entry[1].id == identity_id:
+                    result[identity_id] = nickname
+                    self.hits += 1
+                else:
+                    missing.add(identity_id)
+                    self.misses += 1
+        if missing:
+            rows = db.query(AnonymousIdentity.id, AnonymousIdentity.nickname, AnonymousIdentity.user_id).filter(
+                AnonymousIdentity.id.in_(missing)
+            ).all()
+            for row in rows:
+                result[row.id] = self.put(row.id, row.nickname, row.user_id).nickname
+        return result
+
+    def put(self, identity_id: int, nickname: str, user_id: int) -> IdentityRef:
+        """Cache an identity and return its IdentityRef"""
+        ref = IdentityRef(identity_id, nickname, user_id)
+        with self._lock:
+            self._by_nickname[nickname] = (time.monotonic() + self.ttl, ref)
+            self._by_nickname.move_to_end(nickname)
+            self._by_id[identity_id] = nickname
+            while len(self._by_nickname) > self.max_size:
+                _, (_, evicted) = self._by_nickname.popitem(last=False)
+                if self._by_id.get(evicted.id) == evicted.nickname:
+                    del self._by_id[evicted.id]
+        return ref
+
+    def forget(self, nickname: str) -> None:
+        """Drop a deleted identity"""
+        with self._lock:
+            entry = self._by_nickname.pop(nickname, None)
+            if entry is not None and self._by_id.get(entry[1].id) == nickname:
+                del self._by_id[entry[1].id]
+
+    def clear(self) -> None:
+        """Drop all cached entries"""
+        with self._lock:
+            self._by_nickname.clear()
+            self._by_id.clear()
+
+
+identity_cache = IdentityCache()
@@ -5,7 +5,7 @@ from sqlalchemy.orm import Session
 from . import models, schemas, captcha, security_questions, identity
 from .security_questions import generate_salt, hash_password, hash_answer
 from .database import SessionLocal, engine
-from .auth import authenticate_user, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_current_user, get_user_by_username, REFRESH_TOKEN_EXPIRE_DAYS, ALGORITHM, SECRET_KEY
+from .auth import authenticate_user, create_access_token, create_user_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_current_user, get_user_by_username, REFRESH_TOKEN_EXPIRE_DAYS, ALGORITHM, SECRET_KEY
 from jose import JWTError, jwt
 
 models.Base.metadata.create_all(bind=engine)
@@ -171,10 +171,7 @@ async def login_for_access_token(
     
     # Create access token with short expiry
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.account, "type": "access"}, 
-        expires_delta=access_token_expires
-    )
+    access_token = create_user_access_token(db, user, expires_delta=access_token_expires)
     
     # Create refresh token with longer expiry
     refresh_token_expires = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
@@ -224,10 +221,7 @@ async def refresh_token(
         
         # Generate new access token
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": username, "type": "access"},
-            expires_delta=access_token_expires
-        )
+        access_token = create_user_access_token(db, user, expires_delta=access_token_expires)
         
         # Return only the new access token
         return {"access": access_token}
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, ForeignKey, MetaData, Table
+from sqlalchemy import create_engine, Column, Integer, ForeignKey, MetaData, Table, text
 from .database import SQLALCHEMY_DATABASE_URL
 
 def run_migration():
@@ -21,6 +21,17 @@ def run_migration():
     else:
         print("Column already exists, no migration needed")
 
+    migrate_token_version(engine, users)
+
+def migrate_token_version(engine, users):
+    """Add users.token_version, which access tokens are checked against"""
+    if 'token_version' in [c.name for c in users.columns]:
+        print("users.token_version already exists, no migration needed")
+        return
+    with engine.begin() as conn:
+        conn.execute(text('ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0'))
+    print("Migration successful: Added token_version to users table")
+
 # This script can be run directly
 if __name__ == "__main__":
     run_migration()
\ No newline at end of file
@@ -13,6 +13,9 @@ class User(Base):
     
     # Add column to store the last used identity ID
     last_used_identity_id = Column(Integer, ForeignKey("anonymous_identities.id"), nullable=True)
+
+    # Bumped whenever the user's identities change; access tokens carry the version they were issued with
+    token_version = Column(Integer, default=0, nullable=False, server_default="0")
     
     # Add relationship to anonymous identities
     identities = relationship("AnonymousIdentity", back_populates="user", 
@@ -7,12 +7,18 @@ import os
 import logging
 from pathlib import Path
 from .chat import chat  
+from .chat.hub import get_chat_hub
+from .chat.chat import recommend_candidates
 from .topic import topic  
 from .violence_detection.image_detector import get_detector, ImageDetector  
+from .violence_detection.inference_server import get_inference_server
+from .violence_detection.result_cache import ModerationCache, DEFAULT_PERSIST_PATH
+from .wordscheck.checker import words_checker
+from .wordscheck.batcher import get_moderation_batcher
 from .login.login import router as login_router  
 from .login.models import Base as LoginBase
 from .login.database import engine as login_engine
-from .topic.topic import app as topic_app, topic_route
+from .topic.topic import app as topic_app, topic_route, view_counter, hot_ranking
 from .config import DEBUG  
 import subprocess
 import sys
@@ -27,6 +33,8 @@ logging.basicConfig(
 # 创建数据库表
 LoginBase.metadata.create_all(bind=login_engine)
 
+# 审核结果缓存持久化到模型检查点目录，重启后转发图片仍可直接命中
+get_inference_server(cache=ModerationCache(persist_path=DEFAULT_PERSIST_PATH))
 detector = get_detector()
 logging.info(f"图像检测器初始化完成，使用设备: {detector.classifier.device}")
 
@@ -70,6 +78,12 @@ async def startup_event():
     # 现有代码
     topic_app.state.image_detector = detector
     logging.info("已将图像检测器添加到topic_app状态")
+
+    # 启动热门排行刷新线程和推荐候选重算线程，启动后立即计算一次
+    hot_ranking.start()
+    recommend_candidates.start()
+    # 多worker部署缺少消息转发配置时在启动阶段报错
+    get_chat_hub()
     
     # 启动敏感词检测服务
     try:
@@ -122,6 +136,21 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     global word_check_process
+    
+    # 写回尚未落库的浏览量
+    view_counter.stop()
+    # 停止热门排行刷新线程
+    hot_ranking.stop()
+    # 停止图像推理服务线程
+    detector.inference_server.stop()
+    # 停止文本审核批处理服务并关闭敏感词检测服务连接池
+    get_moderation_batcher().stop()
+    words_checker.sidecar.close()
+    # 关闭私聊推送的转发连接
+    get_chat_hub().close()
+    # 停止推荐候选重算线程
+    recommend_candidates.stop()
+    
     if word_check_process is not None:
         logging.info(f"正在终止敏感词检测服务 (PID: {word_check_process.pid})")
         try:
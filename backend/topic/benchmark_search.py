@@ -0,0 +1,145 @@
+"""
+全文检索性能测试脚本
+在临时数据库中生成话题和帖子语料，建立全文索引，比较LIKE子串查询与FTS5检索的耗时
+
+运行方式（仓库根目录）:
+    python -m backend.topic.benchmark_search --posts 1000000
+"""
+
+import os
+import time
+import uuid
+import random
+import argparse
+import itertools
+import tempfile
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from .model import Base, TotalTopic, APost
+from .search import rebuild_index, search_topics
+
+# 每个话题的帖子数
+POSTS_PER_TOPIC = 10
+# 每帖词数范围
+WORDS_PER_POST = (10, 60)
+REPEAT = 5
+# 常用汉字，用于生成随机词表
+CHARS = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所"
+    "民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处理府研质"
+)
+
+
+def log(message):
+    """输出日志到控制台"""
+    print(message)
+
+
+def build_vocabulary(rng, size=20000):
+    """生成2~4字的随机词表，按Zipf分布抽取使词频接近真实语料，返回词表和累计权重"""
+    words = sorted({"".join(rng.choice(CHARS) for _ in range(rng.randint(2, 4))) for _ in range(size)})
+    rng.shuffle(words)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    return words, cum_weights
+
+
+def generate_corpus(engine, rng, posts, words, cum_weights):
+    """批量写入话题和帖子，全部设为审核通过"""
+    now = time.time()
+    topics = posts // POSTS_PER_TOPIC
+    batch = 10000
+    with engine.begin() as conn:
+        for start in range(0, topics, batch):
+            topic_rows, post_rows = [], []
+            for i in range(start, min(start + batch, topics)):
+                topic_uuid = uuid.uuid4()
+                topic_rows.append({
+                    "uuid": topic_uuid,
+                    "author_name": "bench",
+                    "topic_title": "".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(2, 5))),
+                    "create_time": now - i,
+                    "update_time": now - i,
+                    "view_times": 0,
+                    "floor_count": POSTS_PER_TOPIC,
+                })
+                for floor in range(1, POSTS_PER_TOPIC + 1):
+                    post_rows.append({
+                        "uuid": uuid.uuid4(),
+                        "author_name": "bench",
+                        "back_to": 0,
+                        "floor": floor,
+                        "content": "".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(*WORDS_PER_POST))),
+                        "create_time": now - i,
+                        "visible_state": 0,
+                        "parent_topic_uuid": topic_uuid,
+                        "like_num": 0,
+                    })
+            conn.execute(TotalTopic.__table__.insert(), topic_rows)
+            conn.execute(APost.__table__.insert(), post_rows)
+
+
+def time_call(func, *args):
+    """返回平均耗时（毫秒）和最后一次的结果"""
+    costs = []
+    result = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func(*args)
+        costs.append(time.perf_counter() - start)
+    return sum(costs) / len(costs) * 1000, result
+
+
+def like_title(db, keyword):
+    """原始实现：标题子串匹配"""
+    return db.execute(text(
+        "SELECT uuid FROM totaltopic WHERE topic_title LIKE :pattern ORDER BY update_time DESC LIMIT 20"
+    ), {"pattern": f"%{keyword}%"}).all()
+
+
+def like_content(db, keyword):
+    """标题和正文都用LIKE子串匹配"""
+    return db.execute(text(
+        "SELECT DISTINCT parent_topic_uuid FROM apost WHERE content LIKE :pattern LIMIT 20"
+    ), {"pattern": f"%{keyword}%"}).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全文检索性能测试")
+    parser.add_argument("--posts", type=int, default=1000000, help="生成的帖子数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words, cum_weights = build_vocabulary(rng)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "bench.db")
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+
+        log(f"生成 {args.posts} 条帖子...")
+        start = time.perf_counter()
+        generate_corpus(engine, rng, args.posts, words, cum_weights)
+        log(f"语料生成耗时: {time.perf_counter() - start:.1f} s，数据库 {os.path.getsize(path) / 2**20:.0f} MB")
+
+        with Session(engine) as db:
+            start = time.perf_counter()
+            count = rebuild_index(db)
+            log(f"索引 {count} 条帖子耗时: {time.perf_counter() - start:.1f} s，"
+                f"数据库 {os.path.getsize(path) / 2**20:.0f} MB")
+
+            # 高频词、中频词、低频词、两词组合、单字
+            keywords = [words[0], words[100], words[5000], f"{words[10]} {words[200]}", words[50][0]]
+            log(f"{'搜索词':<12}{'标题LIKE(ms)':>14}{'全文LIKE(ms)':>14}{'FTS5(ms)':>12}{'FTS5命中':>10}")
+            for keyword in keywords:
+                title_ms, _ = time_call(like_title, db, keyword)
+                content_ms, _ = time_call(like_content, db, keyword.split()[0])
+                fts_ms, hits = time_call(search_topics, db, keyword)
+                log(f"{keyword:<12}{title_ms:>14.1f}{content_ms:>14.1f}{fts_ms:>12.1f}{len(hits):>10}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
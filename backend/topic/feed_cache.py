@@ -0,0 +1,101 @@
+"""
+话题列表缓存
+
+首页最新话题和各标签的话题列表缓存为序列化好的JSON字节，命中时不再查询数据库，也不再编码JSON。
+发帖和回复会改变话题的更新时间，提交后由调用方使对应的首页和标签列表失效。
+失效时同时推进代数，失效之前开始计算、之后才写入的结果会被丢弃，不会覆盖新数据。
+条目另有较短的有效期，多进程部署时其他进程的缓存最多滞后这么久。
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+
+# 首页列表的键，标签列表的键为("tag", 标签名)
+RECENT_KEY = ("recent",)
+
+
+def tag_key(tag: str) -> tuple:
+    """标签列表的缓存键"""
+    return ("tag", tag)
+
+
+class FeedCache:
+    """线程安全的话题列表缓存"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 10.0):
+        """
+        初始化缓存
+
+        Args:
+            max_size: 最大条目数（首页加标签列表）
+            ttl: 条目有效期（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, Tuple[float, bytes]]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        """查询缓存，未命中或已过期时为None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def get_or_build(self, key: tuple, build: Callable[[], bytes]) -> bytes:
+        """
+        查询缓存，未命中时计算并写入
+
+        Args:
+            key: 缓存键
+            build: 生成序列化结果的函数
+
+        Returns:
+            bytes: 序列化后的JSON
+        """
+        payload = self.get(key)
+        if payload is not None:
+            return payload
+        with self._lock:
+            generation = self._generation
+        payload = build()
+        with self._lock:
+            # 计算期间有过失效，结果可能已经过时，不写入
+            if generation == self._generation:
+                self._entries[key] = (time.monotonic() + self.ttl, payload)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return payload
+
+    def invalidate(self, tags: Iterable[str] = ()) -> None:
+        """
+        使首页和指定标签的列表失效
+
+        Args:
+            tags: 被更新话题的标签
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(RECENT_KEY, None)
+            for tag in tags:
+                self._entries.pop(tag_key(tag), None)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
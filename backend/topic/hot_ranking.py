@@ -0,0 +1,213 @@
+"""
+热门话题排行
+
+排行由后台线程定期计算并序列化为JSON保存在内存中，请求直接返回现成的字节和ETag。
+热度综合浏览、回复和点赞，每次互动按其自身发生的时间指数衰减，反映近期活跃度而不是累计量：
+浏览取自按小时分桶的topic_view_bucket，回复和点赞按创建时间同样按小时聚合。
+发帖和回复会提前唤醒刷新，但两次刷新之间至少间隔min_interval秒。
+刷新线程在应用启动时开始运行并立即计算一次，请求处理中不做同步计算。
+"""
+
+import json
+import math
+import time
+import heapq
+import hashlib
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Integer, cast, func
+from sqlalchemy.orm import Session, joinedload
+
+from .model import TotalTopic, APost, PostLike, TopicViewBucket
+from .view_counter import VIEW_BUCKET_SECONDS
+
+
+class HotRanking:
+    """物化的热门话题排行"""
+
+    def __init__(self,
+                 get_session: Callable[[], Iterator[Session]],
+                 render: Callable[[List[TotalTopic]], dict],
+                 size: int = 20,
+                 refresh_interval: float = 60.0,
+                 min_interval: float = 5.0,
+                 half_life_hours: float = 24.0,
+                 window_days: float = 30.0,
+                 view_weight: float = 1.0,
+                 reply_weight: float = 5.0,
+                 like_weight: float = 3.0):
+        """
+        初始化排行
+
+        Args:
+            get_session: 数据库会话依赖（生成器函数，与get_db相同）
+            render: 把排好序的话题转换为响应数据
+            size: 排行条数
+            refresh_interval: 无写入时的刷新间隔（秒）
+            min_interval: 两次刷新的最小间隔（秒）
+            half_life_hours: 热度半衰期（小时）
+            window_days: 只统计该天数内的互动
+            view_weight: 每次浏览的权重
+            reply_weight: 每条回复的权重
+            like_weight: 每个点赞的权重
+        """
+        self.get_session = get_session
+        self.render = render
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self.min_interval = min_interval
+        self.half_life = half_life_hours * 3600
+        self.window = window_days * 86400
+        self.view_weight = view_weight
+        self.reply_weight = reply_weight
+        self.like_weight = like_weight
+
+        # (版本号, JSON字节, ETag)，整体替换保证读取到一致的快照
+        self._snapshot: Optional[Tuple[int, bytes, str]] = None
+        self._refresh_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def decay(self, timestamp: float, now: float) -> float:
+        """发生在timestamp的一次互动在now时的权重"""
+        return math.pow(0.5, max(now - timestamp, 0.0) / self.half_life)
+
+    def _bucketed(self, db: Session, topic_col, time_col, since: float, *filters, join=None) -> List[Tuple]:
+        """按话题和小时聚合的互动数: [(话题, 桶序号, 次数)]"""
+        bucket = cast(time_col / VIEW_BUCKET_SECONDS, Integer)
+        query = db.query(topic_col, bucket, func.count())
+        if join is not None:
+            query = query.select_from(join[0]).join(*join[1:])
+        return query.filter(time_col >= since, *filters).group_by(topic_col, bucket).all()
+
+    def scores(self, db: Session, now: float) -> Dict[object, float]:
+        """
+        计算窗口内有活动的话题的热度
+
+        热度 = 最后活跃时间的衰减值（没有互动的话题按新旧排序）
+             + 各次浏览、回复、点赞的权重按各自发生时间衰减后的和
+
+        Returns:
+            Dict[object, float]: 话题UUID到热度
+        """
+        since = now - self.window
+        scores: Dict[object, float] = defaultdict(float)
+        for topic_uuid, update_time in db.query(TotalTopic.uuid, TotalTopic.update_time).filter(
+            TotalTopic.update_time >= since
+        ):
+            scores[topic_uuid] += self.decay(update_time or 0, now)
+
+        # 桶内的互动按桶的中点计时
+        half_bucket = VIEW_BUCKET_SECONDS / 2
+        for topic_uuid, bucket_start, views in db.query(
+            TopicViewBucket.topic_uuid, TopicViewBucket.bucket_start, TopicViewBucket.views
+        ).filter(TopicViewBucket.bucket_start >= since):
+            scores[topic_uuid] += self.view_weight * (views or 0) * self.decay(bucket_start + half_bucket, now)
+
+        # 可见的回复，不计主楼
+        for topic_uuid, bucket, replies in self._bucketed(
+            db, APost.parent_topic_uuid, APost.create_time, since, APost.visible_state == 0, APost.floor > 1
+        ):
+            scores[topic_uuid] += self.reply_weight * replies * self.decay(
+                bucket * VIEW_BUCKET_SECONDS + half_bucket, now)
+
+        for topic_uuid, bucket, count in self._bucketed(
+            db, APost.parent_topic_uuid, PostLike.create_time, since, APost.visible_state == 0,
+            join=(PostLike, APost, APost.uuid == PostLike.post_uuid),
+        ):
+            scores[topic_uuid] += self.like_weight * count * self.decay(
+                bucket * VIEW_BUCKET_SECONDS + half_bucket, now)
+        return scores
+
+    def refresh(self) -> int:
+        """
+        重新计算排行
+
+        Returns:
+            int: 新的版本号
+        """
+        with self._refresh_lock:
+            now = time.time()
+            session_gen = self.get_session()
+            db = next(session_gen)
+            try:
+                scores = self.scores(db, now)
+                top = heapq.nlargest(self.size, scores, key=scores.__getitem__)
+                order = {topic_uuid: rank for rank, topic_uuid in enumerate(top)}
+                topics = db.query(TotalTopic).options(
+                    joinedload(TotalTopic.tags)
+                ).filter(TotalTopic.uuid.in_(list(order))).all() if order else []
+                topics.sort(key=lambda topic: order[topic.uuid])
+
+                payload, etag = self._encode(topics)
+            finally:
+                session_gen.close()
+
+            # 内容不变时保持版本号和ETag，客户端缓存继续有效
+            if self._snapshot is not None and self._snapshot[2] == etag:
+                return self._snapshot[0]
+            version = self._snapshot[0] + 1 if self._snapshot else 1
+            self._snapshot = (version, payload, etag)
+            return version
+
+    def _encode(self, topics: List[TotalTopic]) -> Tuple[bytes, str]:
+        payload = json.dumps(self.render(topics), ensure_ascii=False).encode("utf-8")
+        return payload, f'"{hashlib.sha256(payload).hexdigest()[:32]}"'
+
+    def get(self) -> Tuple[bytes, str]:
+        """
+        获取当前排行
+
+        Returns:
+            (payload, etag): JSON字节和ETag；刷新线程尚未完成第一次计算时为空排行
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self._encode([])
+        return snapshot[1], snapshot[2]
+
+    @property
+    def version(self) -> int:
+        """当前版本号，尚未计算时为0"""
+        return self._snapshot[0] if self._snapshot else 0
+
+    def notify(self) -> None:
+        """有新的发帖或回复，提前唤醒刷新"""
+        self._wake.set()
+
+    def start(self) -> None:
+        """启动刷新线程（已启动时不做任何事）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="hot-ranking", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """停止刷新线程"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        # 启动后立即计算一次
+        self._wake.set()
+        while not self._stop.is_set():
+            self._wake.wait(self.refresh_interval)
+            if self._stop.is_set():
+                break
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"热门排行刷新失败: {e}")
+            # 写入频繁时合并刷新
+            self._stop.wait(self.min_interval)
@@ -0,0 +1,123 @@
+"""
+帖子图片的内容寻址存储
+
+上传的图片按内容的sha256摘要命名保存，相同的图片只存一份。
+文件名即摘要，内容不会再改变，因此可以用摘要作为ETag。
+图片所属的帖子之后可能被隐藏或审核不通过，响应只允许浏览器私有缓存很短时间，
+过期后凭ETag重新验证，接口每次都会重新检查帖子是否仍可见。
+"""
+
+import os
+import re
+import uuid
+import hashlib
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from sqlalchemy.orm import Session
+
+from .model import APost, MyImageModel
+
+# 文件存储配置
+UPLOAD_DIR = "uploads"
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# 图片对外访问的URL前缀（topic子应用挂载在/api/posts下）
+MEDIA_URL_PREFIX = "/api/posts/media"
+
+# 不允许共享缓存保存，浏览器缓存60秒后凭ETag重新验证
+CACHE_CONTROL = "private, max-age=60"
+
+# 摘要文件名，同时兼容旧版本以uuid命名的文件
+_FILE_NAME_RE = re.compile(r"^[0-9a-fA-F\-]+(\.[0-9A-Za-z]+)?$")
+
+
+def content_digest(data: bytes) -> str:
+    """计算内容摘要"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _normalize_ext(filename: Optional[str]) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    if not re.fullmatch(r"\.[0-9a-z]{1,8}", ext):
+        return ""
+    return ext
+
+
+def store_bytes(data: bytes, filename: Optional[str] = None) -> str:
+    """
+    按内容摘要保存图片
+
+    Args:
+        data: 图片字节数据
+        filename: 原始文件名，仅用于确定扩展名
+
+    Returns:
+        str: 保存后的文件路径，相同内容总是得到相同路径
+    """
+    file_path = f"{UPLOAD_DIR}/{content_digest(data)}{_normalize_ext(filename)}"
+    if os.path.exists(file_path):
+        return file_path
+
+    # 先写临时文件再原子重命名，避免并发上传同一图片时读到半写入的文件
+    tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return file_path
+
+
+def store_file(src_path: str) -> str:
+    """将已有文件（如和谐图片）放入内容寻址存储"""
+    with open(src_path, "rb") as f:
+        data = f.read()
+    return store_bytes(data, str(src_path))
+
+
+def release_file(db: Session, file_path: str) -> None:
+    """删除不再被任何图片记录引用的文件"""
+    referenced = db.query(MyImageModel.id).filter(MyImageModel.image_path == file_path).first()
+    if referenced is None and os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def media_url(file_path: str) -> str:
+    """图片路径转换为对外访问的URL"""
+    return f"{MEDIA_URL_PREFIX}/{os.path.basename(file_path)}"
+
+
+def media_response(request: Request, db: Session, file_name: str) -> Response:
+    """
+    返回图片文件，只提供属于审核通过帖子的图片
+
+    待审核、未通过审核的帖子和已被替换的违规原图都不对外提供。
+
+    Args:
+        request: 请求，用于读取If-None-Match
+        db: 数据库会话
+        file_name: 图片文件名
+
+    Returns:
+        Response: 图片文件，或内容未变化时的304响应
+    """
+    if not _FILE_NAME_RE.match(file_name):
+        raise HTTPException(status_code=404, detail="图片不存在")
+    file_path = f"{UPLOAD_DIR}/{file_name}"
+    visible = db.query(MyImageModel.id).join(APost, APost.uuid == MyImageModel.post_uuid).filter(
+        MyImageModel.image_path == file_path, APost.visible_state == 0
+    ).first()
+    if visible is None or not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="图片不存在")
+
+    etag = f'"{os.path.splitext(file_name)[0]}"'
+    headers = {"etag": etag, "cache-control": CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    # FileResponse自带Range请求支持
+    return FileResponse(file_path, headers=headers)
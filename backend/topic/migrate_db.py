@@ -0,0 +1,174 @@
+import json
+
+from sqlalchemy import create_engine, inspect, text
+from ..login.database import SQLALCHEMY_DATABASE_URL
+
+def migrate_image_path_unique(engine):
+    """myimagemodel.image_path 去掉唯一约束（图片改为内容寻址存储，可被多个帖子共享）"""
+    inspector = inspect(engine)
+    if 'myimagemodel' not in inspector.get_table_names():
+        return
+    unique_columns = [c['column_names'] for c in inspector.get_unique_constraints('myimagemodel')]
+    unique_columns += [i['column_names'] for i in inspector.get_indexes('myimagemodel') if i['unique']]
+    if ['image_path'] not in unique_columns:
+        print("myimagemodel.image_path has no unique constraint, no migration needed")
+        return
+
+    # SQLite 不支持删除约束，需要重建表
+    with engine.begin() as conn:
+        conn.execute(text('ALTER TABLE myimagemodel RENAME TO myimagemodel_old'))
+        conn.execute(text(
+            'CREATE TABLE myimagemodel ('
+            'id INTEGER NOT NULL PRIMARY KEY, '
+            'title VARCHAR(255), '
+            'image_path VARCHAR(255), '
+            'post_uuid CHAR(32) NOT NULL REFERENCES apost(uuid))'
+        ))
+        conn.execute(text(
+            'INSERT INTO myimagemodel (id, title, image_path, post_uuid) '
+            'SELECT id, title, image_path, post_uuid FROM myimagemodel_old'
+        ))
+        conn.execute(text('DROP TABLE myimagemodel_old'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_myimagemodel_id ON myimagemodel (id)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_myimagemodel_image_path ON myimagemodel (image_path)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_myimagemodel_post_uuid ON myimagemodel (post_uuid)'))
+    print("Migration successful: Dropped unique constraint on myimagemodel.image_path")
+
+def migrate_floor_numbers(engine):
+    """apost增加楼层号列、totaltopic增加楼层计数列，按创建时间回填已有帖子的楼层号"""
+    inspector = inspect(engine)
+    if 'apost' not in inspector.get_table_names():
+        return
+    if 'floor' in [c['name'] for c in inspector.get_columns('apost')]:
+        print("apost.floor already exists, no migration needed")
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text('ALTER TABLE apost ADD COLUMN floor INTEGER'))
+        if 'floor_count' not in [c['name'] for c in inspector.get_columns('totaltopic')]:
+            conn.execute(text('ALTER TABLE totaltopic ADD COLUMN floor_count INTEGER DEFAULT 0'))
+        # 需要 SQLite 3.25+ 的窗口函数
+        conn.execute(text(
+            'UPDATE apost SET floor = ('
+            'SELECT numbered.rn FROM ('
+            'SELECT uuid, ROW_NUMBER() OVER (PARTITION BY parent_topic_uuid ORDER BY create_time, uuid) AS rn '
+            'FROM apost) AS numbered '
+            'WHERE numbered.uuid = apost.uuid)'
+        ))
+        conn.execute(text(
+            'UPDATE totaltopic SET floor_count = ('
+            'SELECT COALESCE(MAX(floor), 0) FROM apost WHERE apost.parent_topic_uuid = totaltopic.uuid)'
+        ))
+        conn.execute(text(
+            'CREATE UNIQUE INDEX IF NOT EXISTS ix_apost_topic_floor ON apost (parent_topic_uuid, floor)'
+        ))
+    print("Migration successful: Added apost.floor and totaltopic.floor_count")
+
+def migrate_like_set(engine):
+    """apost.like_set（JSON昵称列表）迁移到post_like表，并按点赞记录重算like_num"""
+    inspector = inspect(engine)
+    if 'apost' not in inspector.get_table_names():
+        return
+    if 'like_set' not in [c['name'] for c in inspector.get_columns('apost')]:
+        print("apost.like_set already migrated, no migration needed")
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS post_like ('
+            'post_uuid CHAR(32) NOT NULL REFERENCES apost(uuid), '
+            'identity_id INTEGER NOT NULL REFERENCES anonymous_identities(id), '
+            'PRIMARY KEY (post_uuid, identity_id))'
+        ))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_post_like_identity_id ON post_like (identity_id)'))
+
+        identity_ids = dict(conn.execute(text('SELECT nickname, id FROM anonymous_identities')).all())
+        rows = conn.execute(text("SELECT uuid, like_set FROM apost WHERE like_set IS NOT NULL AND like_set != '[]'")).all()
+        likes = []
+        for post_uuid, like_set in rows:
+            for nickname in set(json.loads(like_set) or []):
+                if nickname in identity_ids:
+                    likes.append({"post_uuid": post_uuid, "identity_id": identity_ids[nickname]})
+        if likes:
+            conn.execute(text(
+                'INSERT OR IGNORE INTO post_like (post_uuid, identity_id) VALUES (:post_uuid, :identity_id)'
+            ), likes)
+        conn.execute(text(
+            'UPDATE apost SET like_num = (SELECT COUNT(*) FROM post_like WHERE post_like.post_uuid = apost.uuid)'
+        ))
+        # 需要 SQLite 3.35+
+        conn.execute(text('ALTER TABLE apost DROP COLUMN like_set'))
+    print(f"Migration successful: Moved {len(likes)} likes from apost.like_set to post_like")
+
+def migrate_topic_tag_time(engine):
+    """topic_tag_association增加冗余的话题更新时间列，并建立(tag_id, update_time)索引"""
+    inspector = inspect(engine)
+    if 'topic_tag_association' not in inspector.get_table_names():
+        return
+    if 'update_time' in [c['name'] for c in inspector.get_columns('topic_tag_association')]:
+        print("topic_tag_association.update_time already exists, no migration needed")
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text('ALTER TABLE topic_tag_association ADD COLUMN update_time FLOAT'))
+        conn.execute(text(
+            'UPDATE topic_tag_association SET update_time = ('
+            'SELECT update_time FROM totaltopic WHERE totaltopic.uuid = topic_tag_association.topic_uuid)'
+        ))
+        conn.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_topic_tag_tag_time ON topic_tag_association (tag_id, update_time)'
+        ))
+        conn.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_topic_tag_topic ON topic_tag_association (topic_uuid)'
+        ))
+    print("Migration successful: Added topic_tag_association.update_time")
+
+def migrate_search_index(engine):
+    """创建全文索引表，并为已有的审核通过帖子建立索引"""
+    from sqlalchemy.orm import Session
+    from .model import Base, SearchDoc
+    from .search import rebuild_index
+
+    inspector = inspect(engine)
+    if 'apost' not in inspector.get_table_names():
+        return
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        if db.query(SearchDoc.id).first() is not None:
+            print("search index already built, no migration needed")
+            return
+        count = rebuild_index(db)
+    print(f"Migration successful: Indexed {count} posts for full-text search")
+
+def migrate_like_time(engine):
+    """post_like增加点赞时间列，已有的点赞按帖子的创建时间回填"""
+    inspector = inspect(engine)
+    if 'post_like' not in inspector.get_table_names():
+        return
+    if 'create_time' in [c['name'] for c in inspector.get_columns('post_like')]:
+        print("post_like.create_time already exists, no migration needed")
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text('ALTER TABLE post_like ADD COLUMN create_time FLOAT'))
+        conn.execute(text(
+            'UPDATE post_like SET create_time = ('
+            'SELECT apost.create_time FROM apost WHERE apost.uuid = post_like.post_uuid)'
+        ))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_post_like_create_time ON post_like (create_time)'))
+    print("Migration successful: Added post_like.create_time")
+
+def run_migration():
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    )
+    migrate_image_path_unique(engine)
+    migrate_floor_numbers(engine)
+    migrate_like_set(engine)
+    migrate_topic_tag_time(engine)
+    migrate_search_index(engine)
+    migrate_like_time(engine)
+
+# This script can be run directly
+if __name__ == "__main__":
+    run_migration()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, ForeignKey, Table, JSON
+from sqlalchemy import Column, String, Integer, Float, Boolean, ForeignKey, Table, JSON, Index, DDL, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import uuid
@@ -13,18 +13,22 @@ from ..login.models import AnonymousIdentity, Base
 # SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Base = declarative_base()
 
-# 主题与标签的多对多关联表（保持不变）
+# 主题与标签的多对多关联表
 topic_tag_association = Table(
     'topic_tag_association', Base.metadata,
     Column('topic_uuid', UUID(as_uuid=True), ForeignKey('totaltopic.uuid')),
-    Column('tag_id', Integer, ForeignKey('tag.id'))
+    Column('tag_id', Integer, ForeignKey('tag.id')),
+    # 冗余话题的更新时间，标签列表是(tag_id, update_time)索引上的一次范围扫描
+    Column('update_time', Float),
+    Index('ix_topic_tag_tag_time', 'tag_id', 'update_time'),
+    Index('ix_topic_tag_topic', 'topic_uuid'),
 )
 
 class MyImageModel(Base):
     __tablename__ = "myimagemodel"
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255))
-    image_path = Column(String(255), unique=True)  # 添加唯一约束
+    image_path = Column(String(255), index=True)  # 内容寻址存储，相同图片可被多个帖子引用
     post_uuid = Column(
         UUID(as_uuid=True), 
         ForeignKey('apost.uuid'), 
@@ -47,14 +51,20 @@ class TotalTopic(Base):
     create_time = Column(Float)
     update_time = Column(Float)
     view_times = Column(Integer, default=0)
+    floor_count = Column(Integer, default=0)  # 已分配的最大楼层号，新楼层在插入时原子递增
     posts = relationship("APost", back_populates="topic", cascade="all, delete-orphan")
     tags = relationship("Tag", secondary=topic_tag_association, back_populates="topics")
 
 class APost(Base):
     __tablename__ = "apost"
+    __table_args__ = (
+        # 按楼层号定位和分页都是索引上的点查询/范围查询
+        Index('ix_apost_topic_floor', 'parent_topic_uuid', 'floor', unique=True),
+    )
     uuid = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     author_name = Column(String(100), index=True)
     back_to = Column(Integer)
+    floor = Column(Integer)  # 在所属话题中的楼层号，从1开始，插入时分配且不再变化
     content = Column(String)
     create_time = Column(Float, index=True)
     visible_state = Column(Integer, default=-1) # -1 means wait for checking, 1 means check failed and 0 means check passed
@@ -64,8 +74,40 @@ class APost(Base):
         index=True  # 添加索引
     )
     topic = relationship("TotalTopic", back_populates="posts")
-    like_num = Column(Integer, default=0)
+    like_num = Column(Integer, default=0)  # 与post_like行数一致，点赞/取消时原子增减
     # 修改为一对多关系（一个帖子多个图片）
     images = relationship("MyImageModel", back_populates="post", cascade="all, delete-orphan")
-    like_set = Column(JSON, default=lambda: [])  # 修改为JSON类型，默认空列表
+    likes = relationship("PostLike", cascade="all, delete-orphan")
+
+class PostLike(Base):
+    """点赞记录，每个身份对每个帖子至多一条"""
+    __tablename__ = "post_like"
+    post_uuid = Column(UUID(as_uuid=True), ForeignKey('apost.uuid'), primary_key=True)
+    identity_id = Column(
+        Integer,
+        ForeignKey('anonymous_identities.id'),
+        primary_key=True,
+        index=True  # 按身份查询点赞过的帖子
+    )
+    create_time = Column(Float, index=True)  # 热门排行按点赞时间衰减
 
+class TopicViewBucket(Base):
+    """按小时分桶的话题浏览量，热门排行按桶的时间衰减"""
+    __tablename__ = "topic_view_bucket"
+    topic_uuid = Column(UUID(as_uuid=True), ForeignKey('totaltopic.uuid'), primary_key=True)
+    bucket_start = Column(Integer, primary_key=True, index=True)  # 桶的起始时间戳（秒）
+    views = Column(Integer, default=0)
+
+class SearchDoc(Base):
+    """全文索引文档，id与post_fts的rowid一一对应"""
+    __tablename__ = "search_doc"
+    id = Column(Integer, primary_key=True)
+    post_uuid = Column(UUID(as_uuid=True), ForeignKey('apost.uuid'), unique=True, nullable=False)
+    topic_uuid = Column(UUID(as_uuid=True), ForeignKey('totaltopic.uuid'), index=True, nullable=False)
+
+# FTS5虚表只存倒排索引（不保存原文），索引内容是二元分词后的标题和正文，见search.py
+event.listen(
+    Base.metadata,
+    "after_create",
+    DDL("CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(title, body, content='')").execute_if(dialect="sqlite"),
+)
@@ -0,0 +1,223 @@
+"""
+话题全文检索
+
+SQLite FTS5自带的分词器不切分中文，写入和查询前统一在这里做二元分词：
+中日韩文字切成相邻两字的词元，每段末尾的单字也单独入索引，拉丁字母和数字按单词切分并转小写。
+查询词按同样方式切分后组成短语查询，以单字结尾时改为前缀查询，任意长度的子串都能命中。
+索引随审核结果维护：帖子审核通过后写入，未通过时移除；主楼的文档同时带上话题标题。
+索引表不保存原文，删除时按帖子内容重新分词，修改分词规则后需要重建索引。
+
+重建索引（仓库根目录）:
+    python -m backend.topic.search rebuild
+"""
+
+import re
+import uuid
+import argparse
+import unicodedata
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .model import APost, TotalTopic, SearchDoc
+
+# 中日韩文字（假名、统一表意文字及扩展A、兼容表意文字、谚文音节）
+_CJK = "぀-ヿ㐀-䶿一-鿿豈-﫿가-힯"
+_RUN_RE = re.compile(f"([{_CJK}]+)|((?:(?![{_CJK}])[^\\W_])+)")
+
+# 标题命中的权重（正文为1）
+TITLE_WEIGHT = 10.0
+
+
+def _runs(content: str) -> Iterator[Tuple[str, bool]]:
+    """切分为连续的中日韩文字段和单词，返回(片段, 是否中日韩文字)"""
+    content = unicodedata.normalize("NFKC", content).casefold()
+    for match in _RUN_RE.finditer(content):
+        yield (match.group(1), True) if match.group(1) else (match.group(2), False)
+
+
+def _run_tokens(run: str, cjk: bool) -> List[str]:
+    if not cjk:
+        return [run]
+    # 末尾单字保证以任意字开头的子串都有词元可以对上
+    return [run[i:i + 2] for i in range(len(run) - 1)] + [run[-1]]
+
+
+def tokenize(content: str) -> List[str]:
+    """
+    索引用分词
+
+    Args:
+        content: 原始文本
+
+    Returns:
+        List[str]: 词元列表，按原文顺序排列
+    """
+    tokens = []
+    for run, cjk in _runs(content):
+        tokens.extend(_run_tokens(run, cjk))
+    return tokens
+
+
+def build_query(keyword: str) -> Optional[str]:
+    """
+    把搜索词转换为FTS5查询表达式
+
+    以空白分隔的每个词都必须命中，词内的词元组成短语（要求相邻）。
+    词末尾的中日韩文字段在原文中可能还有后续文字，不带末尾单字；只剩一个字时用前缀匹配。
+
+    Args:
+        keyword: 用户输入的搜索词
+
+    Returns:
+        Optional[str]: 查询表达式，搜索词中没有可检索的文字时为None
+    """
+    phrases = []
+    for term in keyword.split():
+        runs = list(_runs(term))
+        if not runs:
+            continue
+        tokens = []
+        prefix = False
+        for i, (run, cjk) in enumerate(runs):
+            run_tokens = _run_tokens(run, cjk)
+            if cjk and i == len(runs) - 1:
+                if len(run) == 1:
+                    prefix = True
+                else:
+                    run_tokens = run_tokens[:-1]
+            tokens.extend(run_tokens)
+        # 词元只含字母数字，无需转义
+        phrases.append('"' + " ".join(tokens) + '"' + ("*" if prefix else ""))
+    return " AND ".join(phrases) or None
+
+
+def _document(title: Optional[str], floor: int, content: Optional[str]) -> Tuple[str, str]:
+    """帖子的索引列：标题只记在主楼上"""
+    return (" ".join(tokenize(title or "")) if floor == 1 else "", " ".join(tokenize(content or "")))
+
+
+def index_post(db: Session, post: APost) -> None:
+    """
+    写入（或更新）帖子的索引文档，在调用方的事务中执行
+
+    Args:
+        db: 数据库会话
+        post: 审核通过的帖子
+    """
+    remove_post(db, post)
+    doc = SearchDoc(post_uuid=post.uuid, topic_uuid=post.parent_topic_uuid)
+    db.add(doc)
+    db.flush()
+    title, body = _document(post.topic.topic_title, post.floor, post.content)
+    db.execute(
+        text("INSERT INTO post_fts (rowid, title, body) VALUES (:id, :title, :body)"),
+        {"id": doc.id, "title": title, "body": body},
+    )
+
+
+def remove_post(db: Session, post: APost) -> None:
+    """从索引中移除帖子（未收录时不做任何事）"""
+    doc_id = db.query(SearchDoc.id).filter(SearchDoc.post_uuid == post.uuid).scalar()
+    if doc_id is None:
+        return
+    # 无原文的FTS5表需要提供写入时的内容才能删除
+    title, body = _document(post.topic.topic_title, post.floor, post.content)
+    db.execute(
+        text("INSERT INTO post_fts (post_fts, rowid, title, body) VALUES ('delete', :id, :title, :body)"),
+        {"id": doc_id, "title": title, "body": body},
+    )
+    db.query(SearchDoc).filter(SearchDoc.id == doc_id).delete(synchronize_session=False)
+
+
+def search_topics(db: Session, keyword: str, offset: int = 0, limit: int = 20) -> List[uuid.UUID]:
+    """
+    按相关度检索话题
+
+    Args:
+        db: 数据库会话
+        keyword: 搜索词
+        offset: 跳过的话题数
+        limit: 返回的话题数
+
+    Returns:
+        List[uuid.UUID]: 话题UUID，按话题内最相关帖子的BM25得分排序
+    """
+    query = build_query(keyword)
+    if query is None:
+        return []
+    # 全部命中帖子都在FTS5中按bm25打分，不按新旧截断；
+    # bm25只能在全文查询本身中调用，先物化命中结果，再按话题聚合并在同一条语句中分页
+    stmt = text(
+        "WITH hits AS MATERIALIZED ("
+        "SELECT rowid AS id, bm25(post_fts, :title_weight, 1.0) AS score "
+        "FROM post_fts WHERE post_fts MATCH :query) "
+        "SELECT search_doc.topic_uuid, MIN(hits.score) AS score FROM hits "
+        "JOIN search_doc ON search_doc.id = hits.id "
+        "GROUP BY search_doc.topic_uuid ORDER BY score, search_doc.topic_uuid "
+        "LIMIT :limit OFFSET :offset"
+    ).columns(topic_uuid=SearchDoc.topic_uuid.type)
+    rows = db.execute(stmt, {
+        "title_weight": TITLE_WEIGHT, "query": query, "limit": limit, "offset": offset,
+    }).all()
+    return [row.topic_uuid for row in rows]
+
+
+def rebuild_index(db: Session, batch_size: int = 1000) -> int:
+    """
+    清空并按当前审核状态重建索引
+
+    Args:
+        db: 数据库会话
+        batch_size: 每批写入的帖子数
+
+    Returns:
+        int: 写入的帖子数
+    """
+    db.execute(text("INSERT INTO post_fts (post_fts) VALUES ('delete-all')"))
+    db.query(SearchDoc).delete(synchronize_session=False)
+
+    # 按发帖时间写入，文档id的顺序与新旧一致
+    rows = db.query(
+        APost.uuid, APost.parent_topic_uuid, APost.floor, APost.content, TotalTopic.topic_title
+    ).join(TotalTopic, TotalTopic.uuid == APost.parent_topic_uuid).filter(
+        APost.visible_state == 0
+    ).order_by(APost.create_time).yield_per(batch_size)
+
+    count = 0
+    docs, fts_rows = [], []
+    for row in rows:
+        count += 1
+        title, body = _document(row.topic_title, row.floor, row.content)
+        docs.append({"id": count, "post_uuid": row.uuid, "topic_uuid": row.parent_topic_uuid})
+        fts_rows.append({"id": count, "title": title, "body": body})
+        if len(docs) >= batch_size:
+            _write_batch(db, docs, fts_rows)
+            docs, fts_rows = [], []
+    if docs:
+        _write_batch(db, docs, fts_rows)
+    db.execute(text("INSERT INTO post_fts (post_fts) VALUES ('optimize')"))
+    db.commit()
+    return count
+
+
+def _write_batch(db: Session, docs: List[dict], fts_rows: List[dict]) -> None:
+    db.execute(SearchDoc.__table__.insert(), docs)
+    db.execute(text("INSERT INTO post_fts (rowid, title, body) VALUES (:id, :title, :body)"), fts_rows)
+
+
+if __name__ == "__main__":
+    from ..login.database import SessionLocal, engine, Base
+
+    parser = argparse.ArgumentParser(description="话题全文索引维护")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: 清空并重建索引")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        total = rebuild_index(session)
+    finally:
+        session.close()
+    print(f"索引重建完成，共 {total} 条帖子")
@@ -0,0 +1,128 @@
+"""
+标签索引
+
+标签按字符组成前缀树，每个节点保存以该前缀开头、使用次数最多的前top_k个标签，
+补全只需沿输入的前缀走到对应节点，耗时与标签总数无关。
+使用次数在首次查询时从数据库加载，之后随发帖在内存中累加（话题不会被删除，计数只增不减）。
+"""
+
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from .model import Tag, topic_tag_association
+
+
+def touch_topic_tags(db: Session, topic_uuid, update_time: float) -> None:
+    """同步关联表中冗余的话题更新时间，在调用方的事务中执行"""
+    db.execute(
+        update(topic_tag_association)
+        .where(topic_tag_association.c.topic_uuid == topic_uuid)
+        .values(update_time=update_time)
+    )
+
+
+class _Node:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # [(使用次数, 标签)]，按次数降序；更新时整体替换，读取无需加锁
+        self.top: List[Tuple[int, str]] = []
+
+
+class TagIndex:
+    """标签前缀树，支持按使用次数排序的前缀补全"""
+
+    def __init__(self, get_session: Callable[[], Iterator[Session]], top_k: int = 10):
+        """
+        初始化索引
+
+        Args:
+            get_session: 数据库会话依赖（生成器函数，与get_db相同）
+            top_k: 每个前缀保留的候选数，也是补全返回条数的上限
+        """
+        self.get_session = get_session
+        self.top_k = top_k
+
+        self._root = _Node()
+        self._counts: Dict[str, int] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self) -> int:
+        """
+        从数据库重新加载全部标签的使用次数
+
+        Returns:
+            int: 标签数
+        """
+        session_gen = self.get_session()
+        db = next(session_gen)
+        try:
+            rows = db.query(Tag.tag, func.count(topic_tag_association.c.topic_uuid)).outerjoin(
+                topic_tag_association, topic_tag_association.c.tag_id == Tag.id
+            ).group_by(Tag.id).all()
+        finally:
+            session_gen.close()
+
+        with self._lock:
+            self._root = _Node()
+            self._counts = {}
+            for tag, count in rows:
+                self._set(tag, count)
+            self._loaded = True
+        return len(rows)
+
+    def add(self, tags: Iterable[str]) -> None:
+        """新话题使用了这些标签，各计数加一（尚未加载时不做任何事，加载时会从数据库读到）"""
+        with self._lock:
+            if not self._loaded:
+                return
+            for tag in set(tags):
+                self._set(tag, self._counts.get(tag, 0) + 1)
+
+    def count(self, tag: str) -> int:
+        """标签的使用次数"""
+        self._ensure_loaded()
+        return self._counts.get(tag, 0)
+
+    def complete(self, prefix: str, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        前缀补全
+
+        Args:
+            prefix: 已输入的前缀，为空时返回最常用的标签
+            limit: 返回条数，默认且最多为top_k
+
+        Returns:
+            List[(tag, count)]: 按使用次数降序排列
+        """
+        self._ensure_loaded()
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return [(tag, count) for count, tag in node.top[:limit or self.top_k]]
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.load()
+
+    def _set(self, tag: str, count: int) -> None:
+        """更新计数，并刷新从根到该标签路径上每个节点的候选列表（调用方持有锁）"""
+        self._counts[tag] = count
+        node = self._root
+        self._rank(node, tag, count)
+        for char in tag:
+            node = node.children.setdefault(char, _Node())
+            self._rank(node, tag, count)
+
+    def _rank(self, node: _Node, tag: str, count: int) -> None:
+        top = [item for item in node.top if item[1] != tag]
+        top.append((count, tag))
+        top.sort(key=lambda item: (-item[0], item[1]))
+        node.top = top[:self.top_k]
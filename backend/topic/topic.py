@@ -1,22 +1,30 @@
-from fastapi import FastAPI, Form, File, UploadFile, HTTPException, Depends, Path, Query, APIRouter, BackgroundTasks, Request
+from fastapi import FastAPI, Form, File, UploadFile, HTTPException, Depends, Path, Query, APIRouter, BackgroundTasks, Request, Response
 from pydantic import BaseModel
 from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.exc import IntegrityError
 import uuid
 import os
+import json
 import asyncio
-import aiofiles
 import time
-import base64
 from typing import List, Optional, Tuple
 from contextlib import asynccontextmanager
 from concurrent.futures import ProcessPoolExecutor
 
-from ..login.models import User
-from .model import TotalTopic, Tag, APost, MyImageModel
-from ..login.auth import get_current_active_user
+from ..login.models import AnonymousIdentity
+from .model import TotalTopic, Tag, APost, MyImageModel, PostLike, topic_tag_association
+from .media import store_bytes, store_file, release_file, media_url, media_response
+from .view_counter import ViewCounter
+from .hot_ranking import HotRanking
+from .search import index_post, remove_post, search_topics
+from .feed_cache import FeedCache, RECENT_KEY, tag_key
+from .tag_index import TagIndex, touch_topic_tags
+from ..login.auth import get_current_active_user, TokenUser
+from ..login.identity_cache import identity_cache
 from ..config import DEBUG
-from ..violence_detection.image_detector import check_image_violent, get_detector, ImageDetector
+from ..violence_detection.image_detector import get_detector, ImageDetector
 from ..wordscheck.checker import words_checker
+from ..wordscheck.batcher import get_moderation_batcher
 from ..login.database import engine, SessionLocal, Base
 from pydantic import BaseModel
 
@@ -31,9 +39,17 @@ def get_db():
 
 db_used = [get_db]
 
-# 文件存储配置
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# 浏览量在内存中累加后定期批量写回，会话依赖随db_used一起被测试覆盖
+view_counter = ViewCounter(lambda: db_used[0]())
+
+# 热门排行在后台物化，请求直接返回内存中的JSON
+hot_ranking = HotRanking(lambda: db_used[0](), lambda topics: construct_response(topics, show_viewtime=True))
+
+# 首页和标签列表缓存序列化后的响应，发帖和回复时失效
+feed_cache = FeedCache()
+
+# 标签前缀树，用于按使用次数排序的标签补全
+tag_index = TagIndex(lambda: db_used[0]())
 
 # 创建异步上下文管理器
 @asynccontextmanager
@@ -44,9 +60,14 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(lifespan=lifespan)
 
+# 图片路由需先于"/{topic_uuid_str}/{base_floor}"注册
+@app.get("/media/{file_name}")
+async def get_media(request: Request, file_name: str = Path(..., title="图片文件名"), db: Session = Depends(get_db)):
+    return media_response(request, db, file_name)
+
 def check_func(content: str, img_lst) -> bool:
-    # 直接调用敏感词检测模块中的检查函数
-    return words_checker.check_content(content, img_lst)
+    # 经批处理服务审核，同一时间窗口内的帖子合并为一次大模型调用
+    return get_moderation_batcher().check(content, img_lst)
 
 # 获取图像检测器
 def get_image_detector(request: Request = None):
@@ -77,10 +98,11 @@ def check_content(content: str, img_lst: List, uuid_str):
         detector = get_detector()
         
         # 批量检测图片
+        # 图片按内容寻址存储，可能被多个帖子共享，不能原地替换；违规帖子整体会被隐藏
         image_paths = [img.image_path for img in post_images]
         detection_results = detector.batch_detect_files(
             image_paths,
-            replace_if_violent=True 
+            replace_if_violent=False
         )
         
         if detection_results.get("violent_count", 0) > 0:
@@ -91,58 +113,85 @@ def check_content(content: str, img_lst: List, uuid_str):
     
     # 检查帖子内容是否合规,待补充
     bg = time.time()
-    content_safe = check_func(content, img_lst)
+    try:
+        content_safe = check_func(content, img_lst)
+    except TimeoutError:
+        # 审核超时按不通过处理，避免帖子一直停留在待审核状态
+        print(f"帖子 {uuid_str} 文本审核超时")
+        content_safe = False
     end = time.time()
     print(f"文本检测耗时: {end - bg}秒")
 
     target_post.visible_state = int(not (content_safe and images_safe))
+    rejected_paths = []
+    # 全文索引只收录审核通过的帖子，与审核结果在同一事务中提交
+    if target_post.visible_state == 0:
+        index_post(db, target_post)
+    else:
+        remove_post(db, target_post)
+        # 未通过审核的帖子不会再展示，删除其图片记录
+        for img in post_images:
+            rejected_paths.append(img.image_path)
+            db.delete(img)
     db.commit()
 
+    # 释放不再被其他帖子引用的图片文件
+    for path in rejected_paths:
+        release_file(db, path)
+
 def return_error_message(e):
     if DEBUG:
         return str(e)
     else:
         return "Internal Server Error"
 
+def allocate_floor(db: Session, topic_uuid) -> int:
+    """在当前事务中为话题分配下一个楼层号（UPDATE自增后读取，写锁保证并发回复不会拿到相同楼层）"""
+    db.query(TotalTopic).filter(TotalTopic.uuid == topic_uuid).update(
+        {TotalTopic.floor_count: TotalTopic.floor_count + 1}, synchronize_session=False
+    )
+    return db.query(TotalTopic.floor_count).filter(TotalTopic.uuid == topic_uuid).scalar()
+
+def get_post_by_floor(db: Session, topic_uuid, floor: int, visible_only: bool = True) -> Optional[APost]:
+    """按楼层号定位帖子，走(parent_topic_uuid, floor)唯一索引"""
+    query = db.query(APost).filter(APost.parent_topic_uuid == topic_uuid, APost.floor == floor)
+    if visible_only:
+        query = query.filter(APost.visible_state == 0)
+    return query.first()
+
+def get_identity_id(db: Session, nickname: str, refresh: bool = False) -> Optional[int]:
+    """按昵称查询匿名身份ID（经进程内缓存，写操作传入refresh=True从数据库重新读取）"""
+    identity = identity_cache.resolve(db, nickname, refresh)
+    return identity.id if identity else None
+
 # 增强版异步文件保存函数，包含内容检测
 async def async_save_image(file: UploadFile, post_uuid: str = None, request: Request = None) -> Tuple[str, bool]:
-    file_path = None
-    try:
-        # 生成唯一文件名
-        file_ext = os.path.splitext(file.filename)[1]
-        file_uuid = str(uuid.uuid4())
-        file_path = f"{UPLOAD_DIR}/{file_uuid}{file_ext}"
-        
-        # 异步写入文件
-        async with aiofiles.open(file_path, "wb") as buffer:
-            content = await file.read()
-            await buffer.write(content)
-        
-        # 检测图片内容
-        # 获取检测器
-        detector = get_image_detector(request)
-        
-        # 直接检测保存的图片
-        result = check_image_violent(
-            file_path, 
-            replace_path=file_path if post_uuid else None  # 仅在关联帖子时替换
-        )
-        is_violent = result.get("is_violent", False)
-        
-        # 如果为暴力内容且已替换
-        if is_violent and result.get("replaced", False):
-            print(f"图片 {file_path} 包含违规内容，已替换为和谐图片")
-        
-        # 重置文件指针
-        await file.seek(0)
-        
-        # 返回路径和内容检测结果
-        return file_path, is_violent
-    except Exception as e:
-        # 清理可能存在的半写入文件
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
-        raise e
+    loop = asyncio.get_running_loop()
+
+    content = await file.read()
+
+    # 检测图片内容
+    # 获取检测器
+    detector = get_image_detector(request)
+
+    # 先用内存中的数据交给推理服务检测，等待期间不阻塞事件循环；违规原图不落盘
+    result = await detector.detect_image_bytes_async(content, filename=file.filename)
+    is_violent = result.get("is_violent", False)
+
+    # 按内容摘要保存，相同图片只存一份；摘要计算和磁盘写入放到线程池，不阻塞事件循环
+    if is_violent and post_uuid and detector.harmony_img_path.exists():
+        # 如果为暴力内容，关联帖子时改为引用和谐图片
+        file_path = await loop.run_in_executor(None, store_file, detector.harmony_img_path)
+        print(f"图片 {file.filename} 包含违规内容，已替换为和谐图片")
+    else:
+        # 没有和谐图片时保存原图，帖子审核不通过后由check_content释放
+        file_path = await loop.run_in_executor(None, store_bytes, content, file.filename)
+
+    # 重置文件指针
+    await file.seek(0)
+
+    # 返回路径和内容检测结果
+    return file_path, is_violent
 
 @app.post("/create")
 async def create_post(
@@ -153,7 +202,7 @@ async def create_post(
     tag: List[str] = Form(...),
     content: str = Form(...),
     pic_lst: List[UploadFile] = File(None),
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db),
     
 ):
@@ -182,10 +231,12 @@ async def create_post(
             topic_title=title,
             create_time=time.time(),
             update_time=time.time(),
+            floor_count=1,
             tags = tag_objects
         )
         db.add(new_topic)
         db.flush()
+        touch_topic_tags(db, new_topic.uuid, new_topic.update_time)
 
         # 创建主帖子
         new_post = APost(
@@ -193,6 +244,7 @@ async def create_post(
             content=content,
             topic=new_topic,
             back_to=0,
+            floor=1,
             create_time=time.time(),
             visible_state = -1  # 待审核状态
         )
@@ -233,6 +285,9 @@ async def create_post(
             print(f"帖子 {new_post.uuid} 包含 {len(violent_images)} 张违规图片")
             
         db.commit()
+        hot_ranking.notify()
+        feed_cache.invalidate(tag)
+        tag_index.add(tag)
         return {
             "error_code": 0,
             "msg": "success",
@@ -242,11 +297,10 @@ async def create_post(
 
     except Exception as e:
         db.rollback()
-        # 清理已保存的文件
+        # 清理已保存且未被其他帖子引用的文件
         if 'image_paths' in locals():
             for path in image_paths:
-                if os.path.exists(path):
-                    os.remove(path)
+                release_file(db, path)
         return {
             "error_code": 1,
             "msg": f"创建失败: {return_error_message(e)}",
@@ -260,10 +314,7 @@ async def validate_parent_post(db: Session, topic_uuid: str, floor_number: int)
         return None
     
     # 查找指定主题中对应层数的帖子
-    parent_post = db.query(APost).filter(
-        APost.parent_topic_uuid == topic_uuid,
-        APost.back_to == 0,  # 只查找直接回复主题的帖子
-    ).order_by(APost.create_time).offset(floor_number - 1).first()
+    parent_post = get_post_by_floor(db, topic_uuid, floor_number, visible_only=False)
     
     if not parent_post:
         raise HTTPException(status_code=400, detail="回复的楼层不存在")
@@ -278,7 +329,7 @@ async def create_reply(
     content: str = Form(...),
     pic_lst: List[UploadFile] = File(None),
     reply_to: int = Form(0),
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     if pic_lst is None:
@@ -309,6 +360,7 @@ async def create_reply(
             content=content,
             parent_topic_uuid=topic_uuid,
             back_to=reply_to,
+            floor=allocate_floor(db, topic_uuid),
             create_time=time.time(),
             visible_state = -1  # 待审核状态
         )
@@ -318,32 +370,34 @@ async def create_reply(
         # 添加内容审核后台任务
         background_tasks.add_task(check_content, content, pic_lst, new_reply.uuid)
         
-        # 处理图片上传和检测
+        # 并行处理图片上传和检测
         saved_images = []
         violent_images = []
         
-        for image in pic_lst:
-            try:
-                # 异步保存图片和检测内容
-                file_path, is_violent = await async_save_image(image, str(new_reply.uuid), request)
-                saved_images.append(file_path)
-                
-                if is_violent:
-                    violent_images.append(file_path)
-                
-                # 创建图片记录
-                img_record = MyImageModel(
-                    title=image.filename,
-                    image_path=file_path,
-                    post_uuid=new_reply.uuid
-                )
-                db.add(img_record)
-            except Exception as e:
-                # 回滚已保存文件
-                for path in saved_images:
-                    if os.path.exists(path):
-                        os.remove(path)
-                raise HTTPException(500, f"图片保存失败: {return_error_message(e)}")
+        results = await asyncio.gather(
+            *[async_save_image(image, str(new_reply.uuid), request) for image in pic_lst],
+            return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        saved_images = [result[0] for result in results if not isinstance(result, Exception)]
+        if errors:
+            # 回滚已保存文件
+            db.rollback()
+            for path in saved_images:
+                release_file(db, path)
+            raise HTTPException(500, f"图片保存失败: {return_error_message(errors[0])}")
+        
+        for image, (file_path, is_violent) in zip(pic_lst, results):
+            if is_violent:
+                violent_images.append(file_path)
+            
+            # 创建图片记录
+            img_record = MyImageModel(
+                title=image.filename,
+                image_path=file_path,
+                post_uuid=new_reply.uuid
+            )
+            db.add(img_record)
         
         # 如果有违规图片，可以进行额外处理
         if violent_images:
@@ -352,8 +406,12 @@ async def create_reply(
         
         # 更新话题更新时间
         topic.update_time = time.time()
+        touch_topic_tags(db, topic_uuid, topic.update_time)
+        topic_tags = [t.tag for t in topic.tags]
         
         db.commit()
+        hot_ranking.notify()
+        feed_cache.invalidate(topic_tags)
         return {
             "error_code": 0,
             "msg": "回复成功",
@@ -379,7 +437,7 @@ async def get_floors(
     topic_uuid_str: str = Path(..., title="话题UUID"),
     base_floor: int = Path(..., ge=1, title="起始楼层"),
     nickname: str = Query(..., title="请求者昵称"),
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     if nickname not in user[1]:
@@ -398,35 +456,31 @@ async def get_floors(
     # 计算分页参数
     page_size = 20
 
-    # 获取总楼层数
-    total_floors = db.query(APost).filter(
-        APost.parent_topic_uuid == topic_uuid, APost.visible_state == 0
-    ).count()
-
-    # NOTE: let base_floor be a index from 0
-    base_floor -= 1
-    # 检查请求是否越界
-    if base_floor >= total_floors:
-        return {"floors": []}
-
-    # 获取主楼层（分页查询）
+    # 以楼层号为游标做范围查询，多取一条判断是否还有下一页
     main_posts = db.query(APost).filter(
-        APost.parent_topic_uuid == topic_uuid, APost.visible_state == 0
-    ).order_by(APost.create_time.asc()).offset(base_floor).limit(page_size).all()
+        APost.parent_topic_uuid == topic_uuid,
+        APost.floor >= base_floor,
+        APost.visible_state == 0
+    ).order_by(APost.floor.asc()).limit(page_size + 1).all()
+    next_floor = main_posts[page_size].floor if len(main_posts) > page_size else None
+    main_posts = main_posts[:page_size]
+
+    # 一次查询取出本页中请求者点赞过的帖子
+    viewer_id = get_identity_id(db, nickname)
+    liked_posts = {
+        post_uuid for (post_uuid,) in db.query(PostLike.post_uuid).filter(
+            PostLike.identity_id == viewer_id,
+            PostLike.post_uuid.in_([post.uuid for post in main_posts])
+        )
+    } if viewer_id is not None and main_posts else set()
+
     response_data = []
-    for ind, post in enumerate(main_posts):
-        # 转换图片数据
-        pic_data = []
-        for img in post.images:
-            try:
-                with open(img.image_path, "rb") as f:
-                    pic_data.append(base64.b64encode(f.read()).decode())
-            except Exception as e:
-                print(f"图片加载失败: {return_error_message(e)}")
+    for post in main_posts:
+        # 图片以URL形式返回，由浏览器按需加载并缓存
+        pic_data = [media_url(img.image_path) for img in post.images]
 
         # 判断点赞状态
-        like_set = post.like_set
-        is_liked = 1 if nickname in like_set else 0
+        is_liked = 1 if post.uuid in liked_posts else 0
 
         # 构建楼层信息
         floor_info = {
@@ -437,12 +491,12 @@ async def get_floors(
             "pic_lst": pic_data,
             "like_num": post.like_num,
             "is_liked": is_liked,
-            "index": ind+ base_floor + 1,
+            "index": post.floor,
         }
         response_data.append(floor_info)
-    topic.view_times+=1
-    db.commit()
-    return {"floors": response_data}
+    # 浏览量只在内存中累加，读楼层不再是写事务
+    view_counter.record(topic.uuid)
+    return {"floors": response_data, "next_floor": next_floor}
 
 
 def construct_response(topics: List[TotalTopic], show_viewtime:bool=False):
@@ -465,35 +519,37 @@ def construct_response(topics: List[TotalTopic], show_viewtime:bool=False):
 
     return {"posts": formatted_posts}
 
+def cached_feed(key: tuple, query_topics) -> Response:
+    """话题列表响应，命中缓存时直接返回序列化好的字节"""
+    payload = feed_cache.get_or_build(
+        key, lambda: json.dumps(construct_response(query_topics()), ensure_ascii=False).encode("utf-8")
+    )
+    return Response(content=payload, media_type="application/json")
+
 @app.get("/", response_model=dict)
 async def get_recent_posts(
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     
     # 获取最新20个主题（按最后更新时间排序）
-    topics = db.query(TotalTopic).options(
+    return cached_feed(RECENT_KEY, lambda: db.query(TotalTopic).options(
         joinedload(TotalTopic.tags)  # 预加载标签数据
     ).order_by(
         TotalTopic.update_time.desc()
-    ).limit(20).all()
-
-    # 构建响应数据
-    return construct_response(topics)
+    ).limit(20).all())
 
 @app.get("/hot")
 async def get_hot_posts(
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user)
 ):
-    # 获取最新20个主题（按最后更新时间排序）
-    topics = db.query(TotalTopic).options(
-        joinedload(TotalTopic.tags)  # 预加载标签数据
-    ).order_by(
-        TotalTopic.view_times.desc()
-    ).limit(20).all()
-
-    return construct_response(topics, show_viewtime=True)
+    # 按时间衰减后的热度排序的前20个主题，由后台定期刷新
+    payload, etag = hot_ranking.get()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
 
 
 class CancelLikeRequest(BaseModel):
@@ -503,24 +559,25 @@ class CancelLikeRequest(BaseModel):
 
 @app.post("/cancel-like")
 async def cancel_like(request: CancelLikeRequest,
-                      user: Tuple[User, List[str]] = Depends(get_current_active_user),
+                      user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
                       db: Session = Depends(get_db)):
     if request.nickname not in user[1]:
         raise HTTPException(status_code=401, detail="Unauthorized")
     try:
         # 根据话题UUID和楼层找到对应的APost
-        apost = db.query(APost).filter(
-        APost.parent_topic_uuid == uuid.UUID(request.uuid), APost.visible_state == 0
-        ).order_by(APost.create_time.asc()).offset(request.floor-1).first()
+        apost = get_post_by_floor(db, uuid.UUID(request.uuid), request.floor)
         
         if not apost:
             raise HTTPException(status_code=404, detail="Post not found")
-        like_set = set(apost.like_set)
-        # 从like_set中移除用户（原子操作）
-        if request.nickname in like_set:
-            like_set.remove(request.nickname)
-            apost.like_num  = len(like_set)
-            apost.like_set = list(like_set)
+        identity_id = get_identity_id(db, request.nickname, refresh=True)
+        # 删除点赞记录，删除成功才减少计数；计数在数据库中自减，并发取消不会丢失更新
+        deleted = db.query(PostLike).filter(
+            PostLike.post_uuid == apost.uuid, PostLike.identity_id == identity_id
+        ).delete(synchronize_session=False)
+        if deleted:
+            db.query(APost).filter(APost.uuid == apost.uuid).update(
+                {APost.like_num: APost.like_num - 1}, synchronize_session=False
+            )
             db.commit()
             return {"error_code": 0, "msg": "Success"}
         else:
@@ -533,27 +590,31 @@ async def cancel_like(request: CancelLikeRequest,
 
 @app.post("/like")
 async def like(request: CancelLikeRequest, 
-               user: Tuple[User, List[str]] = Depends(get_current_active_user),
+               user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
                db: Session = Depends(get_db)):
     if request.nickname not in user[1]:
         raise HTTPException(status_code=401, detail="Unauthorized")
     try:
         # 根据话题UUID和楼层找到对应的APost
-        apost = db.query(APost).filter(
-        APost.parent_topic_uuid == uuid.UUID(request.uuid), APost.visible_state == 0
-        ).order_by(APost.create_time.asc()).offset(request.floor-1).first()
+        apost = get_post_by_floor(db, uuid.UUID(request.uuid), request.floor)
         
         if not apost:
             raise HTTPException(status_code=404, detail="Post not found")
-        like_set = set(apost.like_set)
-        if request.nickname not in like_set:
-            like_set.add(request.nickname)
-            apost.like_num  = len(like_set)
-            apost.like_set = list(like_set)
-            db.commit()
-            return {"error_code": 0, "msg": "Success"}
-        else:
-            return {"error_code": 1, "msg": "User not in like set"}
+        identity_id = get_identity_id(db, request.nickname, refresh=True)
+        if identity_id is None:
+            raise HTTPException(status_code=404, detail="Identity not found")
+        # 唯一主键保证重复点赞插入失败；计数在数据库中自增，并发点赞不会丢失更新
+        try:
+            db.add(PostLike(post_uuid=apost.uuid, identity_id=identity_id, create_time=time.time()))
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            return {"error_code": 1, "msg": "User already in like set"}
+        db.query(APost).filter(APost.uuid == apost.uuid).update(
+            {APost.like_num: APost.like_num + 1}, synchronize_session=False
+        )
+        db.commit()
+        return {"error_code": 0, "msg": "Success"}
     except Exception as e:
         db.rollback()
         print(f"Error in like: {return_error_message(e)}")
@@ -564,22 +625,27 @@ async def like(request: CancelLikeRequest,
 @app.get("/notice")
 async def get_notice(
     nickname : str,
-    user: Tuple[User, List[str]] = Depends(get_current_active_user),
+    user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     if nickname not in user[1]:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    posts = db.query(APost).filter(
-            APost.author_name == nickname
-        ).order_by(
-            APost.create_time.desc()
-        ).limit(20).all() 
+    # 帖子和所属话题的标题在一次联表查询中取出
+    posts = db.query(
+        APost.create_time, APost.visible_state, APost.parent_topic_uuid, TotalTopic.topic_title
+    ).join(
+        TotalTopic, TotalTopic.uuid == APost.parent_topic_uuid
+    ).filter(
+        APost.author_name == nickname
+    ).order_by(
+        APost.create_time.desc()
+    ).limit(20).all()
     response_data = []
-    for ind, post in enumerate(posts):
+    for post in posts:
         # 构建楼层信息
         floor_info = {
             "timestamp": post.create_time,
-            "title" : db.query(TotalTopic).filter(TotalTopic.uuid == post.parent_topic_uuid).first().topic_title,
+            "title" : post.topic_title,
             "passed": post.visible_state,
             "topic_id" : post.parent_topic_uuid,
         }
@@ -591,21 +657,51 @@ topic_route = APIRouter()
 
 
 @topic_route.get("/searchtag")
-async def search_tag(tag: str, user: Tuple[User, List[str]] = Depends(get_current_active_user), db: Session = Depends(get_db)):
+async def search_tag(tag: str, user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user), db: Session = Depends(get_db)):
+    return cached_feed(tag_key(tag), lambda: query_tag_topics(db, tag))
+
+def query_tag_topics(db: Session, tag: str, limit: int = 20) -> List[TotalTopic]:
+    """标签下最近更新的话题：在(tag_id, update_time)索引上倒序范围扫描，再按主键取话题"""
+    tag_id = db.query(Tag.id).filter(Tag.tag == tag).scalar()
+    if tag_id is None:
+        return []
+    topic_uuids = [row.topic_uuid for row in db.query(topic_tag_association.c.topic_uuid).filter(
+        topic_tag_association.c.tag_id == tag_id
+    ).order_by(topic_tag_association.c.update_time.desc()).limit(limit)]
+    if not topic_uuids:
+        return []
+
+    order = {topic_uuid: rank for rank, topic_uuid in enumerate(topic_uuids)}
     topics = db.query(TotalTopic).options(
         joinedload(TotalTopic.tags)  # 预加载标签数据
-    ).filter(TotalTopic.tags.any(Tag.tag == tag)).order_by(
-        TotalTopic.update_time.desc()
-    ).limit(20).all()
+    ).filter(TotalTopic.uuid.in_(topic_uuids)).all()
+    topics.sort(key=lambda topic: order[topic.uuid])
+    return topics
 
-    return construct_response(topics)
+@topic_route.get("/tagcomplete")
+async def tag_complete(prefix: str = "",
+                       limit: int = Query(10, ge=1, le=10),
+                       user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user)):
+    # 按使用次数排序的标签补全，直接查内存中的前缀树
+    return {"tags": [{"tag": tag, "count": count} for tag, count in tag_index.complete(prefix, limit)]}
 
 @topic_route.get("/search")
-async def search(keyword: str, user: Tuple[User, List[str]] = Depends(get_current_active_user), db: Session = Depends(get_db)):
+async def search(keyword: str,
+                 page: int = Query(1, ge=1),
+                 user: Tuple[TokenUser, List[str]] = Depends(get_current_active_user),
+                 db: Session = Depends(get_db)):
+    # 全文检索标题和已审核通过的正文，按相关度排序，多取一条判断是否还有下一页
+    page_size = 20
+    topic_uuids = search_topics(db, keyword, offset=(page - 1) * page_size, limit=page_size + 1)
+    has_more = len(topic_uuids) > page_size
+    topic_uuids = topic_uuids[:page_size]
+
+    order = {topic_uuid: rank for rank, topic_uuid in enumerate(topic_uuids)}
     topics = db.query(TotalTopic).options(
         joinedload(TotalTopic.tags)
-    ).filter(TotalTopic.topic_title.like(f'%{keyword}%')).order_by(
-        TotalTopic.update_time.desc()
-    ).limit(20).all()
+    ).filter(TotalTopic.uuid.in_(topic_uuids)).all() if topic_uuids else []
+    topics.sort(key=lambda topic: order[topic.uuid])
 
-    return construct_response(topics)
+    response = construct_response(topics)
+    response["next_page"] = page + 1 if has_more else None
+    return response
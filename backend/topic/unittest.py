@@ -6,13 +6,27 @@ import uuid
 import time
 import io
 import os
-import base64
 import argparse
 import sys
+import asyncio
+import threading
 from unittest.mock import patch, MagicMock
+from concurrent.futures import Future
 
-from .topic import app, get_db, db_used, get_current_active_user
-from .model import Base, TotalTopic, APost
+from fastapi import UploadFile
+from PIL import Image
+
+from .topic import app, async_save_image, check_content, get_db, db_used, get_current_active_user, view_counter, hot_ranking, feed_cache, tag_index, query_tag_topics
+from .feed_cache import RECENT_KEY, tag_key
+from .model import Base, TotalTopic, APost, TopicViewBucket
+from .search import index_post, remove_post, search_topics
+from ..login.models import AnonymousIdentity
+from ..login.database import count_queries
+from .media import MEDIA_URL_PREFIX, CACHE_CONTROL, content_digest
+from ..violence_detection.image_detector import ImageDetector
+from ..violence_detection.inference_server import InferenceServer
+from ..violence_detection.preprocess import ImagePreprocessor
+from ..violence_detection.result_cache import ModerationCache
 
 py_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -38,6 +52,12 @@ class TestForumAPI(unittest.TestCase):
         Base.metadata.create_all(bind=engine)
         cls.client = TestClient(app)
         cls.db = TestingSessionLocal()
+        # 点赞按匿名身份记录
+        cls.db.add_all([
+            AnonymousIdentity(nickname=name, user_id=1)
+            for name in ["test_user", "reply_user", "viewer", "test"]
+        ])
+        cls.db.commit()
         # 定义依赖项覆盖
         def override_get_db():
             db = TestingSessionLocal()
@@ -99,6 +119,10 @@ class TestForumAPI(unittest.TestCase):
         self.assertEqual(create_data["error_code"], 0)
         topic_uuid = uuid.UUID(create_data["uuid"])
         self.assertIsInstance(topic_uuid, uuid.UUID)
+
+        # 首页列表写入缓存
+        self.assertEqual(self.client.get("/").json()["posts"][0]["title"], "Test Topic")
+        self.assertIsNotNone(feed_cache.get(RECENT_KEY))
         
         ###########################
         # 2. 回复主帖子
@@ -128,6 +152,18 @@ class TestForumAPI(unittest.TestCase):
         # 验证回复成功
         self.assertEqual(reply_response.status_code, 200)
         self.assertEqual(reply_response.json()["error_code"], 0)
+        # 回复改变了话题的更新时间，首页和标签列表失效
+        self.assertIsNone(feed_cache.get(RECENT_KEY))
+        self.assertIsNone(feed_cache.get(tag_key("tech")))
+
+        # 标签列表走关联表上的更新时间索引，标签补全按使用次数排序
+        self.assertEqual([topic.uuid for topic in query_tag_topics(self.db, "tech")], [topic_uuid])
+        self.assertEqual(tag_index.complete("py"), [("python", 1)])
+        tag_index.add(["pytorch"])
+        tag_index.add(["pytorch"])
+        self.assertEqual(tag_index.complete("py"), [("pytorch", 2), ("python", 1)])
+        self.assertEqual(tag_index.complete("pyt", limit=1), [("pytorch", 2)])
+        self.assertEqual(tag_index.complete("rust"), [])
         
         ###########################
         # 3. 获取楼层信息
@@ -153,7 +189,7 @@ class TestForumAPI(unittest.TestCase):
         self.assertEqual(main_floor["back_to"], 0, msg=f"{main_floor=}")
         self.assertEqual(main_floor["index"], 1, msg=f"{floors_data=}")
         self.assertEqual(len(main_floor["pic_lst"]), 1)
-        self.assertEqual(main_floor["pic_lst"][0], base64.b64encode(test_image.getvalue()).decode())
+        self.assertTrue(main_floor["pic_lst"][0].startswith(MEDIA_URL_PREFIX))
         self.assertEqual(main_floor["like_num"], 0)
         self.assertEqual(main_floor["is_liked"], 0)
         
@@ -162,20 +198,77 @@ class TestForumAPI(unittest.TestCase):
         self.assertEqual(reply["nickname"], "reply_user")
         self.assertEqual(reply["content"], "Test reply")
         self.assertEqual(len(reply["pic_lst"]), 1)
-        self.assertEqual(reply["pic_lst"][0], base64.b64encode(reply_image.getvalue()).decode())
+        self.assertEqual(reply["pic_lst"][0], f"{MEDIA_URL_PREFIX}/{content_digest(reply_image.getvalue())}.png")
         self.assertEqual(reply["like_num"], 0)
+        self.assertEqual(reply["index"], 2)
+        self.assertIsNone(floors_data["next_floor"])
         
         # 验证时间戳顺序
         self.assertLess(main_floor["create_time"], reply["create_time"])
 
+        ###########################
+        # 3.1 按URL获取图片
+        ###########################
+        # 测试客户端直接访问topic子应用，去掉挂载前缀
+        pic_url = main_floor["pic_lst"][0][len("/api/posts"):]
+        pic_response = self.client.get(pic_url)
+        self.assertEqual(pic_response.status_code, 200)
+        self.assertEqual(pic_response.content, test_image.getvalue())
+        self.assertEqual(pic_response.headers["cache-control"], CACHE_CONTROL)
+        etag = pic_response.headers["etag"]
+
+        # 缓存协商
+        pic_response = self.client.get(pic_url, headers={"If-None-Match": etag})
+        self.assertEqual(pic_response.status_code, 304)
+
+        # 范围请求
+        pic_response = self.client.get(pic_url, headers={"Range": "bytes=0-15"})
+        self.assertEqual(pic_response.status_code, 206)
+        self.assertEqual(pic_response.content, test_image.getvalue()[:16])
+
+        reply_url = reply["pic_lst"][0][len("/api/posts"):]
+        reply_response = self.client.get(reply_url)
+        self.assertEqual(reply_response.content, reply_image.getvalue())
+        self.assertNotIn("public", reply_response.headers["cache-control"])
+
+        # 未通过审核的帖子的图片不对外提供，浏览器重新验证缓存时也得到404
+        reply_post = self.db.query(APost).filter(APost.floor == 2).first()
+        reply_post.visible_state = 1
+        self.db.commit()
+        self.assertEqual(self.client.get(reply_url).status_code, 404)
+        self.assertEqual(
+            self.client.get(reply_url, headers={"If-None-Match": reply_response.headers["etag"]}).status_code, 404
+        )
+        reply_post.visible_state = 0
+        self.db.commit()
+
+        # 非法文件名
+        self.assertEqual(self.client.get("/media/..%2Ftopic.db").status_code, 404)
+
         ###########################
         # 4. 验证热门帖子
         ###########################
+        # 浏览量先在内存中累加，写回后才进入排行
+        self.assertEqual(view_counter.pending(topic_uuid), 1)
+        view_counter.flush()
+        hot_ranking.refresh()
         hot_response = self.client.get("/hot")
         hot_posts = hot_response.json()["posts"]
         self.assertEqual(len(hot_posts), 1)
         self.assertEqual(hot_posts[0]["title"], "Test Topic")
         self.assertEqual(hot_posts[0]["view_times"], 1)
+        # 排行未变化时返回304
+        etag = hot_response.headers["etag"]
+        self.assertEqual(self.client.get("/hot", headers={"If-None-Match": etag}).status_code, 304)
+
+        # 审核通过的主楼和回复进入全文索引
+        self.assertEqual(search_topics(self.db, "test topic"), [topic_uuid])
+        self.assertEqual(search_topics(self.db, "REPLY"), [topic_uuid])
+        self.assertEqual(search_topics(self.db, "missing"), [])
+
+        # 以楼层号为游标从第2层开始
+        cursor_data = self.client.get(f"/{str(topic_uuid)}/2", params={"nickname": "viewer"}).json()
+        self.assertEqual([floor["index"] for floor in cursor_data["floors"]], [2])
 
         ###########################
         # 5. 验证点赞功能
@@ -236,14 +329,93 @@ class TestForumAPI(unittest.TestCase):
         ###########################
         # 7. 测试notice功能
         ###########################
-        # 测试通知
-        response = self.client.get("/notice", params={"nickname": "reply_user"})
+        # 测试通知，帖子和话题标题在一次查询中取出
+        with count_queries(engine) as statements:
+            response = self.client.get("/notice", params={"nickname": "reply_user"})
         notice_lst = response.json()["floors"]
         self.assertEqual(len(notice_lst), 1)
         self.assertEqual(notice_lst[0]["passed"], 0)
+        self.assertEqual(notice_lst[0]["title"], "Test Topic")
+        self.assertEqual(len(statements), 1)
 
 
         
+    def test_hot_ranking_recency(self):
+        # 累计浏览量很高但都发生在几天前的话题，热度低于刚有少量浏览的话题
+        now = time.time()
+        old_topic = TotalTopic(author_name="user1", topic_title="Old Hot", update_time=now - 3600)
+        new_topic = TotalTopic(author_name="user2", topic_title="New Hot", update_time=now - 3600)
+        self.db.add_all([old_topic, new_topic])
+        self.db.flush()
+        self.db.add_all([
+            TopicViewBucket(topic_uuid=old_topic.uuid, bucket_start=int(now - 5 * 86400), views=300),
+            TopicViewBucket(topic_uuid=new_topic.uuid, bucket_start=int(now - 3600), views=20),
+        ])
+        self.db.commit()
+        scores = hot_ranking.scores(self.db, now)
+        self.assertGreater(scores[new_topic.uuid], scores[old_topic.uuid])
+
+        self.db.query(TopicViewBucket).delete()
+        self.db.delete(old_topic)
+        self.db.delete(new_topic)
+        self.db.commit()
+
+    def test_save_images_decode_concurrently(self):
+        # 同一帖子的多张图片在解码线程池中并行解码
+        active, peak = [0], [0]
+        lock = threading.Lock()
+        preprocessor = ImagePreprocessor(input_size=8)
+        load = preprocessor.load
+
+        def slow_load(image):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.1)
+            with lock:
+                active[0] -= 1
+            return load(image)
+
+        preprocessor.load = slow_load
+        classifier = MagicMock(batch_size=16, preprocessor=preprocessor)
+        classifier.predict_tensors.side_effect = lambda tensors: ([0] * len(tensors), [0.9] * len(tensors))
+        server = InferenceServer(classifier=classifier, max_wait_ms=1, decode_workers=4, cache=ModerationCache())
+        self.addCleanup(server.stop)
+        with patch("backend.violence_detection.image_detector.get_classifier", return_value=classifier):
+            detector = ImageDetector(inference_server=server)
+
+        uploads = []
+        for value in range(3):
+            buffer = io.BytesIO()
+            Image.new("RGB", (16, 16), (value, 0, 0)).save(buffer, format="PNG")
+            uploads.append(UploadFile(file=io.BytesIO(buffer.getvalue()), filename=f"{value}.png"))
+
+        async def save_all():
+            return await asyncio.gather(*[async_save_image(upload, str(uuid.uuid4())) for upload in uploads])
+
+        with patch("backend.topic.topic.get_image_detector", return_value=detector):
+            results = asyncio.run(save_all())
+        for path, is_violent in results:
+            self.assertFalse(is_violent)
+            os.remove(path)
+        self.assertEqual(peak[0], 3)
+
+    def test_check_content_timeout(self):
+        # 文本审核超时的帖子按不通过处理，不会一直停留在待审核状态
+        topic = TotalTopic(author_name="user1", topic_title="Timeout", update_time=time.time(), floor_count=1)
+        post = APost(author_name="user1", content="今天天气不错", topic=topic,
+                     floor=1, visible_state=-1, create_time=time.time())
+        self.db.add_all([topic, post])
+        self.db.commit()
+        with patch("backend.topic.topic.check_func", side_effect=TimeoutError("文本审核超时")):
+            check_content(post.content, [], post.uuid)
+        self.db.refresh(post)
+        self.assertEqual(post.visible_state, 1)
+
+        self.db.delete(post)
+        self.db.delete(topic)
+        self.db.commit()
+
     def test_invalid_uuid(self):
         # 测试无效UUID的情况
         invalid_uuid = "invalid-uuid-123"
@@ -273,6 +445,8 @@ class TestForumAPI(unittest.TestCase):
         )
         self.db.add_all([topic1, topic2])
         self.db.commit()
+        # 直接写库不经过发帖接口，需要手动使列表缓存失效
+        feed_cache.clear()
 
         # 验证排序
         response = self.client.get("/")
@@ -280,6 +454,43 @@ class TestForumAPI(unittest.TestCase):
         self.assertEqual(posts[0]["title"], "New Post", msg=f"{posts=}")
         self.assertEqual(posts[1]["title"], "Old Post")
     
+    def test_search_cjk(self):
+        # 中文按二元分词索引，任意子串都能命中
+        topic = TotalTopic(author_name="user1", topic_title="周末读书会", update_time=time.time(), floor_count=1)
+        post = APost(author_name="user1", content="一起学习机器学习，顺便撸猫", topic=topic,
+                     floor=1, visible_state=0, create_time=time.time())
+        self.db.add_all([topic, post])
+        self.db.flush()
+        index_post(self.db, post)
+        self.db.commit()
+
+        for keyword in ["读书", "机器学习", "器", "撸猫", "猫", "学习 读书会"]:
+            self.assertEqual(search_topics(self.db, keyword), [topic.uuid], msg=keyword)
+        for keyword in ["机学", "读书 狗", "，"]:
+            self.assertEqual(search_topics(self.db, keyword), [], msg=keyword)
+
+        # 较早但标题命中的话题排在之后发布、只有正文命中的话题前面
+        newer = []
+        for i in range(3):
+            newer_topic = TotalTopic(author_name="user1", topic_title=f"杂谈{i}", update_time=time.time(), floor_count=1)
+            newer_post = APost(author_name="user1", content=f"读书会{i}", topic=newer_topic,
+                               floor=1, visible_state=0, create_time=time.time())
+            self.db.add_all([newer_topic, newer_post])
+            self.db.flush()
+            index_post(self.db, newer_post)
+            newer.append(newer_post)
+        self.db.commit()
+        ranked = search_topics(self.db, "读书会")
+        self.assertEqual(ranked[0], topic.uuid)
+        self.assertEqual(search_topics(self.db, "读书会", offset=1, limit=10), ranked[1:])
+        for newer_post in newer:
+            remove_post(self.db, newer_post)
+
+        # 审核状态变为不可见后移出索引
+        remove_post(self.db, post)
+        self.db.commit()
+        self.assertEqual(search_topics(self.db, "机器学习"), [])
+
     @unittest.skipIf(not args.filter, "敏感词过滤测试已关闭")
     def z_test_content_filter_blacklist(self):
         """测试黑名单敏感词过滤功能"""
@@ -324,7 +535,7 @@ class TestForumAPI(unittest.TestCase):
         print("敏感词黑名单过滤测试通过！")
     
     @unittest.skipIf(not args.filter, "敏感词过滤测试已关闭")
-    @patch('requests.post')
+    @patch('backend.wordscheck.client.WordsCheckClient.submit')
     def z_test_content_filter_service(self, mock_post):
         """测试敏感词服务过滤功能"""
         # 模拟敏感词服务的响应
@@ -341,7 +552,10 @@ class TestForumAPI(unittest.TestCase):
                 "level": "高"
             }]
         }
-        mock_post.return_value = mock_response
+        # 批处理服务先提交请求再取结果
+        mock_future = Future()
+        mock_future.set_result(mock_response)
+        mock_post.return_value = mock_future
         
         # 生成测试图片
         test_image = io.BytesIO(b"fake image data")
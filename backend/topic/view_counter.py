@@ -0,0 +1,122 @@
+"""
+话题浏览量的写回计数器
+
+浏览楼层时只在内存中累加，由后台线程定期把累计增量合并为一次批量UPDATE写入数据库，
+热门话题的读取不再是写事务，也不再排队等待SQLite的写锁。
+写回时同时按小时累加到topic_view_bucket，热门排行据此只统计近期的浏览。
+"""
+
+import time
+import threading
+from typing import Callable, Dict, Iterator, Optional
+
+from sqlalchemy import bindparam, delete, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from .model import TotalTopic, TopicViewBucket
+
+# 浏览量分桶的宽度（秒）
+VIEW_BUCKET_SECONDS = 3600
+
+
+class ViewCounter:
+    """按话题聚合浏览次数，定期批量写回"""
+
+    def __init__(self, get_session: Callable[[], Iterator[Session]], flush_interval: float = 5.0,
+                 retention_days: float = 30.0):
+        """
+        初始化计数器
+
+        Args:
+            get_session: 数据库会话依赖（生成器函数，与get_db相同）
+            flush_interval: 写回间隔（秒）
+            retention_days: 分桶浏览量的保留天数
+        """
+        self.get_session = get_session
+        self.flush_interval = flush_interval
+        self.retention = retention_days * 86400
+
+        self._pending: Dict[object, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, topic_uuid, views: int = 1) -> None:
+        """记录一次浏览"""
+        with self._lock:
+            self._pending[topic_uuid] = self._pending.get(topic_uuid, 0) + views
+        self.start()
+
+    def pending(self, topic_uuid) -> int:
+        """尚未写回的浏览次数"""
+        with self._lock:
+            return self._pending.get(topic_uuid, 0)
+
+    def start(self) -> None:
+        """启动写回线程（已启动时不做任何事）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="view-counter", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """停止写回线程并写回剩余计数"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"浏览量写回失败: {e}")
+
+    def flush(self) -> int:
+        """
+        把累计的浏览次数写回数据库
+
+        Returns:
+            int: 写回的话题数
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        now = time.time()
+        bucket_start = int(now // VIEW_BUCKET_SECONDS * VIEW_BUCKET_SECONDS)
+        table = TotalTopic.__table__
+        stmt = update(table).where(table.c.uuid == bindparam("topic_uuid")).values(
+            view_times=table.c.view_times + bindparam("views")
+        )
+        bucket_stmt = insert(TopicViewBucket)
+        bucket_stmt = bucket_stmt.on_conflict_do_update(
+            index_elements=[TopicViewBucket.topic_uuid, TopicViewBucket.bucket_start],
+            set_={"views": TopicViewBucket.views + bucket_stmt.excluded.views},
+        )
+        session_gen = self.get_session()
+        db = next(session_gen)
+        try:
+            db.execute(stmt, [{"topic_uuid": key, "views": views} for key, views in pending.items()])
+            db.execute(bucket_stmt, [
+                {"topic_uuid": key, "bucket_start": bucket_start, "views": views} for key, views in pending.items()
+            ])
+            db.execute(delete(TopicViewBucket).where(TopicViewBucket.bucket_start < now - self.retention))
+            db.commit()
+        except Exception:
+            db.rollback()
+            # 写回失败的计数放回，下次重试
+            with self._lock:
+                for key, views in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + views
+            raise
+        finally:
+            session_gen.close()
+        return len(pending)
@@ -7,5 +7,8 @@
 __version__ = "0.1.0"
 
 from .classify import ViolenceClass, get_classifier
+from .preprocess import ImagePreprocessor
+from .inference_server import InferenceServer, get_inference_server
+from .result_cache import ModerationCache
 from . import utils
 from . import model
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""
+预处理流程性能测试脚本
+比较原始流程（全分辨率ToTensor）与固定尺寸预处理（draft解码+缩放）的每百万像素推理延迟
+
+运行方式（仓库根目录）:
+    python -m backend.violence_detection.benchmark_preprocess
+"""
+
+import io
+import time
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+from .classify import get_classifier
+from .preprocess import ImagePreprocessor
+
+
+# 测试分辨率，覆盖常见的手机照片尺寸
+RESOLUTIONS = [(640, 480), (1280, 960), (2000, 1500), (4000, 3000)]
+REPEAT = 3
+
+
+def log(message):
+    """输出日志到控制台"""
+    print(message)
+
+
+def make_jpeg(width, height):
+    """生成随机内容的JPEG字节数据"""
+    rng = np.random.default_rng(0)
+    array = rng.integers(0, 256, size=(height // 8, width // 8, 3), dtype=np.uint8)
+    image = Image.fromarray(array).resize((width, height))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def time_pipeline(classifier, jpeg_bytes, to_tensor):
+    """返回解码+预处理+前向传播的平均耗时（秒）"""
+    costs = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        tensor = to_tensor(jpeg_bytes).unsqueeze(0)
+        classifier.predict(tensor)
+        costs.append(time.perf_counter() - start)
+    return sum(costs) / len(costs)
+
+
+def main():
+    torch.set_grad_enabled(False)
+    classifier = get_classifier()
+
+    original = transforms.ToTensor()
+    fixed_size = ImagePreprocessor(input_size=224)
+
+    def before(data):
+        return original(Image.open(io.BytesIO(data)).convert('RGB'))
+
+    def after(data):
+        return fixed_size(data)
+
+    log(f"设备: {classifier.device}, 模型输入边长: {fixed_size.input_size}")
+    log(f"{'分辨率':>12} {'百万像素':>8} {'原始(ms/MP)':>12} {'预处理(ms/MP)':>14} {'加速比':>8}")
+    for width, height in RESOLUTIONS:
+        data = make_jpeg(width, height)
+        megapixels = width * height / 1e6
+        cost_before = time_pipeline(classifier, data, before)
+        cost_after = time_pipeline(classifier, data, after)
+        log(f"{width:>5}x{height:<6} {megapixels:>8.2f} "
+            f"{cost_before * 1000 / megapixels:>12.1f} "
+            f"{cost_after * 1000 / megapixels:>14.1f} "
+            f"{cost_before / cost_after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
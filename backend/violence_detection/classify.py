@@ -4,30 +4,32 @@
 
 import os
 import torch
-import torchvision.transforms as transforms
 from PIL import Image
 from typing import List, Tuple, Union, Optional
 import numpy as np
 from pathlib import Path
 
 from .model import ViolenceClassifier, load_model_from_checkpoint
+from .preprocess import ImagePreprocessor
 
 class ViolenceClass:
     
-    def __init__(self, checkpoint_path: str, batch_size: int = 16):
+    def __init__(self, checkpoint_path: str, batch_size: int = 16, input_size: Optional[int] = None, normalize: bool = False):
         """
         初始化分类器
         
         Args:
             checkpoint_path (str): 模型检查点路径
             batch_size (int, optional): 批处理大小. 默认为16
+            input_size (int, optional): 模型输入边长，图像统一缩放到该尺寸. 默认为None，保持原始分辨率
+            normalize (bool, optional): 是否做ImageNet均值方差归一化. 默认为False
         """
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.batch_size = batch_size
         
-        self.transforms = transforms.Compose([
-            transforms.ToTensor(),
-        ])
+        # 解码、缩放、归一化，由检测器和中间件共用
+        self.preprocessor = ImagePreprocessor(input_size=input_size, normalize=normalize)
+        self.transforms = self.preprocessor.transforms
         
         self._load_model(checkpoint_path)
     
@@ -55,6 +57,19 @@ class ViolenceClass:
         Returns:
             List[int]: 分类结果列表 (0: 非暴力, 1: 暴力)
         """
+        predictions, _ = self.predict(tensor)
+        return predictions
+    
+    def predict(self, tensor: torch.Tensor) -> Tuple[List[int], List[float]]:
+        """
+        对图像张量进行分类，并由同一次前向传播的输出得到置信度
+        
+        Args:
+            tensor (torch.Tensor): 预处理后的图像张量，形状为[batch_size, 3, 224, 224]
+            
+        Returns:
+            Tuple[List[int], List[float]]: 分类结果列表及对应类别的softmax置信度
+        """
 
         self.model.eval()
 
@@ -62,9 +77,15 @@ class ViolenceClass:
         
         with torch.no_grad():
             outputs = self.model(tensor)
-            predictions = outputs.argmax(dim=1)
+            confidences, predictions = torch.softmax(outputs, dim=1).max(dim=1)
         
-        return predictions.cpu().tolist()
+        return predictions.cpu().tolist(), confidences.cpu().tolist()
+    
+    def _to_tensor(self, image: Union[str, Image.Image]) -> torch.Tensor:
+        """将图像路径或PIL图像转换为模型输入张量"""
+        if not isinstance(image, (str, Image.Image)):
+            raise TypeError("图像必须是PIL.Image对象或图像路径字符串")
+        return self.preprocessor(image)
     
     def classify_single_image(self, image: Union[str, Image.Image]) -> int:
         """
@@ -76,15 +97,22 @@ class ViolenceClass:
         Returns:
             int: 分类结果 (0: 非暴力, 1: 暴力)
         """
-        # 预处理图像
-        if isinstance(image, str):
-            image = Image.open(image).convert('RGB')
-        elif not isinstance(image, Image.Image):
-            raise TypeError("图像必须是PIL.Image对象或图像路径字符串")
+        prediction, _ = self.predict_single_image(image)
+        return prediction
+    
+    def predict_single_image(self, image: Union[str, Image.Image]) -> Tuple[int, float]:
+        """
+        对单张图像进行分类并返回置信度
+        
+        Args:
+            image (Union[str, Image.Image]): 图像路径或PIL图像对象
             
-        tensor = self.transforms(image).unsqueeze(0)  
-        result = self.classify(tensor)
-        return result[0]
+        Returns:
+            Tuple[int, float]: 分类结果及其置信度
+        """
+        tensor = self._to_tensor(image).unsqueeze(0)
+        predictions, confidences = self.predict(tensor)
+        return predictions[0], confidences[0]
     
     def batch_classify(self, image_list: List[Union[str, Image.Image]]) -> List[int]:
         """
@@ -96,35 +124,68 @@ class ViolenceClass:
         Returns:
             List[int]: 分类结果列表 (0: 非暴力, 1: 暴力)
         """
-        results = []
+        predictions, _ = self.batch_predict(image_list)
+        return predictions
+    
+    def batch_predict(self, image_list: List[Union[str, Image.Image]]) -> Tuple[List[int], List[float]]:
+        """
+        对图像列表进行批量分类并返回置信度，每个批次只做一次前向传播
+        
+        Args:
+            image_list (List[Union[str, Image.Image]]): 图像路径或PIL图像对象列表
+            
+        Returns:
+            Tuple[List[int], List[float]]: 分类结果列表及对应的置信度列表
+        """
+        predictions = []
+        confidences = []
 
         for i in range(0, len(image_list), self.batch_size):
-            batch = image_list[i:i + self.batch_size]
+            tensors = [self._to_tensor(img) for img in image_list[i:i + self.batch_size]]
+            batch_predictions, batch_confidences = self.predict_tensors(tensors)
+            predictions.extend(batch_predictions)
+            confidences.extend(batch_confidences)
+            
+        return predictions, confidences
+    
+    def predict_tensors(self, tensors: List[torch.Tensor]) -> Tuple[List[int], List[float]]:
+        """
+        对一组单张图像张量堆叠后推理
+        
+        Args:
+            tensors (List[torch.Tensor]): 形状为[3, H, W]的张量列表
+            
+        Returns:
+            Tuple[List[int], List[float]]: 分类结果列表及对应的置信度列表
+        """
+        predictions = [0] * len(tensors)
+        confidences = [0.0] * len(tensors)
 
-            tensors = []
-            for img in batch:
-                if isinstance(img, str):
-                    img = Image.open(img).convert('RGB')
-                elif not isinstance(img, Image.Image):
-                    raise TypeError("图像必须是PIL.Image对象或图像路径字符串")
-                
-                tensors.append(self.transforms(img))
+        # 按形状分组，同尺寸的图像合并为一次前向传播；设置了input_size时只有一组
+        groups = {}
+        for index, tensor in enumerate(tensors):
+            groups.setdefault(tuple(tensor.shape), []).append(index)
 
-            batch_tensor = torch.stack(tensors)
-            batch_results = self.classify(batch_tensor)
-            results.extend(batch_results)
-            
-        return results
+        for indices in groups.values():
+            batch_tensor = torch.stack([tensors[index] for index in indices])
+            batch_predictions, batch_confidences = self.predict(batch_tensor)
+            for index, prediction, confidence in zip(indices, batch_predictions, batch_confidences):
+                predictions[index] = prediction
+                confidences[index] = confidence
+
+        return predictions, confidences
 
 _classifier = None
 
-def get_classifier(checkpoint_path: str = None, batch_size: int = 16) -> ViolenceClass:
+def get_classifier(checkpoint_path: str = None, batch_size: int = 16, input_size: Optional[int] = None, normalize: bool = False) -> ViolenceClass:
     """
     获取分类器单例实例
     
     Args:
         checkpoint_path (str, optional): 模型检查点路径（仅在首次调用时需要）
         batch_size (int, optional): 批处理大小. 默认为16
+        input_size (int, optional): 模型输入边长. 默认为None，保持原始分辨率
+        normalize (bool, optional): 是否做归一化. 默认为False
     
     Returns:
         ViolenceClass: 分类器实例
@@ -141,6 +202,6 @@ def get_classifier(checkpoint_path: str = None, batch_size: int = 16) -> Violenc
             else:
                 raise ValueError("未指定模型检查点路径，且未找到默认检查点")
         
-        _classifier = ViolenceClass(checkpoint_path, batch_size)
+        _classifier = ViolenceClass(checkpoint_path, batch_size, input_size, normalize)
     
     return _classifier
\ No newline at end of file
@@ -4,17 +4,16 @@
 """
 
 import os
-import io
 import time
-import uuid
 import shutil
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, Union, List, Optional, Tuple, BinaryIO
-from PIL import Image
-import torch
+from typing import Dict, Any, Union, List, Optional, Tuple, BinaryIO, Callable
 import logging
 
 from .classify import get_classifier, ViolenceClass
+from .inference_server import get_inference_server, InferenceServer
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -22,14 +21,18 @@ logger = logging.getLogger(__name__)
 class ImageDetector:
     """图像检测器类，包装暴力内容检测功能"""
     
-    def __init__(self, harmony_img_path: Optional[Path] = None):
+    def __init__(self, harmony_img_path: Optional[Path] = None, inference_server: Optional[InferenceServer] = None):
         """
         初始化图像检测器
         
         Args:
             harmony_img_path: 和谐图片路径，用于替换违规图片
+            inference_server: 推理服务，默认使用全局单例
         """
         self.classifier = get_classifier()
+        self.inference_server = inference_server or get_inference_server()
+        # 替换、保存图片等文件操作不在推理线程的回调中执行，以免拖慢后续批次
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="violence-io")
         
         # 设置和谐图片路径
         base_dir = Path(os.path.dirname(os.path.abspath(__file__)))
@@ -41,47 +44,73 @@ class ImageDetector:
         else:
             logger.info(f"使用和谐图片: {self.harmony_img_path}")
     
-    def detect_image_file(self, 
+    def _then(self,
+              source: Future,
+              on_result: Callable[[int, float], Dict[str, Any]],
+              on_error: Callable[[Exception], Dict[str, Any]],
+              blocking: bool = False) -> "Future[Dict[str, Any]]":
+        """
+        推理结果就绪后生成检测结果，推理异常转换为错误结果
+
+        回调在设置推理结果的线程（通常是推理线程）中执行；
+        blocking为True表示on_result会读写文件，改为在文件操作线程池中执行。
+        """
+        target: "Future[Dict[str, Any]]" = Future()
+        
+        def _resolve(future: Future) -> None:
+            try:
+                result = on_result(*future.result())
+            except Exception as e:
+                result = on_error(e)
+            target.set_result(result)
+        
+        def _done(future: Future) -> None:
+            if blocking and not future.cancelled() and future.exception() is None:
+                try:
+                    self._io_pool.submit(_resolve, future)
+                    return
+                except RuntimeError:
+                    # 线程池已关闭时就地执行
+                    pass
+            _resolve(future)
+        
+        source.add_done_callback(_done)
+        return target
+    
+    def _replace_if_needed(self, file_path: Path, is_violent: bool, replace_if_violent: bool) -> bool:
+        """暴力图片替换为和谐图片，返回是否已替换"""
+        if is_violent and replace_if_violent and self.harmony_img_path.exists():
+            # 备份原图（可选）
+            # backup_path = file_path.with_suffix(file_path.suffix + '.bak')
+            # shutil.copy2(file_path, backup_path)
+            
+            # 替换为和谐图片
+            shutil.copy2(self.harmony_img_path, file_path)
+            logger.info(f"已将暴力图片替换为和谐图片: {file_path}")
+            return True
+        return False
+    
+    def submit_image_file(self, 
                         file_path: Union[str, Path], 
-                        replace_if_violent: bool = True) -> Dict[str, Any]:
+                        replace_if_violent: bool = True) -> "Future[Dict[str, Any]]":
         """
-        检测图像文件
+        提交图像文件检测，立即返回Future
         
         Args:
             file_path: 图像文件路径
             replace_if_violent: 如果检测到暴力内容是否替换
             
         Returns:
-            Dict: 检测结果
+            Future: 结果为检测结果字典
         """
         start_time = time.time()
         file_path = Path(file_path)
         
-        try:
-            # 打开并转换图像
-            image = Image.open(file_path).convert('RGB')
-            
-            # 执行分类
-            prediction = self.classifier.classify_single_image(image)
+        def on_result(prediction: int, confidence: float) -> Dict[str, Any]:
             is_violent = prediction == 1
             
-            # 获取置信度
-            tensor = self.classifier.transforms(image).unsqueeze(0)
-            with torch.no_grad():
-                outputs = self.classifier.model(tensor.to(self.classifier.device))
-                confidences = torch.softmax(outputs, dim=1).cpu().numpy()
-            
             # 检测到暴力内容且需要替换
-            replaced = False
-            if is_violent and replace_if_violent and self.harmony_img_path.exists():
-                # 备份原图（可选）
-                # backup_path = file_path.with_suffix(file_path.suffix + '.bak')
-                # shutil.copy2(file_path, backup_path)
-                
-                # 替换为和谐图片
-                shutil.copy2(self.harmony_img_path, file_path)
-                replaced = True
-                logger.info(f"已将暴力图片替换为和谐图片: {file_path}")
+            replaced = self._replace_if_needed(file_path, is_violent, replace_if_violent)
             
             # 计算处理时间
             processing_time = time.time() - start_time
@@ -91,52 +120,66 @@ class ImageDetector:
                 "filename": file_path.name,
                 "path": str(file_path),
                 "is_violent": is_violent,
-                "confidence": float(confidences[0][prediction]),
+                "confidence": float(confidence),
                 "processing_time_ms": int(processing_time * 1000),
                 "replaced": replaced
             }
-            
-        except Exception as e:
+        
+        def on_error(e: Exception) -> Dict[str, Any]:
             logger.error(f"图像检测错误: {str(e)}")
             return {
-                "filename": file_path.name if hasattr(file_path, 'name') else str(file_path),
+                "filename": file_path.name,
                 "path": str(file_path),
                 "error": str(e),
                 "is_violent": False,  # 默认为安全
                 "processing_time_ms": int((time.time() - start_time) * 1000)
             }
+        
+        return self._then(self.inference_server.submit(file_path), on_result, on_error, blocking=replace_if_violent)
     
-    def detect_image_bytes(self, 
+    def detect_image_file(self, 
+                        file_path: Union[str, Path], 
+                        replace_if_violent: bool = True) -> Dict[str, Any]:
+        """
+        检测图像文件
+        
+        Args:
+            file_path: 图像文件路径
+            replace_if_violent: 如果检测到暴力内容是否替换
+            
+        Returns:
+            Dict: 检测结果
+        """
+        return self.submit_image_file(file_path, replace_if_violent).result()
+    
+    async def detect_image_file_async(self, 
+                                    file_path: Union[str, Path], 
+                                    replace_if_violent: bool = True) -> Dict[str, Any]:
+        """检测图像文件，在协程中等待推理结果而不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit_image_file(file_path, replace_if_violent))
+    
+    def submit_image_bytes(self, 
                          image_bytes: bytes,
                          filename: str = "image.jpg",
-                         replace_path: Optional[Path] = None) -> Dict[str, Any]:
+                         replace_path: Optional[Path] = None,
+                         use_cache: bool = True) -> "Future[Dict[str, Any]]":
         """
-        检测图像字节数据
+        提交图像字节数据检测，立即返回Future
         
         Args:
             image_bytes: 图像字节数据
             filename: 图像文件名
             replace_path: 如检测到暴力内容需要替换的路径，None表示不替换
+            use_cache: 是否使用审核结果缓存
             
         Returns:
-            Dict: 检测结果
+            Future: 结果为检测结果字典
         """
         start_time = time.time()
         
-        try:
-            # 读取图像
-            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-            
-            # 执行分类
-            prediction = self.classifier.classify_single_image(image)
+        def on_result(prediction: int, confidence: float) -> Dict[str, Any]:
             is_violent = prediction == 1
             
-            # 获取置信度
-            tensor = self.classifier.transforms(image).unsqueeze(0)
-            with torch.no_grad():
-                outputs = self.classifier.model(tensor.to(self.classifier.device))
-                confidences = torch.softmax(outputs, dim=1).cpu().numpy()
-            
             # 检测到暴力内容且需要替换
             replaced = False
             if is_violent and replace_path and self.harmony_img_path.exists():
@@ -151,12 +194,12 @@ class ImageDetector:
             return {
                 "filename": filename,
                 "is_violent": is_violent,
-                "confidence": float(confidences[0][prediction]),
+                "confidence": float(confidence),
                 "processing_time_ms": int(processing_time * 1000),
                 "replaced": replaced
             }
-            
-        except Exception as e:
+        
+        def on_error(e: Exception) -> Dict[str, Any]:
             logger.error(f"图像字节检测错误: {str(e)}")
             return {
                 "filename": filename,
@@ -164,13 +207,43 @@ class ImageDetector:
                 "is_violent": False,  # 默认为安全
                 "processing_time_ms": int((time.time() - start_time) * 1000)
             }
+        
+        return self._then(self.inference_server.submit(image_bytes, use_cache), on_result, on_error,
+                          blocking=replace_path is not None)
     
-    def detect_image_upload(self, 
-                         upload_file, 
-                         save_path: Optional[Path] = None,
-                         replace_if_violent: bool = True) -> Dict[str, Any]:
+    def detect_image_bytes(self, 
+                         image_bytes: bytes,
+                         filename: str = "image.jpg",
+                         replace_path: Optional[Path] = None,
+                         use_cache: bool = True) -> Dict[str, Any]:
         """
-        检测上传的图像文件
+        检测图像字节数据
+        
+        Args:
+            image_bytes: 图像字节数据
+            filename: 图像文件名
+            replace_path: 如检测到暴力内容需要替换的路径，None表示不替换
+            use_cache: 是否使用审核结果缓存
+            
+        Returns:
+            Dict: 检测结果
+        """
+        return self.submit_image_bytes(image_bytes, filename, replace_path, use_cache).result()
+    
+    async def detect_image_bytes_async(self, 
+                                     image_bytes: bytes,
+                                     filename: str = "image.jpg",
+                                     replace_path: Optional[Path] = None,
+                                     use_cache: bool = True) -> Dict[str, Any]:
+        """检测图像字节数据，在协程中等待推理结果而不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit_image_bytes(image_bytes, filename, replace_path, use_cache))
+    
+    def submit_image_upload(self, 
+                          upload_file, 
+                          save_path: Optional[Path] = None,
+                          replace_if_violent: bool = True) -> "Future[Dict[str, Any]]":
+        """
+        提交上传的图像文件检测，立即返回Future
         
         Args:
             upload_file: FastAPI上传文件对象
@@ -178,33 +251,30 @@ class ImageDetector:
             replace_if_violent: 如果检测到暴力内容是否替换
             
         Returns:
-            Dict: 检测结果
+            Future: 结果为检测结果字典
         """
         start_time = time.time()
         
         if not upload_file.content_type.startswith("image/"):
-            return {
+            future: "Future[Dict[str, Any]]" = Future()
+            future.set_result({
                 "filename": upload_file.filename,
                 "error": "非图像文件",
                 "is_violent": False,
                 "processing_time_ms": 0
-            }
+            })
+            return future
         
         try:
             # 读取图像内容
             image_content = upload_file.file.read()
-            image = Image.open(io.BytesIO(image_content)).convert('RGB')
-            
-            # 执行分类
-            prediction = self.classifier.classify_single_image(image)
+        finally:
+            # 重置文件指针
+            upload_file.file.seek(0)
+        
+        def on_result(prediction: int, confidence: float) -> Dict[str, Any]:
             is_violent = prediction == 1
             
-            # 获取置信度
-            tensor = self.classifier.transforms(image).unsqueeze(0)
-            with torch.no_grad():
-                outputs = self.classifier.model(tensor.to(self.classifier.device))
-                confidences = torch.softmax(outputs, dim=1).cpu().numpy()
-            
             # 检测到暴力内容且需要保存和替换
             replaced = False
             saved = False
@@ -232,7 +302,7 @@ class ImageDetector:
             result = {
                 "filename": upload_file.filename,
                 "is_violent": is_violent,
-                "confidence": float(confidences[0][prediction]),
+                "confidence": float(confidence),
                 "processing_time_ms": int(processing_time * 1000),
                 "replaced": replaced,
                 "saved": saved
@@ -242,8 +312,8 @@ class ImageDetector:
                 result["path"] = str(save_path)
             
             return result
-            
-        except Exception as e:
+        
+        def on_error(e: Exception) -> Dict[str, Any]:
             logger.error(f"上传图像检测错误: {str(e)}")
             return {
                 "filename": upload_file.filename,
@@ -251,9 +321,26 @@ class ImageDetector:
                 "is_violent": False,  # 默认为安全
                 "processing_time_ms": int((time.time() - start_time) * 1000)
             }
-        finally:
-            # 重置文件指针
-            upload_file.file.seek(0)
+        
+        return self._then(self.inference_server.submit(image_content), on_result, on_error,
+                          blocking=save_path is not None)
+    
+    def detect_image_upload(self, 
+                         upload_file, 
+                         save_path: Optional[Path] = None,
+                         replace_if_violent: bool = True) -> Dict[str, Any]:
+        """
+        检测上传的图像文件
+        
+        Args:
+            upload_file: FastAPI上传文件对象
+            save_path: 保存路径，None表示不保存
+            replace_if_violent: 如果检测到暴力内容是否替换
+            
+        Returns:
+            Dict: 检测结果
+        """
+        return self.submit_image_upload(upload_file, save_path, replace_if_violent).result()
     
     def batch_detect_files(self, 
                          file_paths: List[Union[str, Path]],
@@ -271,15 +358,11 @@ class ImageDetector:
         if not file_paths:
             return {"results": [], "total": 0}
         
-        results = []
-        violent_count = 0
+        # 一次性提交，由推理服务合并为批次，类别与置信度来自同一次前向传播
+        futures = [self.submit_image_file(path, replace_if_violent) for path in file_paths]
+        results = [future.result() for future in futures]
         
-        for path in file_paths:
-            result = self.detect_image_file(path, replace_if_violent)
-            results.append(result)
-            
-            if result.get("is_violent", False):
-                violent_count += 1
+        violent_count = sum(1 for result in results if result.get("is_violent", False))
         
         return {
             "results": results,
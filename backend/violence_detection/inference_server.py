@@ -0,0 +1,272 @@
+"""
+图像分类推理服务模块
+
+所有分类请求进入同一个队列，由专用推理线程在最大等待时间窗口内合并为小批次，
+每个批次只做一次前向传播。图像解码与缩放在按CPU核数设置的线程池中并行完成，
+与正在进行的前向传播重叠。解码前后分别按内容摘要和感知哈希查询审核结果缓存，
+命中的请求不进入前向传播。调用方得到concurrent.futures.Future，
+既可以在线程中同步等待，也可以在协程中通过predict_async等待而不阻塞事件循环。
+"""
+
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, BinaryIO, List, NamedTuple, Optional, Tuple, Union
+
+import torch
+from PIL import Image
+
+from .classify import get_classifier, ViolenceClass
+from .result_cache import ModerationCache, image_digest, perceptual_hash
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+ImageSource = Union[str, Path, bytes, BinaryIO, Image.Image]
+
+# 停止信号
+_STOP = object()
+
+class _Prepared(NamedTuple):
+    """解码阶段的产出：缓存命中时只有verdict，否则为待推理的张量及其缓存键"""
+    verdict: Optional[Tuple[int, float]] = None
+    tensor: Optional[torch.Tensor] = None
+    digest: Optional[str] = None
+    phash: Optional[str] = None
+
+class InferenceServer:
+    """动态小批次推理服务"""
+
+    def __init__(self,
+                 classifier: Optional[ViolenceClass] = None,
+                 max_batch_size: Optional[int] = None,
+                 max_wait_ms: float = 10.0,
+                 decode_workers: Optional[int] = None,
+                 torch_threads: Optional[int] = None,
+                 cache: Optional[ModerationCache] = None):
+        """
+        初始化推理服务
+
+        Args:
+            classifier (ViolenceClass, optional): 分类器，默认使用全局单例
+            max_batch_size (int, optional): 单批次最大图像数，默认为分类器的batch_size
+            max_wait_ms (float, optional): 凑批的最长等待时间（毫秒）. 默认为10
+            decode_workers (int, optional): 解码线程数，默认为CPU核数
+            torch_threads (int, optional): torch算子内并行线程数，默认为CPU核数；
+                只有推理线程会调用模型，前向传播可以独占全部核心
+            cache (ModerationCache, optional): 审核结果缓存，默认为仅在内存中的LRU缓存
+        """
+        cpu_count = os.cpu_count() or 1
+        self.classifier = classifier or get_classifier()
+        self.max_batch_size = max_batch_size or self.classifier.batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.torch_threads = torch_threads or cpu_count
+        self.cache = cache if cache is not None else ModerationCache()
+
+        # PIL解码和缩放会释放GIL，线程池即可并行；stop时关闭，start时重建
+        self.decode_workers = decode_workers or cpu_count
+        self._decode_pool: Optional[ThreadPoolExecutor] = None
+
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.request_count = 0
+        self.batch_count = 0
+
+    def start(self) -> None:
+        """启动推理线程和解码线程池（已启动时不做任何事）"""
+        with self._lock:
+            if self._decode_pool is None:
+                self._decode_pool = ThreadPoolExecutor(
+                    max_workers=self.decode_workers,
+                    thread_name_prefix="violence-decode"
+                )
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="violence-inference", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """停止推理线程并关闭解码线程池，尚未处理的请求以异常结束"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            pool, self._decode_pool = self._decode_pool, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._fail_pending(RuntimeError("推理服务已停止"))
+        self.cache.save()
+
+    def submit(self, image: ImageSource, use_cache: bool = True) -> "Future[Tuple[int, float]]":
+        """
+        提交一张图像
+
+        Args:
+            image: 图像路径、字节数据、文件对象或PIL图像对象，解码在解码线程池中完成
+            use_cache (bool, optional): 是否查询审核结果缓存. 默认为True，推理结果总会写入缓存
+
+        Returns:
+            Future: 结果为(分类结果, 置信度)
+        """
+        future: "Future[Tuple[int, float]]" = Future()
+        self.start()
+        pool = self._decode_pool
+        if pool is None:
+            raise RuntimeError("推理服务已停止")
+        # 提交时即开始解码，推理线程取到请求时张量通常已就绪
+        prepared_future = pool.submit(self._prepare, image, use_cache)
+        self._queue.put((prepared_future, future))
+        return future
+
+    def predict(self, image: ImageSource, use_cache: bool = True) -> Tuple[int, float]:
+        """同步提交并等待结果"""
+        return self.submit(image, use_cache).result()
+
+    async def predict_async(self, image: ImageSource, use_cache: bool = True) -> Tuple[int, float]:
+        """在协程中提交并等待结果，不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit(image, use_cache))
+
+    def _prepare(self, image: ImageSource, use_cache: bool) -> _Prepared:
+        """在解码线程中读取、查缓存并解码图像"""
+        digest = None
+        if not isinstance(image, Image.Image):
+            # 读出原始字节用于计算摘要，同一份字节再交给解码器
+            if isinstance(image, (str, Path)):
+                with open(image, "rb") as f:
+                    image = f.read()
+            elif not isinstance(image, bytes):
+                image = image.read()
+            digest = image_digest(image)
+            if use_cache:
+                verdict = self.cache.lookup_digest(digest)
+                if verdict is not None:
+                    return _Prepared(verdict=verdict)
+
+        preprocessor = self.classifier.preprocessor
+        decoded = preprocessor.load(image)
+        phash = perceptual_hash(decoded)
+        if use_cache:
+            verdict = self.cache.get(digest, phash)
+            if verdict is not None:
+                return _Prepared(verdict=verdict)
+        return _Prepared(tensor=preprocessor.transforms(decoded), digest=digest, phash=phash)
+
+    def _run(self) -> None:
+        torch.set_num_threads(self.torch_threads)
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = self._collect(item)
+            self._process(batch)
+
+    def _collect(self, first) -> List[Tuple[Future, Future]]:
+        """从第一个请求开始计时，在等待窗口内尽量凑满一个批次"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # 窗口已过时仍取走队列中已有的请求，不再等待
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # 留给主循环处理
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _process(self, batch: List[Tuple[Future, Future]]) -> None:
+        tensors = []
+        futures = []
+        keys = []
+        for prepared_future, future in batch:
+            if not future.set_running_or_notify_cancel():
+                prepared_future.cancel()
+                continue
+            try:
+                prepared = prepared_future.result()
+            except CancelledError:
+                # 服务停止时解码任务被取消
+                future.set_exception(RuntimeError("推理服务已停止"))
+                continue
+            except Exception as e:
+                # 单张图像解码失败不影响同批次其他图像
+                future.set_exception(e)
+                continue
+            if prepared.verdict is not None:
+                future.set_result(prepared.verdict)
+                continue
+            tensors.append(prepared.tensor)
+            futures.append(future)
+            keys.append((prepared.digest, prepared.phash))
+
+        if not futures:
+            return
+
+        try:
+            predictions, confidences = self.classifier.predict_tensors(tensors)
+        except Exception as e:
+            logger.error(f"批量推理错误: {str(e)}")
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        self.request_count += len(futures)
+        self.batch_count += 1
+        for future, (digest, phash), prediction, confidence in zip(futures, keys, predictions, confidences):
+            self.cache.put((prediction, confidence), digest, phash)
+            future.set_result((prediction, confidence))
+
+    def _fail_pending(self, error: Exception) -> None:
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(error)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+def get_inference_server(max_batch_size: Optional[int] = None,
+                         max_wait_ms: float = 10.0,
+                         decode_workers: Optional[int] = None,
+                         torch_threads: Optional[int] = None,
+                         cache: Optional[ModerationCache] = None) -> InferenceServer:
+    """
+    获取推理服务单例实例（参数仅在首次调用时生效）
+
+    Args:
+        max_batch_size (int, optional): 单批次最大图像数
+        max_wait_ms (float, optional): 凑批的最长等待时间（毫秒）
+        decode_workers (int, optional): 解码线程数
+        torch_threads (int, optional): torch算子内并行线程数
+        cache (ModerationCache, optional): 审核结果缓存
+
+    Returns:
+        InferenceServer: 推理服务实例
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = InferenceServer(
+                max_batch_size=max_batch_size,
+                max_wait_ms=max_wait_ms,
+                decode_workers=decode_workers,
+                torch_threads=torch_threads,
+                cache=cache
+            )
+    return _server
@@ -13,7 +13,7 @@ from typing import List, Dict, Any, Set, Optional
 import json
 import os
 
-from .classify import get_classifier
+from .inference_server import get_inference_server
 
 class ContentFilterMiddleware(BaseHTTPMiddleware):
     """内容过滤中间件，检查敏感词和图像内容"""
@@ -132,18 +132,13 @@ class ContentFilterMiddleware(BaseHTTPMiddleware):
         """检查图像是否包含不当内容，True为合规，False为不合规"""
         try:
             content = await file.read()
-            image = Image.open(io.BytesIO(content)).convert('RGB')
             
-            classifier = get_classifier()
-            
-            preprocessed_image = classifier.transforms(image)
-            tensor = preprocessed_image.unsqueeze(0)
-            
-            predictions = classifier.classify(tensor)
+            # 解码、缩放与推理都在推理服务线程中完成，不阻塞事件循环
+            prediction, _ = await get_inference_server().predict_async(content)
             
             await file.seek(0)
             
-            is_violent = any(pred == 1 for pred in predictions)
+            is_violent = prediction == 1
             
             return not is_violent
             
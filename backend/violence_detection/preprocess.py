@@ -0,0 +1,83 @@
+"""
+图像预处理模块
+
+统一的解码、缩放与归一化流程，供分类器、图像检测器和中间件共用。
+"""
+
+import io
+from pathlib import Path
+from typing import Optional, Tuple, Union, BinaryIO
+
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+# ImageNet 统计量，ResNet18 预训练权重使用的归一化参数
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+class ImagePreprocessor:
+    """将图像转换为模型输入张量，可选缩放到固定尺寸"""
+
+    def __init__(self,
+                 input_size: Optional[int] = None,
+                 normalize: bool = False,
+                 mean: Tuple[float, float, float] = IMAGENET_MEAN,
+                 std: Tuple[float, float, float] = IMAGENET_STD,
+                 draft: bool = True):
+        """
+        初始化预处理器
+
+        Args:
+            input_size (int, optional): 模型输入边长. 默认为None，保持原始分辨率，与现有检查点的评估流程一致；
+                设置后统一缩放到该尺寸，不同尺寸的图像可以合并为一个批次，大图推理也快得多，
+                但需先在验证集上确认检查点的准确率
+            normalize (bool, optional): 是否做均值方差归一化. 默认为False，与现有检查点的训练流程一致
+            mean (Tuple[float, float, float], optional): 归一化均值
+            std (Tuple[float, float, float], optional): 归一化标准差
+            draft (bool, optional): 设置了input_size时，解码JPEG是否使用draft模式直接按缩小比例解码. 默认为True
+        """
+        self.input_size = input_size
+        self.draft = draft
+
+        steps = [transforms.ToTensor()]
+        if input_size:
+            steps.insert(0, transforms.Resize((input_size, input_size)))
+        if normalize:
+            steps.append(transforms.Normalize(mean, std))
+        self.transforms = transforms.Compose(steps)
+
+    def load(self, source: Union[str, Path, bytes, BinaryIO, Image.Image]) -> Image.Image:
+        """
+        解码图像为RGB格式的PIL图像
+
+        Args:
+            source: 图像路径、字节数据、文件对象或PIL图像对象
+
+        Returns:
+            Image.Image: RGB图像
+        """
+        if isinstance(source, Image.Image):
+            return source.convert('RGB')
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        elif not isinstance(source, (str, Path)) and not hasattr(source, 'read'):
+            raise TypeError("图像必须是PIL.Image对象、图像路径、字节数据或文件对象")
+
+        image = Image.open(source)
+        if self.draft and self.input_size:
+            # JPEG解码器按1/2、1/4、1/8缩小后解码，结果不小于目标尺寸；其他格式忽略
+            image.draft('RGB', (self.input_size, self.input_size))
+        return image.convert('RGB')
+
+    def __call__(self, image: Union[str, Path, bytes, BinaryIO, Image.Image]) -> torch.Tensor:
+        """
+        预处理单张图像
+
+        Args:
+            image: 图像路径、字节数据、文件对象或PIL图像对象
+
+        Returns:
+            torch.Tensor: 形状为[3, input_size, input_size]的张量，未设置input_size时为[3, H, W]
+        """
+        return self.transforms(self.load(image))
@@ -0,0 +1,246 @@
+"""
+图像审核结果缓存模块
+
+以内容摘要（sha256）和感知哈希（差值哈希dHash）为键缓存分类结果：
+完全相同的文件按摘要命中，重新编码/压缩过的转发图片按感知哈希的汉明距离近邻命中。
+感知哈希只记录违规结果：对已知合规图片稍加扰动就能得到相近的哈希，
+复用合规结果会让未经分类的图片绕过审核，因此近邻命中合规图片时仍需重新分类。
+近邻查找把64位哈希分为若干段建立索引，距离阈值小于段数时至少有一段完全相同，
+只需比较共享某一段的候选项。缓存按LRU淘汰，可选持久化到磁盘，服务重启后仍然有效。
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+Verdict = Tuple[int, float]
+
+# 分类结果中表示违规的类别
+VIOLENT = 1
+
+# 默认持久化位置：与模型检查点放在一起，更换检查点时一并清理；可用环境变量MODERATION_CACHE_PATH覆盖
+DEFAULT_PERSIST_PATH = Path(os.environ.get(
+    "MODERATION_CACHE_PATH",
+    Path(__file__).resolve().parent / "checkpoints" / "moderation_cache.json",
+))
+
+def image_digest(data: bytes) -> str:
+    """计算图像内容摘要"""
+    return hashlib.sha256(data).hexdigest()
+
+def perceptual_hash(image: Image.Image, hash_size: int = 8) -> Optional[str]:
+    """
+    计算差值哈希（dHash）
+
+    图像缩放为(hash_size+1)×hash_size的灰度图，比较水平相邻像素的明暗得到hash_size²位哈希，
+    对重新编码、缩放和轻微调色不敏感。
+
+    Args:
+        image (Image.Image): PIL图像
+        hash_size (int, optional): 哈希边长，默认8即64位
+
+    Returns:
+        Optional[str]: 十六进制哈希；纯色等没有纹理的图像返回None，避免互相误命中
+    """
+    gray = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    if not bits.any() or bits.all():
+        return None
+    return np.packbits(bits).tobytes().hex()
+
+def hamming_distance(a: str, b: str) -> int:
+    """两个十六进制哈希的汉明距离"""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+class ModerationCache:
+    """线程安全的LRU审核结果缓存"""
+
+    def __init__(self,
+                 max_size: int = 10000,
+                 persist_path: Optional[Union[str, Path]] = None,
+                 save_interval: int = 100,
+                 max_distance: int = 3):
+        """
+        初始化缓存
+
+        Args:
+            max_size (int, optional): 最大条目数（摘要和感知哈希各算一条）. 默认为10000
+            persist_path (Union[str, Path], optional): 持久化文件路径，None表示仅在内存中缓存
+            save_interval (int, optional): 每新增多少条写一次磁盘. 默认为100
+            max_distance (int, optional): 感知哈希视为同一图像的最大汉明距离. 默认为3，为0时只做精确匹配
+        """
+        self.max_size = max_size
+        self.persist_path = Path(persist_path) if persist_path else None
+        self.save_interval = save_interval
+        self.max_distance = max_distance
+        # 分段数比距离阈值多1，保证近邻至少有一段与查询完全相同
+        self.bands = max_distance + 1
+
+        self._entries: "OrderedDict[str, Verdict]" = OrderedDict()
+        self._band_index: Dict[Tuple[int, str], Set[str]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._unsaved = 0
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+
+        if self.persist_path:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get(self, key: str) -> Optional[Verdict]:
+        verdict = self._entries.get(key)
+        if verdict is not None:
+            self._entries.move_to_end(key)
+        return verdict
+
+    def _split(self, phash: str) -> list:
+        """将十六进制哈希切分为self.bands段"""
+        step = -(-len(phash) // self.bands)
+        return [(i, phash[i * step:(i + 1) * step]) for i in range(self.bands)]
+
+    def _nearest(self, phash: str) -> Optional[str]:
+        """在距离阈值内查找最近的已缓存感知哈希"""
+        if f"p:{phash}" in self._entries:
+            return phash
+        if self.max_distance <= 0:
+            return None
+        best, best_distance = None, self.max_distance + 1
+        candidates = set()
+        for band in self._split(phash):
+            candidates |= self._band_index.get(band, set())
+        for candidate in candidates:
+            distance = hamming_distance(phash, candidate)
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return best
+
+    def get(self, digest: Optional[str] = None, phash: Optional[str] = None) -> Optional[Verdict]:
+        """
+        查询缓存，先按摘要后按感知哈希
+
+        Args:
+            digest (str, optional): 内容摘要
+            phash (str, optional): 感知哈希
+
+        Returns:
+            Optional[Verdict]: (分类结果, 置信度)，未命中返回None；按感知哈希只会命中违规结果
+        """
+        with self._lock:
+            verdict = None
+            if digest:
+                verdict = self._get(f"d:{digest}")
+            if verdict is None and phash:
+                nearest = self._nearest(phash)
+                if nearest is not None:
+                    verdict = self._get(f"p:{nearest}")
+                if verdict is not None and digest:
+                    # 重新编码的图片命中后补记摘要，下次无需解码
+                    self._set(f"d:{digest}", verdict)
+            if verdict is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return verdict
+
+    def lookup_digest(self, digest: str) -> Optional[Verdict]:
+        """仅按摘要查询，用于解码前的快速判断；未命中不计入统计，解码后还会再按感知哈希查询"""
+        with self._lock:
+            verdict = self._get(f"d:{digest}")
+            if verdict is not None:
+                self.hits += 1
+            return verdict
+
+    def _set(self, key: str, verdict: Verdict) -> None:
+        if key not in self._entries:
+            self._unsaved += 1
+        self._entries[key] = verdict
+        self._entries.move_to_end(key)
+        if key.startswith("p:"):
+            for band in self._split(key[2:]):
+                self._band_index[band].add(key[2:])
+        while len(self._entries) > self.max_size:
+            evicted, _ = self._entries.popitem(last=False)
+            if evicted.startswith("p:"):
+                self._unindex(evicted[2:])
+
+    def _unindex(self, phash: str) -> None:
+        for band in self._split(phash):
+            members = self._band_index.get(band)
+            if members is not None:
+                members.discard(phash)
+                if not members:
+                    del self._band_index[band]
+
+    def put(self, verdict: Verdict, digest: Optional[str] = None, phash: Optional[str] = None) -> None:
+        """
+        写入分类结果
+
+        Args:
+            verdict (Verdict): (分类结果, 置信度)
+            digest (str, optional): 内容摘要
+            phash (str, optional): 感知哈希，只在结果为违规时记录
+        """
+        verdict = (int(verdict[0]), float(verdict[1]))
+        with self._lock:
+            if digest:
+                self._set(f"d:{digest}", verdict)
+            if phash and verdict[0] == VIOLENT:
+                self._set(f"p:{phash}", verdict)
+            need_save = self.persist_path is not None and self._unsaved >= self.save_interval
+        if need_save:
+            self.save()
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._band_index.clear()
+            self._unsaved = 0
+
+    def save(self) -> None:
+        """按LRU顺序写入磁盘（先写临时文件再替换，避免写坏）"""
+        if self.persist_path is None:
+            return
+        with self._lock:
+            data = [[key, verdict[0], verdict[1]] for key, verdict in self._entries.items()]
+            self._unsaved = 0
+        try:
+            self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.persist_path.with_name(self.persist_path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            logger.error(f"保存审核缓存失败: {str(e)}")
+
+    def _load(self) -> None:
+        if not self.persist_path.exists():
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for key, prediction, confidence in data[-self.max_size:]:
+                # 旧版本文件中按感知哈希记录的合规结果不再复用
+                if key.startswith("p:") and int(prediction) != VIOLENT:
+                    continue
+                self._set(key, (int(prediction), float(confidence)))
+            self._unsaved = 0
+            logger.info(f"已加载审核缓存 {len(self._entries)} 条")
+        except Exception as e:
+            logger.error(f"加载审核缓存失败: {str(e)}")
@@ -8,6 +8,7 @@ from typing import List, Dict, Any, Optional
 import tempfile
 import os
 import shutil
+import asyncio
 from pathlib import Path
 import time
 
@@ -20,9 +21,6 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-# 保留结果缓存
-result_cache = {}
-
 BASE_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
 HARMONY_IMG_PATH = BASE_DIR.parent / "media" / "harmony.png"
 UPLOAD_DIR = BASE_DIR.parent / "media" / "uploads"
@@ -49,7 +47,7 @@ async def detect_violence(
 
     Args:
         file (UploadFile): 上传的图像文件
-        cache (bool, optional): 是否启用结果缓存, 默认为True
+        cache (bool, optional): 是否使用审核结果缓存（按内容摘要和感知哈希）, 默认为True
         replace_if_violent (bool, optional): 如果检测到暴力内容是否替换,默认为True
         
     Returns:
@@ -61,13 +59,6 @@ async def detect_violence(
     # 读取文件内容
     image_content = await file.read()
     
-    # 检查缓存
-    if cache:
-        cache_key = str(hash(image_content))
-        if cache_key in result_cache:
-            result_cache[cache_key]["timestamp"] = time.time()
-            return result_cache[cache_key]["result"]
-    
     try:
         # 如果需要替换，创建保存路径
         save_path = None
@@ -75,22 +66,14 @@ async def detect_violence(
             save_path = UPLOAD_DIR / file.filename
             UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
         
-        # 使用检测器处理图像
-        result = detector.detect_image_bytes(
+        # 使用检测器处理图像，推理在推理服务线程中完成
+        result = await detector.detect_image_bytes_async(
             image_content,
             filename=file.filename,
-            replace_path=save_path if replace_if_violent else None
+            replace_path=save_path if replace_if_violent else None,
+            use_cache=cache
         )
         
-        # 添加到缓存
-        if cache:
-            result_cache[cache_key] = {
-                "result": result,
-                "timestamp": time.time()
-            }
-            
-            _cleanup_cache()
-        
         return result
     
     except Exception as e:
@@ -121,7 +104,7 @@ async def process_uploaded_image(
         
     try:
         # 使用检测器处理图像
-        result = detector.detect_image_file(
+        result = await detector.detect_image_file_async(
             full_path,
             replace_if_violent=replace_if_violent
         )
@@ -156,12 +139,10 @@ async def batch_detect_violence(
     if len(files) > 20:
         raise HTTPException(status_code=400, detail="一次最多处理20张图像")
     
-    results = []
-    violent_count = 0
-    
     try:
         UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
         
+        futures = []
         for file in files:
             if not file.content_type.startswith("image/"):
                 raise HTTPException(status_code=400, detail=f"文件 '{file.filename}' 不是图像")
@@ -171,16 +152,15 @@ async def batch_detect_violence(
             if replace_if_violent:
                 save_path = UPLOAD_DIR / file.filename
             
-            # 使用检测器处理图像
-            result = detector.detect_image_upload(
+            # 全部提交后统一等待，推理服务将其合并为批次
+            futures.append(detector.submit_image_upload(
                 file,
                 save_path=save_path,
                 replace_if_violent=replace_if_violent
-            )
-            
-            results.append(result)
-            if result.get("is_violent", False):
-                violent_count += 1
+            ))
+        
+        results = await asyncio.gather(*[asyncio.wrap_future(future) for future in futures])
+        violent_count = sum(1 for result in results if result.get("is_violent", False))
         
         return {
             "results": results, 
@@ -191,17 +171,3 @@ async def batch_detect_violence(
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"批量处理错误: {str(e)}")
-
-def _cleanup_cache():
-    """清理过期的缓存项"""
-    global result_cache
-    current_time = time.time()
-    expire_time = 3600  # 1小时过期
-    
-    expired_keys = [
-        k for k, v in result_cache.items() 
-        if current_time - v["timestamp"] > expire_time
-    ]
-    
-    for key in expired_keys:
-        del result_cache[key]
\ No newline at end of file
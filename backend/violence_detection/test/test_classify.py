@@ -0,0 +1,74 @@
+import io
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../")))
+from backend.violence_detection.classify import ViolenceClass
+from backend.violence_detection.model import ViolenceClassifier
+from backend.violence_detection.preprocess import ImagePreprocessor
+
+
+def make_image(width: int, height: int, seed: int) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+def make_classifier(**kwargs) -> ViolenceClass:
+    """随机初始化权重的分类器，不依赖检查点文件"""
+    torch.manual_seed(0)
+    with patch("backend.violence_detection.classify.load_model_from_checkpoint",
+               side_effect=lambda path, device: ViolenceClassifier().to(device)):
+        return ViolenceClass("unused.ckpt", **kwargs)
+
+
+class TestImagePreprocessor(unittest.TestCase):
+    """预处理流程"""
+
+    def test_default_matches_original_pipeline(self):
+        # 默认与检查点评估时的流程一致：只做ToTensor，保持原始分辨率
+        image = make_image(40, 30, 0)
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        tensor = ImagePreprocessor()(buffer.getvalue())
+        self.assertEqual(tuple(tensor.shape), (3, 30, 40))
+        self.assertTrue(torch.equal(tensor, transforms.ToTensor()(image)))
+
+    def test_fixed_size(self):
+        image = make_image(400, 300, 1)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG")
+        self.assertEqual(tuple(ImagePreprocessor(input_size=64)(buffer.getvalue()).shape), (3, 64, 64))
+
+
+class TestBatchPredict(unittest.TestCase):
+    """批量推理与逐张推理的结果一致"""
+
+    def assert_batch_matches_single(self, classifier, images):
+        predictions, confidences = classifier.batch_predict(images)
+        for image, prediction, confidence in zip(images, predictions, confidences):
+            single_prediction, single_confidence = classifier.predict_single_image(image)
+            self.assertEqual(prediction, single_prediction)
+            self.assertAlmostEqual(confidence, single_confidence, places=4)
+        self.assertEqual(classifier.batch_classify(images), predictions)
+
+    def test_original_resolution(self):
+        # 尺寸不同的图像按形状分组推理，批次跨越batch_size边界
+        classifier = make_classifier(batch_size=3)
+        images = [make_image(*size, seed) for seed, size in enumerate([(64, 48), (64, 48), (32, 32), (64, 48), (32, 32)])]
+        self.assert_batch_matches_single(classifier, images)
+
+    def test_fixed_size(self):
+        classifier = make_classifier(batch_size=4, input_size=64)
+        images = [make_image(80 + seed * 10, 60, seed) for seed in range(5)]
+        self.assert_batch_matches_single(classifier, images)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+import io
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../")))
+from backend.violence_detection.inference_server import InferenceServer
+from backend.violence_detection.image_detector import ImageDetector
+from backend.violence_detection.preprocess import ImagePreprocessor
+from backend.violence_detection.result_cache import ModerationCache
+
+
+def make_image(value: int) -> bytes:
+    """生成纯色PNG，红色通道的值作为图像编号"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), (value, 0, 0)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class StubClassifier:
+    """代替模型的分类器：红色通道大于128判为暴力，记录每次前向传播的批大小"""
+
+    def __init__(self, batch_size: int = 16, error: Exception = None):
+        self.batch_size = batch_size
+        self.preprocessor = ImagePreprocessor(input_size=8)
+        self.error = error
+        self.batches = []
+        # 清除后前向传播阻塞，用于构造推理线程忙碌的场景
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def predict_tensors(self, tensors):
+        self.gate.wait()
+        self.batches.append(len(tensors))
+        if self.error is not None:
+            raise self.error
+        predictions = [int(tensor[0].mean() > 0.5) for tensor in tensors]
+        return predictions, [0.9] * len(tensors)
+
+
+class TestInferenceServer(unittest.TestCase):
+    """动态批处理推理服务"""
+
+    def make_server(self, classifier, **kwargs):
+        server = InferenceServer(classifier=classifier, cache=ModerationCache(), **kwargs)
+        self.addCleanup(server.stop, 0.1)
+        return server
+
+    def test_requests_in_window_share_one_batch(self):
+        classifier = StubClassifier()
+        server = self.make_server(classifier, max_wait_ms=200)
+        futures = [server.submit(make_image(value), use_cache=False) for value in (10, 200, 30, 250)]
+        results = [future.result(timeout=5) for future in futures]
+        self.assertEqual([prediction for prediction, _ in results], [0, 1, 0, 1])
+        self.assertEqual(classifier.batches, [4])
+        self.assertEqual((server.batch_count, server.request_count), (1, 4))
+
+    def test_batch_limited_by_size_and_wait(self):
+        classifier = StubClassifier(batch_size=2)
+        server = self.make_server(classifier, max_wait_ms=200)
+        futures = [server.submit(make_image(value), use_cache=False) for value in range(3)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(classifier.batches, [2, 1])
+
+        # 单个请求最多等待一个窗口就开始推理
+        server = self.make_server(StubClassifier(), max_wait_ms=20)
+        start = time.monotonic()
+        server.submit(make_image(1), use_cache=False).result(timeout=5)
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_cached_result_skips_forward_pass(self):
+        classifier = StubClassifier()
+        server = self.make_server(classifier, max_wait_ms=1)
+        image = make_image(200)
+        self.assertEqual(server.predict(image)[0], 1)
+        self.assertEqual(server.predict(image)[0], 1)
+        self.assertEqual(classifier.batches, [1])
+
+    def test_errors_fail_only_affected_futures(self):
+        server = self.make_server(StubClassifier(), max_wait_ms=100)
+        broken = server.submit(b"not an image", use_cache=False)
+        healthy = server.submit(make_image(1), use_cache=False)
+        self.assertEqual(healthy.result(timeout=5)[0], 0)
+        with self.assertRaises(Exception):
+            broken.result(timeout=5)
+
+        server = self.make_server(StubClassifier(error=ValueError("boom")), max_wait_ms=1)
+        with self.assertRaises(ValueError):
+            server.predict(make_image(1), use_cache=False)
+
+    def test_stop_fails_pending_futures(self):
+        classifier = StubClassifier()
+        server = self.make_server(classifier, max_batch_size=1, max_wait_ms=1)
+        classifier.gate.clear()
+        running = server.submit(make_image(1), use_cache=False)
+        while not classifier.batches and server._queue.qsize():
+            time.sleep(0.01)
+        pending = [server.submit(make_image(value), use_cache=False) for value in (2, 3)]
+        time.sleep(0.05)
+
+        server.stop(timeout=0.1)
+        for future in pending:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=1)
+        # 已在推理中的请求正常完成
+        classifier.gate.set()
+        self.assertEqual(running.result(timeout=5)[0], 0)
+
+    def test_stop_shuts_down_decode_pool(self):
+        server = self.make_server(StubClassifier(), max_wait_ms=1)
+        server.predict(make_image(1), use_cache=False)
+        pool = server._decode_pool
+        server.stop()
+        with self.assertRaises(RuntimeError):
+            pool.submit(print)
+        # 再次提交时重新启动
+        self.assertEqual(server.predict(make_image(200), use_cache=False)[0], 1)
+
+    def test_decode_runs_in_parallel(self):
+        classifier = StubClassifier()
+        load = classifier.preprocessor.load
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def slow_load(image):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.1)
+            with lock:
+                active[0] -= 1
+            return load(image)
+
+        classifier.preprocessor.load = slow_load
+        server = self.make_server(classifier, max_wait_ms=1, decode_workers=4)
+
+        async def detect_all():
+            return await asyncio.gather(*[server.predict_async(make_image(value), use_cache=False) for value in range(4)])
+
+        self.assertEqual(len(asyncio.run(detect_all())), 4)
+        self.assertEqual(peak[0], 4)
+
+
+class TestImageDetector(unittest.TestCase):
+    """检测器的Future接口和协程接口"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.harmony = Path(self.tmp_dir.name) / "harmony.png"
+        self.harmony.write_bytes(make_image(0))
+        self.classifier = StubClassifier()
+        self.server = InferenceServer(classifier=self.classifier, max_wait_ms=1, cache=ModerationCache())
+        self.addCleanup(self.server.stop, 0.1)
+        with patch("backend.violence_detection.image_detector.get_classifier", return_value=self.classifier):
+            self.detector = ImageDetector(harmony_img_path=self.harmony, inference_server=self.server)
+
+    def test_submit_and_async(self):
+        result = self.detector.submit_image_bytes(make_image(200), "a.png").result(timeout=5)
+        self.assertTrue(result["is_violent"])
+        self.assertFalse(result["replaced"])
+
+        result = asyncio.run(self.detector.detect_image_bytes_async(make_image(10), "b.png"))
+        self.assertFalse(result["is_violent"])
+
+    def test_file_replaced_off_inference_thread(self):
+        path = Path(self.tmp_dir.name) / "violent.png"
+        path.write_bytes(make_image(220))
+        threads = []
+        replace = self.detector._replace_if_needed
+
+        def record_thread(*args):
+            threads.append(threading.current_thread().name)
+            return replace(*args)
+
+        with patch.object(self.detector, "_replace_if_needed", side_effect=record_thread):
+            result = asyncio.run(self.detector.detect_image_file_async(path))
+        self.assertTrue(result["replaced"])
+        self.assertEqual(path.read_bytes(), self.harmony.read_bytes())
+        self.assertTrue(threads[0].startswith("violence-io"), msg=threads)
+
+    def test_inference_error_becomes_error_result(self):
+        self.classifier.error = RuntimeError("model failed")
+        result = self.detector.submit_image_bytes(make_image(1), use_cache=False).result(timeout=5)
+        self.assertEqual(result["error"], "model failed")
+        self.assertFalse(result["is_violent"])
+
+
+if __name__ == "__main__":
+    unittest.main()
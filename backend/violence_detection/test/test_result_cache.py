@@ -0,0 +1,89 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../")))
+from backend.violence_detection.result_cache import ModerationCache, hamming_distance, perceptual_hash
+
+
+def flip_bits(phash: str, count: int) -> str:
+    """翻转哈希的低count位"""
+    return f"{int(phash, 16) ^ ((1 << count) - 1):0{len(phash)}x}"
+
+
+class TestModerationCache(unittest.TestCase):
+    """审核结果缓存的近邻命中、淘汰和持久化"""
+
+    PHASH = "f0e1d2c3b4a59687"
+
+    def test_near_duplicate_hit(self):
+        cache = ModerationCache(max_distance=3)
+        cache.put((1, 0.9), digest="a" * 64, phash=self.PHASH)
+        # 重新编码的图片摘要不同，感知哈希相差不超过阈值时命中，并补记摘要
+        self.assertEqual(cache.get(digest="b" * 64, phash=flip_bits(self.PHASH, 3)), (1, 0.9))
+        self.assertEqual(cache.lookup_digest("b" * 64), (1, 0.9))
+
+    def test_reencoded_image_hash_is_close(self):
+        rng = np.random.default_rng(0)
+        image = Image.fromarray(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)).resize((256, 256))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=70)
+        reencoded = Image.open(io.BytesIO(buffer.getvalue()))
+        self.assertLessEqual(hamming_distance(perceptual_hash(image), perceptual_hash(reencoded)), 3)
+
+    def test_miss_beyond_max_distance(self):
+        cache = ModerationCache(max_distance=3)
+        cache.put((1, 0.9), phash=self.PHASH)
+        self.assertIsNone(cache.get(phash=flip_bits(self.PHASH, 4)))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        # 阈值为0时只做精确匹配
+        exact = ModerationCache(max_distance=0)
+        exact.put((1, 0.8), phash=self.PHASH)
+        self.assertIsNone(exact.get(phash=flip_bits(self.PHASH, 1)))
+        self.assertEqual(exact.get(phash=self.PHASH), (1, 0.8))
+
+    def test_safe_verdict_needs_exact_digest(self):
+        cache = ModerationCache(max_distance=3)
+        cache.put((0, 0.95), digest="a" * 64, phash=self.PHASH)
+        # 合规结果只按摘要复用，扰动后的图片即使感知哈希相近或相同也要重新分类
+        self.assertEqual(cache.get(digest="a" * 64, phash=self.PHASH), (0, 0.95))
+        self.assertIsNone(cache.get(digest="b" * 64, phash=flip_bits(self.PHASH, 1)))
+        self.assertIsNone(cache.get(digest="b" * 64, phash=self.PHASH))
+
+    def test_lru_eviction(self):
+        cache = ModerationCache(max_size=2)
+        cache.put((0, 0.5), digest="a")
+        cache.put((0, 0.6), digest="b")
+        cache.get(digest="a")  # a成为最近使用
+        cache.put((1, 0.7), digest="c")
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(digest="b"))
+        self.assertEqual(cache.get(digest="a"), (0, 0.5))
+
+        # 淘汰的感知哈希同时移出分段索引，不再被近邻命中
+        cache = ModerationCache(max_size=1)
+        cache.put((1, 0.9), phash=self.PHASH)
+        cache.put((0, 0.5), digest="a")
+        self.assertIsNone(cache.get(phash=flip_bits(self.PHASH, 1)))
+
+    def test_persistence_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "cache", "moderation_cache.json")
+            cache = ModerationCache(persist_path=path, save_interval=1000)
+            cache.put((1, 0.9), digest="a", phash=self.PHASH)
+            cache.put((0, 0.2), digest="b")
+            cache.save()
+
+            loaded = ModerationCache(persist_path=path)
+            self.assertEqual(len(loaded), 3)
+            self.assertEqual(loaded.get(digest="b"), (0, 0.2))
+            self.assertEqual(loaded.get(phash=flip_bits(self.PHASH, 2)), (1, 0.9))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+"""
+文本审核批处理模块
+
+待审核内容进入同一个队列，由收集线程在最大等待时间窗口内合并为批次：
+黑名单检查后，整批内容的敏感词服务请求同时发出，在连接池中并行完成；
+通过前两级检查的内容合并为一次大模型调用，返回无法逐条解析时降级为逐条验证。
+调用方得到concurrent.futures.Future，与单条check_content的结果一致。
+"""
+
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, List, Optional, Tuple
+
+from .checker import WordsChecker, words_checker
+
+logger = logging.getLogger(__name__)
+
+# 停止信号
+_STOP = object()
+
+
+class ModerationBatcher:
+    """文本审核批处理服务"""
+
+    def __init__(
+        self,
+        checker: Optional[WordsChecker] = None,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 50.0,
+        max_inflight_batches: int = 4,
+        check_timeout: float = 60.0,
+    ):
+        """
+        初始化批处理服务
+
+        参数:
+            checker: 敏感词检测器，默认使用全局实例
+            max_batch_size: 单批次最大条数
+            max_wait_ms: 凑批的最长等待时间（毫秒）
+            max_inflight_batches: 同时处理的批次数，大模型调用期间仍可继续收集下一批
+            check_timeout: 同步审核check()的最长等待时间（秒）
+        """
+        self.checker = checker or words_checker
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.check_timeout = check_timeout
+        self.max_inflight_batches = max_inflight_batches
+
+        # 批次处理线程池在start()中创建，stop()后可重新启动
+        self._workers: Optional[ThreadPoolExecutor] = None
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.request_count = 0
+        self.batch_count = 0
+
+    def start(self) -> None:
+        """启动收集线程和批次处理线程池（已启动时不做任何事）"""
+        with self._lock:
+            if self._workers is None:
+                self._workers = ThreadPoolExecutor(
+                    max_workers=self.max_inflight_batches,
+                    thread_name_prefix="moderation-batch"
+                )
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="moderation-collect", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """停止收集线程，等待已取出的批次处理完毕"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            workers, self._workers = self._workers, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        if workers is not None:
+            workers.shutdown(wait=True)
+
+    def submit(self, content: str) -> "Future[bool]":
+        """
+        提交一条待审核内容
+
+        参数:
+            content: 原始内容（可包含图片标记）
+
+        返回:
+            Future: 结果为是否合规
+        """
+        future: "Future[bool]" = Future()
+        self.start()
+        self._queue.put((content, future))
+        return future
+
+    def check(self, content: str, img_lst=None, timeout: Optional[float] = None) -> bool:
+        """
+        同步审核，与WordsChecker.check_content接口兼容
+
+        参数:
+            content: 原始内容（可包含图片标记）
+            img_lst: 兼容参数，不使用
+            timeout: 最长等待时间（秒），默认为check_timeout
+
+        返回:
+            bool: 是否合规；超时抛出TimeoutError，内容保持待审核状态
+        """
+        future = self.submit(content)
+        try:
+            return future.result(timeout=self.check_timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            # Python 3.11之前concurrent.futures.TimeoutError不是内置TimeoutError
+            future.cancel()
+            raise TimeoutError("文本审核超时")
+
+    async def check_async(self, content: str) -> bool:
+        """在协程中审核，不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit(content))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            try:
+                self._collect(batch)
+                workers = self._workers
+                if workers is None:
+                    raise RuntimeError("批处理服务已停止")
+                workers.submit(self._process, batch)
+            except Exception as e:
+                # 收集或提交失败时整批以异常结束，调用方不会一直等待
+                logger.exception(f"批次提交失败: {str(e)}")
+                for _, future in batch:
+                    if future.set_running_or_notify_cancel():
+                        future.set_exception(e)
+
+    def _collect(self, batch: List[Tuple[str, Future]]) -> None:
+        """从第一条内容开始计时，在等待窗口内尽量凑满一个批次（原地追加到batch）"""
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # 留给主循环处理
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+
+    def _process(self, batch: List[Tuple[str, Future]]) -> None:
+        checker = self.checker
+        pending = []
+        for content, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                verdict, text_content = checker._precheck(content)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            if verdict is not None:
+                future.set_result(verdict)
+            else:
+                pending.append((text_content, future))
+
+        if not pending:
+            return
+
+        try:
+            # 所有敏感词服务请求同时发出，在连接池中并行完成
+            if checker.service_available:
+                responses = [checker.sidecar.submit(text) for text, _ in pending]
+                passed = [checker._service_check(text, response.result)
+                          for (text, _), response in zip(pending, responses)]
+            else:
+                passed = [checker._basic_keyword_check(text) for text, _ in pending]
+
+            # 通过前两级检查的内容合并为一次大模型调用
+            verdicts = list(passed)
+            if checker.use_llm and checker.llm_available:
+                indexes = [i for i, ok in enumerate(passed) if ok]
+                if indexes:
+                    logger.info(f"前置检查通过 {len(indexes)} 条，启动大模型批量验证...")
+                    llm_results = checker._check_with_llm_batch([pending[i][0] for i in indexes])
+                    for i, (is_clean, reason) in zip(indexes, llm_results):
+                        if not is_clean:
+                            logger.warning(f"大模型检测到不合规内容: {reason}")
+                            verdicts[i] = False
+        except Exception as e:
+            logger.exception(f"批量审核异常: {str(e)}")
+            for _, future in pending:
+                future.set_exception(e)
+            return
+
+        self.request_count += len(pending)
+        self.batch_count += 1
+        for (_, future), verdict in zip(pending, verdicts):
+            future.set_result(verdict)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_moderation_batcher(max_batch_size: int = 16, max_wait_ms: float = 50.0) -> ModerationBatcher:
+    """
+    获取批处理服务单例实例（参数仅在首次调用时生效）
+
+    参数:
+        max_batch_size: 单批次最大条数
+        max_wait_ms: 凑批的最长等待时间（毫秒）
+
+    返回:
+        ModerationBatcher: 批处理服务实例
+    """
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = ModerationBatcher(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    return _batcher
@@ -0,0 +1,79 @@
+"""
+黑名单匹配性能测试脚本
+比较逐词 `word in content` 与Aho-Corasick自动机在不同词典规模和帖子长度下的单帖检测耗时
+
+运行方式（仓库根目录）:
+    python -m backend.wordscheck.benchmark_matcher
+"""
+
+import os
+import time
+import random
+
+from .matcher import AhoCorasick
+
+
+# 词典规模：真实黑名单，以及扩充后的大词典
+DICT_SIZES = [None, 20000, 100000]
+# 帖子长度（字符）
+POST_LENGTHS = [200, 5000, 50000]
+REPEAT = 5
+
+
+def log(message):
+    """输出日志到控制台"""
+    print(message)
+
+
+def load_blacklist():
+    """读取仓库自带的黑名单"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blacklist.txt")
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f.read().splitlines() if line.strip()]
+
+
+def random_words(rng, count, alphabet):
+    """生成2~6字的随机词条"""
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(2, 6))) for _ in range(count)]
+
+
+def naive_check(words, content):
+    """原始实现：逐词子串查找，返回全部命中词条"""
+    return [word for word in words if word in content]
+
+
+def time_call(func, *args):
+    """返回平均耗时（秒）"""
+    costs = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(*args)
+        costs.append(time.perf_counter() - start)
+    return sum(costs) / len(costs)
+
+
+def main():
+    rng = random.Random(0)
+    blacklist = load_blacklist()
+    alphabet = sorted(set("".join(blacklist)))
+
+    log(f"{'词条数':>8} {'帖子长度':>8} {'编译(ms)':>9} {'逐词(ms)':>9} {'自动机(ms)':>10} {'加速比':>8}")
+    for size in DICT_SIZES:
+        words = blacklist if size is None else blacklist + random_words(rng, size - len(blacklist), alphabet)
+
+        start = time.perf_counter()
+        automaton = AhoCorasick((word, "黑名单") for word in words)
+        build_cost = time.perf_counter() - start
+
+        for length in POST_LENGTHS:
+            # 与词典同字符集的随机文本，命中率远高于真实帖子，属于较坏情况
+            content = "".join(rng.choice(alphabet) for _ in range(length))
+            cost_naive = time_call(naive_check, words, content)
+            cost_automaton = time_call(automaton.find_all, content)
+            log(f"{len(words):>8} {length:>8} {build_cost * 1000:>9.1f} "
+                f"{cost_naive * 1000:>9.2f} {cost_automaton * 1000:>10.2f} "
+                f"{cost_naive / cost_automaton:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
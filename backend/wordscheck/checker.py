@@ -1,13 +1,17 @@
-import requests
+import httpx
 import json
 import logging
 import os
-from typing import Dict, List, Tuple, Any, Optional
+from typing import Dict, List, Tuple, Any, Optional, Callable
 import time
 import asyncio
 import threading
 import re
 
+from .client import WordsCheckClient
+from .matcher import AhoCorasick, Match
+from .verdict_cache import VerdictCache, text_key
+
 # 导入OpenAI SDK，用于调用DeepSeek API
 try:
     from openai import OpenAI, AsyncOpenAI
@@ -16,9 +20,18 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# 本地词典命中的分类
+BLACKLIST_CATEGORY = "黑名单"
+BACKUP_CATEGORY = "基础关键词"
+
 
 class WordsChecker:
-    """敏感词检测服务封装"""
+    """敏感词检测服务封装
+
+    黑名单和备用关键词各自编译为一个Aho-Corasick自动机，词表与自动机成对保存、
+    整体替换，对blacklist/backup_keywords赋值或reload_blacklist时检测线程
+    总能看到一致的旧词典或新词典。
+    """
 
     def __init__(
         self,
@@ -40,9 +53,10 @@ class WordsChecker:
         self.access_token = access_token
         self.check_url = f"{base_url}/wordscheck"
         self.service_available = True
+        # 长连接池客户端，同步和异步检测共用
+        self.sidecar = WordsCheckClient(base_url, access_token)
         self._init_backup_keywords()
-        self.blacklist = []
-        self._load_blacklist()
+        self.blacklist = self._load_blacklist()
 
         # 大模型设置
         self.use_llm = use_llm
@@ -50,6 +64,8 @@ class WordsChecker:
         self.llm_client = None
         self.async_llm_client = None
         self.llm_available = False
+        # 大模型审核结果缓存，同步、异步和批量验证共用
+        self.verdict_cache = VerdictCache()
 
         # 如果提供了API密钥，初始化LLM客户端
         if self.deepseek_api_key and self.use_llm:
@@ -76,8 +92,30 @@ class WordsChecker:
             "操你", "妈的", "傻逼", "艹", "草泥马"
         ]
 
-    def _load_blacklist(self):
-        """从blacklist.txt加载黑名单"""
+    @property
+    def blacklist(self) -> List[str]:
+        """黑名单词表"""
+        return self._blacklist[0]
+
+    @blacklist.setter
+    def blacklist(self, words: List[str]):
+        # 先编译再整体替换
+        words = list(words)
+        self._blacklist = (words, AhoCorasick((word, BLACKLIST_CATEGORY) for word in words))
+
+    @property
+    def backup_keywords(self) -> List[str]:
+        """备用关键词表"""
+        return self._backup_keywords[0]
+
+    @backup_keywords.setter
+    def backup_keywords(self, words: List[str]):
+        words = list(words)
+        self._backup_keywords = (words, AhoCorasick((word, BACKUP_CATEGORY) for word in words))
+
+    def _load_blacklist(self) -> List[str]:
+        """从blacklist.txt读取黑名单，失败时返回当前词表"""
+        blacklist = self.blacklist if hasattr(self, "_blacklist") else []
         try:
             # 获取当前文件所在目录
             current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -88,12 +126,37 @@ class WordsChecker:
                     # 读取文件内容并按行分割
                     lines = f.read().splitlines()
                     # 过滤空行并去除前后空格
-                    self.blacklist = [line.strip() for line in lines if line.strip()]
-                logger.info(f"已加载黑名单词条 {len(self.blacklist)} 条")
+                    blacklist = [line.strip() for line in lines if line.strip()]
+                logger.info(f"已加载黑名单词条 {len(blacklist)} 条")
             else:
                 logger.warning(f"黑名单文件不存在: {blacklist_path}")
         except Exception as e:
             logger.error(f"加载黑名单文件失败: {str(e)}")
+        return blacklist
+
+    def find_blacklist_hits(self, content: str) -> List[Match]:
+        """
+        查找内容中的全部黑名单词汇
+
+        参数:
+            content: 文本内容
+
+        返回:
+            List[Match]: 命中列表，含词条、分类和位置
+        """
+        return self._blacklist[1].find_all(content)
+
+    def find_keyword_hits(self, content: str) -> List[Match]:
+        """
+        查找内容中的全部备用关键词
+
+        参数:
+            content: 文本内容
+
+        返回:
+            List[Match]: 命中列表，含词条、分类和位置
+        """
+        return self._backup_keywords[1].find_all(content)
 
     def _check_blacklist(self, content: str) -> bool:
         """
@@ -105,13 +168,10 @@ class WordsChecker:
         返回:
             bool: 是否通过检查 (True表示通过检查，不含黑名单词汇；False表示包含黑名单词汇)
         """
-        if not self.blacklist:
-            return True
-
-        for word in self.blacklist:
-            if word and word in content:
-                logger.warning(f"黑名单匹配到敏感词: {word}")
-                return False
+        match = self._blacklist[1].search(content)
+        if match:
+            logger.warning(f"黑名单匹配到敏感词: {match.keyword}")
+            return False
 
         return True
 
@@ -123,8 +183,7 @@ class WordsChecker:
             bool: 服务是否可用
         """
         try:
-            response = requests.get(self.base_url, timeout=2)
-            self.service_available = response.status_code == 200
+            self.service_available = self.sidecar.ping(timeout=2)
             return self.service_available
         except Exception as e:
             logger.warning(f"敏感词检测服务状态检查失败: {str(e)}")
@@ -142,10 +201,10 @@ class WordsChecker:
             bool: 内容是否合规 (True表示合规，False表示不合规)
         """
         # 检查文本是否包含敏感词
-        for word in self.backup_keywords:
-            if word in content:
-                logger.info(f"基础检测发现敏感词: {word}")
-                return False
+        match = self._backup_keywords[1].search(content)
+        if match:
+            logger.info(f"基础检测发现敏感词: {match.keyword}")
+            return False
 
         return True
 
@@ -162,6 +221,13 @@ class WordsChecker:
         if not self.llm_available or not self.llm_client:
             return True, "大模型验证未启用"
 
+        cached = self.verdict_cache.get(content)
+        if cached is not None:
+            return cached
+        return self._query_llm(content)
+
+    def _query_llm(self, content: str) -> Tuple[bool, str]:
+        """调用大模型验证单条内容并写入缓存，不查询缓存"""
         try:
             prompt = f"""请判断以下内容是否包含敏感信息，如政治敏感内容、色情内容、暴力内容、诈骗信息等。
 只需返回JSON格式结果，其中包含两个字段：
@@ -204,6 +270,7 @@ class WordsChecker:
                 reason = result_json.get("reason", "未提供理由")
 
                 logger.info(f"大模型判定结果: {is_clean}, 理由: {reason}")
+                self.verdict_cache.put(content, (is_clean, reason))
                 return is_clean, reason
 
             except json.JSONDecodeError:
@@ -222,7 +289,9 @@ class WordsChecker:
             if "Content Exists Risk" in error_str:
                 # 这种情况直接判定为不合规
                 logger.warning("DeepSeek API拒绝处理敏感内容，判定为不合规")
-                return False, "API拒绝处理敏感内容 (Content Exists Risk)"
+                verdict = (False, "API拒绝处理敏感内容 (Content Exists Risk)")
+                self.verdict_cache.put(content, verdict)
+                return verdict
             else:
                 # 其他错误保持原有逻辑
                 return True, f"大模型验证异常: {error_str}"
@@ -240,6 +309,10 @@ class WordsChecker:
         if not self.llm_available or not self.async_llm_client:
             return True, "大模型验证未启用"
 
+        cached = self.verdict_cache.get(content)
+        if cached is not None:
+            return cached
+
         try:
             prompt = f"""请判断以下内容是否包含敏感信息，如政治敏感内容、色情内容、暴力内容、诈骗信息等。
 只需返回JSON格式结果，其中包含两个字段：
@@ -282,6 +355,7 @@ class WordsChecker:
                 reason = result_json.get("reason", "未提供理由")
 
                 logger.info(f"大模型判定结果: {is_clean}, 理由: {reason}")
+                self.verdict_cache.put(content, (is_clean, reason))
                 return is_clean, reason
 
             except json.JSONDecodeError:
@@ -296,6 +370,100 @@ class WordsChecker:
             logger.error(f"大模型验证异常: {str(e)}")
             return True, f"大模型验证异常: {str(e)}"
 
+    def _check_with_llm_batch(self, contents: List[str]) -> List[Tuple[bool, str]]:
+        """
+        一次大模型调用验证多条内容，返回无法逐条解析时降级为逐条验证
+
+        参数:
+            contents: 文本内容列表
+
+        返回:
+            List[(is_clean, reason)]: 与contents一一对应
+        """
+        if not self.llm_available or not self.llm_client:
+            return [self._check_with_llm(content) for content in contents]
+
+        # 先查缓存，规范化后相同的内容只送检一次
+        results: List[Optional[Tuple[bool, str]]] = [self.verdict_cache.get(content) for content in contents]
+        pending: Dict[str, List[int]] = {}
+        for i, (content, cached) in enumerate(zip(contents, results)):
+            if cached is None:
+                # 不可缓存的文本按原文去重
+                pending.setdefault(text_key(content) or content, []).append(i)
+        if pending:
+            unique = [contents[indexes[0]] for indexes in pending.values()]
+            for indexes, verdict in zip(pending.values(), self._query_llm_batch(unique)):
+                for i in indexes:
+                    results[i] = verdict
+        return results
+
+    def _query_llm_batch(self, contents: List[str]) -> List[Tuple[bool, str]]:
+        """批量调用大模型并写入缓存，单条内容直接走逐条验证；调用方已查过缓存，这里不再查询"""
+        if len(contents) == 1:
+            return [self._query_llm(contents[0])]
+
+        try:
+            # 待检测内容以JSON数组给出，内容中的引号和换行不会打乱条目边界
+            items = json.dumps([{"id": i, "content": content} for i, content in enumerate(contents)], ensure_ascii=False)
+            prompt = f"""请逐条判断以下内容是否包含敏感信息，如政治敏感内容、色情内容、暴力内容、诈骗信息等。
+待检测内容为JSON数组，每条有id和content两个字段：
+{items}
+
+请按以下JSON格式回答，每条内容对应一个结果，不要有任何其他文字：
+[
+    {{"id": 0, "is_clean": true/false, "reason": "理由说明"}}
+]
+"""
+
+            response = self.llm_client.chat.completions.create(
+                model="deepseek-chat",
+                messages=[
+                    {"role": "system", "content": "你是一个敏感内容审核专家，负责判断文本是否包含不良信息。"},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.1,
+                max_tokens=100 + 80 * len(contents)
+            )
+
+            result_text = response.choices[0].message.content.strip()
+            verdicts = self._parse_batch_verdicts(result_text, len(contents))
+            if verdicts is not None:
+                logger.info(f"大模型批量判定 {len(contents)} 条内容")
+                for content, verdict in zip(contents, verdicts):
+                    self.verdict_cache.put(content, verdict)
+                return verdicts
+            logger.warning(f"无法解析大模型返回的批量结果，改为逐条验证: {result_text}")
+
+        except Exception as e:
+            # 包括整批被拒绝（Content Exists Risk）的情况，逐条验证以定位具体内容
+            logger.warning(f"大模型批量验证异常，改为逐条验证: {str(e)}")
+
+        return [self._query_llm(content) for content in contents]
+
+    @staticmethod
+    def _parse_batch_verdicts(result_text: str, count: int) -> Optional[List[Tuple[bool, str]]]:
+        """解析批量判定结果，缺条目、重复或字段类型不符时返回None"""
+        try:
+            # 提取JSON数组部分（防止模型输出额外文本）
+            json_match = re.search(r'(\[.*\])', result_text, re.DOTALL)
+            result_json = json.loads(json_match.group(1) if json_match else result_text)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(result_json, list):
+            return None
+
+        verdicts: Dict[int, Tuple[bool, str]] = {}
+        for item in result_json:
+            if not isinstance(item, dict) or not isinstance(item.get("is_clean"), bool):
+                return None
+            index = item.get("id")
+            if not isinstance(index, int) or not 0 <= index < count or index in verdicts:
+                return None
+            verdicts[index] = (item["is_clean"], item.get("reason", "未提供理由"))
+        if len(verdicts) != count:
+            return None
+        return [verdicts[i] for i in range(count)]
+
     def _extract_text_content(self, content: str) -> str:
         """
         从内容中提取纯文本部分，跳过图像内容
@@ -347,80 +515,99 @@ class WordsChecker:
         clean_content = clean_content.strip()
         return len(clean_content) == 0
 
-    def check_content(self, content: str, img_lst=None) -> bool:
+    def _precheck(self, content: str) -> Tuple[Optional[bool], str]:
         """
-        检查内容是否合规，与topic.py的check_func接口兼容
-        
+        图片与黑名单预检查
+
         参数:
-            content: 文本内容
-            img_lst: 图片列表 (直接跳过图片内容)
-        
+            content: 原始内容
+
         返回:
-            bool: 内容是否合规 (True表示合规，False表示不合规)
+            (verdict, text_content): 预检查已能得出结论时verdict为结果，否则为None；
+                text_content为跳过图像后的纯文本
         """
         # 判断是否只包含图片
         if self._is_image_only_content(content):
             logger.info("内容仅包含图片，跳过文本检测")
-            return True
+            return True, content
         
         # 提取纯文本内容，跳过图像
         text_content = self._extract_text_content(content)
         logger.info(f"提取到纯文本内容进行检查，跳过图像内容")
         
-        # 以下保持原有检查逻辑，但使用提取后的文本内容
         if not self._check_blacklist(text_content):
             logger.info("内容包含黑名单词汇，直接判定为不合规")
-            return False
-        
-        # 如果敏感词服务可用，尝试调用
-        service_check_passed = True
-        if self.service_available:
-            try:
-                data = json.dumps({"content": text_content})
+            return False, text_content
+        return None, text_content
 
-                headers = {
-                    "Content-Type": "application/json",
-                }
+    def _service_check(self, text_content: str, get_response: Callable[[], Any]) -> bool:
+        """
+        根据敏感词服务的响应判定内容，服务异常时降级为基础关键词检测
 
-                if self.access_token:
-                    headers["Authorization"] = f"Bearer {self.access_token}"
+        参数:
+            text_content: 纯文本内容
+            get_response: 返回服务响应的调用，如同步请求或已提交请求的Future.result
 
-                # 发送请求
-                response = requests.post(self.check_url, data=data, headers=headers, timeout=3)
+        返回:
+            bool: 是否通过检查
+        """
+        try:
+            response = get_response()
 
-                # 检查响应状态
-                if response.status_code != 200:
-                    logger.error(f"敏感词检测服务请求失败: {response.status_code}")
-                    service_check_passed = self._basic_keyword_check(text_content)
-                else:
-                    # 解析结果
-                    result = response.json()
-
-                    if result.get("code") != "0":
-                        logger.error(f"敏感词检测服务返回错误: {result.get('msg')}")
-                        service_check_passed = self._basic_keyword_check(text_content)
-                    else:
-                        # 检查是否有敏感词
-                        word_list = result.get("word_list", [])
-                        service_check_passed = len(word_list) == 0
-
-                        # 记录检测结果
-                        if not service_check_passed:
-                            categories = set()
-                            for word in word_list:
-                                if "category" in word and "keyword" in word:
-                                    categories.add(f"{word['category']}({word['keyword']})")
-
-                            logger.warning(f"检测到敏感内容: {', '.join(categories)}")
-
-            except requests.exceptions.RequestException:
-                # 连接问题，标记服务不可用
-                self.service_available = False
-                logger.error("敏感词检测服务连接失败，切换到基础检测")
-                service_check_passed = self._basic_keyword_check(text_content)
-            except Exception as e:
-                logger.exception(f"敏感词检测异常: {str(e)}")
-                service_check_passed = self._basic_keyword_check(text_content)
+            # 检查响应状态
+            if response.status_code != 200:
+                logger.error(f"敏感词检测服务请求失败: {response.status_code}")
+                return self._basic_keyword_check(text_content)
+
+            # 解析结果
+            result = response.json()
+
+            if result.get("code") != "0":
+                logger.error(f"敏感词检测服务返回错误: {result.get('msg')}")
+                return self._basic_keyword_check(text_content)
+
+            # 检查是否有敏感词
+            word_list = result.get("word_list", [])
+            service_check_passed = len(word_list) == 0
+
+            # 记录检测结果
+            if not service_check_passed:
+                categories = set()
+                for word in word_list:
+                    if "category" in word and "keyword" in word:
+                        categories.add(f"{word['category']}({word['keyword']})")
+
+                logger.warning(f"检测到敏感内容: {', '.join(categories)}")
+            return service_check_passed
+
+        except httpx.TransportError:
+            # 连接问题，标记服务不可用
+            self.service_available = False
+            logger.error("敏感词检测服务连接失败，切换到基础检测")
+            return self._basic_keyword_check(text_content)
+        except Exception as e:
+            logger.exception(f"敏感词检测异常: {str(e)}")
+            return self._basic_keyword_check(text_content)
+
+    def check_content(self, content: str, img_lst=None) -> bool:
+        """
+        检查内容是否合规，与topic.py的check_func接口兼容
+        
+        参数:
+            content: 文本内容
+            img_lst: 图片列表 (直接跳过图片内容)
+        
+        返回:
+            bool: 内容是否合规 (True表示合规，False表示不合规)
+        """
+        verdict, text_content = self._precheck(content)
+        if verdict is not None:
+            return verdict
+        
+        # 如果敏感词服务可用，尝试调用
+        if self.service_available:
+            # 发送请求，复用连接池中的长连接
+            service_check_passed = self._service_check(text_content, lambda: self.sidecar.check(text_content))
         else:
             # 敏感词服务不可用时，使用基础关键词检测
             service_check_passed = self._basic_keyword_check(text_content)
@@ -455,22 +642,13 @@ class WordsChecker:
             return True, content, []
         
         # 首先进行黑名单检查
-        if not self._check_blacklist(content):
+        hits = self.find_blacklist_hits(content)
+        if hits:
             logger.info("内容包含黑名单词汇，直接判定为不合规")
-            return False, content, [{"keyword": "黑名单敏感词", "category": "黑名单", "position": "0-0", "level": "高"}]
+            return False, content, [dict(hit.to_dict(), level="高") for hit in hits]
 
         try:
-            data = json.dumps({"content": content})
-
-            headers = {
-                "Content-Type": "application/json",
-            }
-
-            if self.access_token:
-                headers["Authorization"] = f"Bearer {self.access_token}"
-
-            # 使用requests进行同步请求（在实际使用时建议用aiohttp进行异步请求）
-            response = requests.post(self.check_url, data=data, headers=headers)
+            response = await self.sidecar.check_async(content)
 
             if response.status_code != 200:
                 logger.error(f"敏感词检测服务请求失败: {response.status_code}")
@@ -538,9 +716,8 @@ class WordsChecker:
         return list(categories)
 
     def reload_blacklist(self):
-        """重新加载黑名单"""
-        self.blacklist = []
-        self._load_blacklist()
+        """重新加载黑名单，新自动机编译完成后才替换，加载期间检测照常使用旧词典"""
+        self.blacklist = self._load_blacklist()
         return len(self.blacklist)
 
     def set_llm_api_key(self, api_key: str):
@@ -0,0 +1,130 @@
+"""
+敏感词检测服务客户端
+
+基于httpx.AsyncClient的长连接池，运行在专用的事件循环线程中：
+异步调用方通过check_async等待，同步调用方通过check阻塞等待，
+两者共享同一个连接池和并发上限，不再为每次检测建立新的TCP连接。
+"""
+
+import json
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class WordsCheckClient:
+    """敏感词检测服务的连接池客户端"""
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8080",
+        access_token: str = "",
+        timeout: float = 3.0,
+        connect_timeout: float = 1.0,
+        pool_timeout: float = 10.0,
+        max_connections: int = 64,
+        max_keepalive_connections: int = 16,
+    ):
+        """
+        初始化客户端（连接在首次请求时建立）
+
+        参数:
+            base_url: 敏感词检测服务地址
+            access_token: 接口认证token
+            timeout: 单次请求的读写超时（秒）
+            connect_timeout: 建立连接的超时（秒）
+            pool_timeout: 连接全部占用时排队等待空闲连接的超时（秒）
+            max_connections: 最大并发连接数，超出的请求排队等待空闲连接
+            max_keepalive_connections: 保持长连接的最大空闲连接数
+        """
+        self.base_url = base_url
+        self.check_url = f"{base_url}/wordscheck"
+        self.headers = {"Content-Type": "application/json"}
+        if access_token:
+            self.headers["Authorization"] = f"Bearer {access_token}"
+
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout, pool=pool_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """启动事件循环线程并在其中创建连接池（已启动时直接返回）"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="wordscheck-client", daemon=True)
+                thread.start()
+
+                async def create_client():
+                    return httpx.AsyncClient(timeout=self.timeout, limits=self.limits, headers=self.headers)
+
+                self._client = asyncio.run_coroutine_threadsafe(create_client(), loop).result()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    async def _post(self, content: str) -> httpx.Response:
+        return await self._client.post(self.check_url, content=json.dumps({"content": content}))
+
+    def submit(self, content: str) -> "Future[httpx.Response]":
+        """
+        提交检测请求，立即返回Future
+
+        参数:
+            content: 待检测文本
+
+        返回:
+            Future: 结果为服务响应；连接失败或超时时为httpx.TransportError
+        """
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._post(content), loop)
+
+    def check(self, content: str) -> httpx.Response:
+        """同步检测，供线程中的调用方使用"""
+        return self.submit(content).result()
+
+    async def check_async(self, content: str) -> httpx.Response:
+        """异步检测，等待期间不阻塞调用方的事件循环"""
+        return await asyncio.wrap_future(self.submit(content))
+
+    def ping(self, timeout: float = 2.0) -> bool:
+        """
+        检查服务是否可用
+
+        返回:
+            bool: 服务根路径是否返回200
+        """
+        loop = self._ensure_started()
+
+        async def get():
+            return await self._client.get(self.base_url, timeout=timeout)
+
+        response = asyncio.run_coroutine_threadsafe(get(), loop).result()
+        return response.status_code == 200
+
+    def close(self) -> None:
+        """关闭连接池并停止事件循环线程"""
+        with self._lock:
+            loop, thread, client = self._loop, self._thread, self._client
+            self._loop = self._thread = self._client = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=5)
+        except Exception as e:
+            logger.warning(f"关闭敏感词检测服务连接池失败: {str(e)}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
@@ -0,0 +1,125 @@
+"""
+Aho-Corasick多模式匹配
+
+词典编译为带失败指针的字典树，一次扫描文本即可找出所有词条的全部出现位置，
+耗时与文本长度和命中数成正比，与词典大小无关。
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class Match(NamedTuple):
+    """一次命中"""
+    keyword: str
+    category: str
+    start: int  # 起始下标
+    end: int    # 结束下标（不含）
+
+    @property
+    def position(self) -> str:
+        """与敏感词服务一致的位置格式，首尾下标均包含在内，如3-4"""
+        return f"{self.start}-{self.end - 1}"
+
+    def to_dict(self) -> Dict[str, str]:
+        """转换为敏感词服务word_list中的条目格式"""
+        return {"keyword": self.keyword, "category": self.category, "position": self.position}
+
+
+class AhoCorasick:
+    """编译后只读的Aho-Corasick自动机，可在多线程间共享"""
+
+    def __init__(self, words: Iterable[Tuple[str, str]]):
+        """
+        编译词典
+
+        参数:
+            words: (词条, 分类) 序列，空词条被忽略，重复词条保留首次出现的分类
+        """
+        # 每个节点一个转移表；outputs[i]为在节点i结束的所有词条（含经失败指针可达的后缀词条）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[Tuple[int, ...]] = [()]
+        self._keywords: List[Tuple[str, str]] = []
+
+        seen = set()
+        for word, category in words:
+            if not word or word in seen:
+                continue
+            seen.add(word)
+            self._insert(word, len(self._keywords))
+            self._keywords.append((word, category))
+
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self._keywords)
+
+    def _insert(self, word: str, index: int) -> None:
+        node = 0
+        for char in word:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append(())
+            node = next_node
+        self._outputs[node] = (index,)
+
+    def _build(self) -> None:
+        """按层序计算失败指针，并把后缀词条合并到各节点的输出中"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                if self._outputs[self._fail[child]]:
+                    self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+
+    def _scan(self, text: str):
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if outputs[node]:
+                yield position, outputs[node]
+
+    def find_all(self, text: str) -> List[Match]:
+        """
+        查找所有命中（包括相互重叠的词条）
+
+        参数:
+            text: 待检测文本
+
+        返回:
+            List[Match]: 按结束位置排序的命中列表
+        """
+        matches = []
+        for position, indexes in self._scan(text):
+            for index in indexes:
+                keyword, category = self._keywords[index]
+                matches.append(Match(keyword, category, position + 1 - len(keyword), position + 1))
+        return matches
+
+    def search(self, text: str) -> Optional[Match]:
+        """
+        查找第一个命中，找到即停止扫描
+
+        参数:
+            text: 待检测文本
+
+        返回:
+            Optional[Match]: 最先结束的命中，无命中时为None
+        """
+        for position, indexes in self._scan(text):
+            keyword, category = self._keywords[indexes[0]]
+            return Match(keyword, category, position + 1 - len(keyword), position + 1)
+        return None
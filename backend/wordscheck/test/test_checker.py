@@ -2,8 +2,13 @@
 import sys
 import os
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+import asyncio
 import logging
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
 # 配置日志级别，减少不必要的输出
 logging.basicConfig(level=logging.INFO, 
@@ -12,6 +17,11 @@ logging.basicConfig(level=logging.INFO,
 # 导入WordsChecker
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")))
 from backend.wordscheck.checker import WordsChecker
+from backend.wordscheck.batcher import ModerationBatcher
+
+# 敏感词服务请求的替换目标
+SIDECAR_CHECK = 'backend.wordscheck.client.WordsCheckClient.check'
+SIDECAR_CHECK_ASYNC = 'backend.wordscheck.client.WordsCheckClient.check_async'
 
 class TestTextFilter(unittest.TestCase):
     """测试文本过滤的三级过滤机制"""
@@ -46,7 +56,7 @@ class TestTextFilter(unittest.TestCase):
                 result = self.checker.check_content(content)
                 self.assertTrue(result, "正常内容被错误拦截")
     
-    @patch('requests.post')
+    @patch(SIDECAR_CHECK)
     def test_local_service_filter(self, mock_post):
         """测试第二级过滤：本地敏感词服务"""
         # 模拟本地服务响应 - 检测到敏感词
@@ -76,7 +86,7 @@ class TestTextFilter(unittest.TestCase):
             result = self.checker.check_content(content)
             self.assertTrue(result, "正常内容被本地服务错误拦截")
     
-    @patch('requests.post')
+    @patch(SIDECAR_CHECK)
     def test_deepseek_filter(self, mock_post):
         """测试第三级过滤：DeepSeek大模型验证"""
         # 模拟本地服务响应 - 未检测到敏感词
@@ -101,7 +111,7 @@ class TestTextFilter(unittest.TestCase):
             result = self.checker.check_content(content)
             self.assertTrue(result, "正常内容被大模型错误拦截")
     
-    @patch('requests.post')
+    @patch(SIDECAR_CHECK)
     def test_service_fallback(self, mock_post):
         """测试服务不可用时的降级策略"""
         # 模拟本地服务不可用
@@ -129,7 +139,7 @@ class TestTextFilter(unittest.TestCase):
             with self.subTest(case=case["description"]):
                 # 对于正常内容，模拟本地服务和大模型都通过
                 if case["expected"]:
-                    with patch('requests.post') as mock_post:
+                    with patch(SIDECAR_CHECK) as mock_post:
                         mock_response = MagicMock()
                         mock_response.status_code = 200
                         mock_response.json.return_value = {
@@ -147,12 +157,48 @@ class TestTextFilter(unittest.TestCase):
                     self.assertEqual(result, case["expected"], 
                                     f"{case['description']} 测试失败")
 
+    def test_blacklist_hits(self):
+        """测试黑名单命中的位置、分类以及重叠词条"""
+        self.checker.blacklist = ["违禁", "违禁品", "禁品"]
+        hits = self.checker.find_blacklist_hits("出售违禁品，违禁")
+        self.assertEqual(
+            [(hit.keyword, hit.position) for hit in hits],
+            [("违禁", "2-3"), ("违禁品", "2-4"), ("禁品", "3-4"), ("违禁", "6-7")]
+        )
+        self.assertTrue(all(hit.category == "黑名单" for hit in hits))
+        self.assertEqual([hit.keyword for hit in self.checker.find_keyword_hits("有点负面")], ["负面"])
+    
+    def test_llm_verdict_cache(self):
+        """测试大模型结果缓存：规范化后相同的文本不再请求，同步与异步共用"""
+        response = MagicMock()
+        response.choices[0].message.content = '{"is_clean": false, "reason": "刷屏"}'
+        self.checker.llm_client = MagicMock()
+        self.checker.llm_client.chat.completions.create.return_value = response
+        self.checker.async_llm_client = MagicMock()
+
+        self.assertEqual(self.checker._check_with_llm("加我ＶＸ领红包！"), (False, "刷屏"))
+        self.assertEqual(self.checker._check_with_llm("加我 vx 领红包!!"), (False, "刷屏"))
+        verdict = asyncio.run(self.checker._check_with_llm_async("加我Vx，领红包"))
+        self.assertEqual(verdict, (False, "刷屏"))
+        self.assertEqual(self.checker.llm_client.chat.completions.create.call_count, 1)
+        self.assertEqual((self.checker.verdict_cache.hits, self.checker.verdict_cache.misses), (2, 1))
+
+        # 批量验证中未命中的单条内容只查询一次缓存
+        self.checker._check_with_llm_batch(["今天天气不错"])
+        self.assertEqual(self.checker.verdict_cache.misses, 2)
+
+        # 只有标点和空白的文本规范化后为空，不缓存
+        self.checker._check_with_llm("！！！")
+        self.checker._check_with_llm("？？")
+        self.assertEqual(self.checker.llm_client.chat.completions.create.call_count, 4)
+        self.assertEqual(self.checker.verdict_cache.misses, 2)
+    
     def test_async_text_check(self):
         """测试异步文本检查功能"""
         # 由于异步测试需要特殊处理，这里只进行简单的接口测试
         async def run_async_test():
             # 模拟本地服务
-            with patch('requests.post') as mock_post:
+            with patch(SIDECAR_CHECK_ASYNC, new_callable=AsyncMock) as mock_post:
                 mock_response = MagicMock()
                 mock_response.status_code = 200
                 mock_response.json.return_value = {
@@ -174,6 +220,92 @@ class TestTextFilter(unittest.TestCase):
         self.assertTrue(result, "异步检查功能测试失败")
 
 
+class StubSidecarHandler(BaseHTTPRequestHandler):
+    """本地敏感词服务桩：内容包含“坏”时返回一个敏感词"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        content = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["content"]
+        word_list = [{"keyword": "坏", "category": "谩骂", "position": "0-0"}] if "坏" in content else []
+        body = json.dumps({"code": "0", "msg": "检测成功", "word_list": word_list}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestModerationBatcher(unittest.TestCase):
+    """测试批量审核：敏感词服务并行请求，大模型一次调用判定整批"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubSidecarHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.checker = WordsChecker(
+            base_url=f"http://127.0.0.1:{self.server.server_port}",
+            use_llm=True,
+            deepseek_api_key="sk-test"
+        )
+        self.checker.blacklist = ["违禁"]
+        self.checker.llm_client = MagicMock()
+        self.batcher = ModerationBatcher(self.checker, max_wait_ms=200)
+
+    def tearDown(self):
+        self.batcher.stop()
+        self.checker.sidecar.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _llm_reply(self, text):
+        response = MagicMock()
+        response.choices[0].message.content = text
+        return response
+
+    def test_batch_verdicts(self):
+        """黑名单、服务和大模型三级结果按条目对应"""
+        self.checker.llm_client.chat.completions.create.return_value = self._llm_reply(
+            '[{"id": 0, "is_clean": true, "reason": "正常"}, {"id": 1, "is_clean": false, "reason": "诈骗"}]'
+        )
+        contents = ["出售违禁品", "这是坏人", "今天天气不错", "加我领红包"]
+        futures = [self.batcher.submit(content) for content in contents]
+        self.assertEqual([future.result(timeout=10) for future in futures], [False, False, True, False])
+        # 只有通过前两级的两条进入一次大模型调用
+        self.assertEqual(self.checker.llm_client.chat.completions.create.call_count, 1)
+        self.assertEqual(self.batcher.batch_count, 1)
+
+    def test_parse_failure_fallback(self):
+        """批量结果无法解析时逐条验证"""
+        self.checker.llm_client.chat.completions.create.return_value = self._llm_reply("无法判断")
+        with patch.object(self.checker, '_query_llm', side_effect=[(True, "正常"), (False, "诈骗")]) as mock_llm:
+            futures = [self.batcher.submit(content) for content in ["今天天气不错", "加我领红包"]]
+            self.assertEqual([future.result(timeout=10) for future in futures], [True, False])
+            self.assertEqual(mock_llm.call_count, 2)
+
+    def test_dispatch_failure_fails_batch(self):
+        """批次无法提交给处理线程时整批以异常结束"""
+        self.batcher.start()
+        with patch.object(self.batcher._workers, 'submit', side_effect=RuntimeError("线程池已关闭")):
+            futures = [self.batcher.submit(content) for content in ["今天天气不错", "加我领红包"]]
+            for future in futures:
+                with self.assertRaises(RuntimeError):
+                    future.result(timeout=10)
+
+    def test_check_timeout(self):
+        """同步审核超时抛出TimeoutError"""
+        with patch.object(self.checker, '_precheck', side_effect=lambda content: time.sleep(1) or (True, content)):
+            with self.assertRaises(TimeoutError):
+                self.batcher.check("今天天气不错", timeout=0.1)
+
+    def test_restart_after_stop(self):
+        """停止后再次提交时重建线程池"""
+        self.assertFalse(self.batcher.submit("出售违禁品").result(timeout=10))
+        self.batcher.stop()
+        self.assertFalse(self.batcher.submit("出售违禁品").result(timeout=10))
+
+
 if __name__ == "__main__":
     print("\n===== 开始测试文本过滤的三级过滤机制 =====\n")
     unittest.main(verbosity=2)
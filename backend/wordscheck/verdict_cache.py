@@ -0,0 +1,109 @@
+"""
+大模型审核结果缓存
+
+以规范化文本的摘要为键：全角转半角、忽略大小写、去掉空白和标点，
+复制粘贴的回复、“+1”刷屏和只改了标点的变体都会命中同一条结果。
+缓存条目超过有效期或总数超过上限时淘汰最久未使用的条目。
+"""
+
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """
+    规范化文本
+
+    参数:
+        text: 原始文本
+
+    返回:
+        str: NFKC规范化（全角转半角）并小写后，去掉所有空白和标点的文本
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return "".join(
+        char for char in text
+        if not char.isspace() and not unicodedata.category(char).startswith("P")
+    )
+
+
+def text_key(text: str) -> Optional[str]:
+    """规范化文本的摘要；规范化后为空（只有空白和标点）的文本不缓存，返回None"""
+    normalized = normalize_text(text)
+    if not normalized:
+        return None
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """线程安全的审核结果缓存，同步与异步检测路径共用"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600.0):
+        """
+        初始化缓存
+
+        参数:
+            max_size: 最大条目数
+            ttl: 条目有效期（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Tuple[bool, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, text: str) -> Optional[Tuple[bool, str]]:
+        """
+        查询缓存
+
+        参数:
+            text: 待检测文本
+
+        返回:
+            Optional[(is_clean, reason)]: 未命中、已过期或文本不可缓存时为None
+        """
+        key = text_key(text)
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, text: str, verdict: Tuple[bool, str]) -> None:
+        """
+        写入审核结果
+
+        参数:
+            text: 待检测文本
+            verdict: (is_clean, reason)
+        """
+        key = text_key(text)
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, verdict)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
@@ -6,11 +6,26 @@ import { createPinia } from 'pinia'
 import App from './App.vue'
 import router from './router'
 import axios from 'axios'
+import { useUserStore } from './stores/user'
 import '@toast-ui/editor/dist/toastui-editor.css'
 
 
 axios.defaults.baseURL = 'http://127.0.0.1:8000'
 
+// 身份变更后旧的 access token 会失效，收到 401 时刷新一次 token 并重试原请求
+axios.interceptors.response.use(undefined, async (error) => {
+    const request = error.config
+    const userStore = useUserStore()
+    if (error.response?.status === 401 && request && !request._retried
+        && !request.url.includes('/api/token/refresh/') && userStore.user.refresh) {
+        request._retried = true
+        await userStore.refreshToken()
+        request.headers['Authorization'] = axios.defaults.headers.common['Authorization']
+        return axios(request)
+    }
+    return Promise.reject(error)
+})
+
 const app = createApp(App)
 
 app.use(createPinia())
@@ -94,10 +94,10 @@ export const useUserStore = defineStore({
             if (!refreshToken) {
                 console.error("Refresh token is missing or undefined");
                 this.removeToken(); // 清除无效的 token
-                return;
+                return Promise.resolve();
             }
 
-            axios.post('/api/token/refresh/', { refresh: refreshToken })
+            return axios.post('/api/token/refresh/', { refresh: refreshToken })
                 .then((response) => {
                     this.user.access = response.data.access;
                     localStorage.setItem('user.access', response.data.access);